@@ -1,13 +1,30 @@
-from typing import List
+from typing import Any, Dict, List, Tuple
 from langchain_core.tools import BaseTool
-from langgraph.prebuilt import create_react_agent
+from langgraph.prebuilt import ToolNode, create_react_agent
 from agents.config import RESEARCH_AGENT_INSTRUCTIONS
 
+_agent_cache: Dict[Tuple[int, ...], Any] = {}
+
+def _tool_error_message(error: Exception) -> str:
+    return f"Error: {str(error) or type(error).__name__}"
+
 def create_research_agent(tools: List[BaseTool], llm):
+    # The compiled graph holds no per-conversation state, so one instance per
+    # (llm, tool set) is shared by every session. Cached entries keep their llm
+    # and tools alive, which keeps the id()-based key unique.
+    key = (id(llm), *(id(tool) for tool in tools))
+    if key in _agent_cache:
+        return _agent_cache[key]
+    
+    # ToolNode runs all tool calls of one model turn concurrently; each call
+    # is bounded by its server's pool (see mcp_client/client.py). Failures and
+    # timeouts come back as error messages for that call only, so one slow
+    # server does not fail the calls that already succeeded.
     agent = create_react_agent(
         llm,
-        tools,
+        ToolNode(tools, handle_tool_errors=_tool_error_message),
         prompt=RESEARCH_AGENT_INSTRUCTIONS
     )
+    _agent_cache[key] = agent
     
     return agent
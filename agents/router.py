@@ -0,0 +1,188 @@
+import os
+import re
+from typing import Any, Dict, Optional, Tuple
+
+from utils.metrics import METRICS
+
+# The fast tier is only used when a model is configured for it.
+LLM_FAST_MODEL = os.getenv("LLM_FAST_MODEL", "")
+LLM_FAST_TEMPERATURE = float(os.getenv("LLM_FAST_TEMPERATURE", "0.3"))
+# Tool rounds the fast model may use before the turn is escalated.
+LLM_FAST_MAX_TOOL_ROUNDS = int(os.getenv("LLM_FAST_MAX_TOOL_ROUNDS", "2"))
+LLM_FAST_MAX_WORDS = int(os.getenv("LLM_FAST_MAX_WORDS", "20"))
+LLM_FULL_TEMPERATURE = float(os.getenv("LLM_FULL_TEMPERATURE", "0.7"))
+# Blended USD per million tokens, only used to report the cost saved.
+LLM_FAST_COST_PER_MTOK = float(os.getenv("LLM_FAST_COST_PER_MTOK", "0"))
+LLM_FULL_COST_PER_MTOK = float(os.getenv("LLM_FULL_COST_PER_MTOK", "0"))
+
+SIMPLE_PATTERNS = [
+    ("conversion", re.compile(r"\bconvert\b|\b\d[\d.,]*\s*[a-z/]+\s+(?:to|in|into)\s+[a-z/]+\b", re.IGNORECASE)),
+    ("arithmetic", re.compile(r"^\s*(?:what\s+is\s+|calculate\s+|compute\s+)?[\d\s.,+\-*/^()%]+\??\s*$", re.IGNORECASE)),
+    ("list_spaces", re.compile(r"\b(?:list|show|which|what)\b.*\bspaces?\b", re.IGNORECASE)),
+    # Any page-ID shape (SPACE-123), not just the mock corpus's spaces.
+    ("page_lookup", re.compile(r"\b[a-z]+-\d+\b", re.IGNORECASE)),
+    ("date", re.compile(r"\b(?:days?|weeks?|months?)\s+(?:between|until|since|from)\b", re.IGNORECASE)),
+    ("small_talk", re.compile(r"^\s*(?:hi|hello|hey|thanks|thank you|ok|okay|cool|great)\b[\s!.]*$", re.IGNORECASE)),
+]
+COMPLEX_CUES = re.compile(
+    r"\b(?:compare|comparison|versus|vs\.?|analy[sz]e|analysis|why|explain|summari[sz]e|report|trend|"
+    r"growth|forecast|recommend|strategy|plan|pros|cons|impact|evaluate|assess|breakdown)\b",
+    re.IGNORECASE
+)
+UNABLE_ANSWER = re.compile(
+    r"\b(?:I\s+(?:can(?:no|')t|am\s+unable|'m\s+unable|do\s+not\s+have|don't\s+have)|"
+    r"unable\s+to\s+(?:find|answer|determine)|need\s+more\s+(?:information|tools))\b",
+    re.IGNORECASE
+)
+MIN_ANSWER_CHARS = 20
+# What create_react_agent answers instead of calling the model again once
+# the recursion limit is about to be hit.
+STEPS_EXHAUSTED = "need more steps to process this request"
+
+
+class Tier:
+    """One model tier of the cascade."""
+    
+    def __init__(
+        self,
+        name: str,
+        model: Optional[str],
+        temperature: float,
+        cost_per_mtok: float,
+        max_tool_rounds: int = 0
+    ):
+        self.name = name
+        self.model = model
+        self.temperature = temperature
+        self.cost_per_mtok = cost_per_mtok
+        self.max_tool_rounds = max_tool_rounds
+    
+    def run_config(self) -> Dict[str, Any]:
+        """LangGraph config for an agent run on this tier."""
+        if not self.max_tool_rounds:
+            return {}
+        # The first model call plus a tools and a model step per round.
+        return {"recursion_limit": 2 * self.max_tool_rounds + 2}
+
+
+FULL = Tier("full", None, LLM_FULL_TEMPERATURE, LLM_FULL_COST_PER_MTOK)
+FAST = Tier("fast", LLM_FAST_MODEL or None, LLM_FAST_TEMPERATURE, LLM_FAST_COST_PER_MTOK, LLM_FAST_MAX_TOOL_ROUNDS)
+
+
+def classify(question: str, has_history: bool) -> Tuple[Tier, str]:
+    """
+    Pick the tier for a turn from cheap heuristics.
+    
+    Conversions, arithmetic, space listings, page lookups, date arithmetic and
+    small talk go to the fast tier, as do short questions without analysis
+    cues (compare, explain, trend, ...). Everything else, and every turn when
+    no fast model is configured, goes to the full model.
+    
+    Returns:
+        The tier and the reason for the choice
+    """
+    if not FAST.model:
+        return FULL, "no_fast_model"
+    if COMPLEX_CUES.search(question):
+        return FULL, "complex"
+    for name, pattern in SIMPLE_PATTERNS:
+        if pattern.search(question):
+            return FAST, name
+    words = len(question.split())
+    if words > LLM_FAST_MAX_WORDS or question.count("?") > 1:
+        return FULL, "long"
+    if has_history and words < 4:
+        # Terse follow-ups lean on the conversation.
+        return FULL, "follow_up"
+    return FAST, "short"
+
+def validate_answer(answer: str, progress: Dict[str, Any]) -> Optional[str]:
+    """Why a fast-tier answer should be escalated, or None if it stands."""
+    if STEPS_EXHAUSTED in answer:
+        return "more_tools"
+    if len(answer.strip()) < MIN_ANSWER_CHARS:
+        return "empty_answer"
+    if UNABLE_ANSWER.search(answer):
+        return "unable"
+    if progress.get("tool_errors"):
+        return "tool_errors"
+    return None
+
+
+class RouterStats:
+    """
+    Routing decisions and what the fast tier saved.
+    
+    Latency saved is measured against the running average of full-tier turns
+    and cost saved against the full tier's price for the same tokens; an
+    escalated turn counts the fast attempt as overhead instead.
+    """
+    
+    def __init__(self):
+        self.turns: Dict[str, int] = {"fast": 0, "full": 0}
+        self.tokens: Dict[str, int] = {"fast": 0, "full": 0}
+        self.escalations = 0
+        self.reasons: Dict[str, int] = {}
+        self.full_turn_ms = 0.0
+        self.latency_saved_ms = 0.0
+        self.cost_saved_usd = 0.0
+        self.escalation_overhead_ms = 0.0
+    
+    def record(
+        self,
+        tier: Tier,
+        reason: str,
+        duration_ms: float,
+        tokens: int,
+        escalated_from: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Record an answered turn; returns the routing metadata for the message.
+        
+        ``tokens`` are those of the run on ``tier`` only; an escalated turn
+        passes the fast attempt's usage in ``escalated_from``.
+        """
+        self.turns[tier.name] += 1
+        self.tokens[tier.name] += tokens
+        self.reasons[reason] = self.reasons.get(reason, 0) + 1
+        METRICS.count("chatbot_route_turns_total", tier=tier.name, reason=reason)
+        METRICS.observe("chatbot_route_turn_ms", duration_ms, tier=tier.name)
+        route: Dict[str, Any] = {"tier": tier.name, "model": tier.model, "reason": reason}
+        
+        if tier is FULL:
+            runs = self.turns["full"]
+            self.full_turn_ms += (duration_ms - self.full_turn_ms) / runs
+        elif self.turns["full"]:
+            saved_ms = max(0.0, self.full_turn_ms - duration_ms)
+            saved_usd = tokens * (FULL.cost_per_mtok - FAST.cost_per_mtok) / 1_000_000
+            self.latency_saved_ms += saved_ms
+            self.cost_saved_usd += saved_usd
+            METRICS.count("chatbot_route_latency_saved_ms_total", saved_ms)
+            if saved_usd > 0:
+                METRICS.count("chatbot_route_cost_saved_usd_total", saved_usd)
+            route.update(latency_saved_ms=round(saved_ms, 1), cost_saved_usd=round(saved_usd, 6))
+        
+        if escalated_from is not None:
+            self.escalations += 1
+            self.tokens["fast"] += escalated_from["tokens"]
+            self.escalation_overhead_ms += escalated_from["duration_ms"]
+            wasted_usd = escalated_from["tokens"] * FAST.cost_per_mtok / 1_000_000
+            self.cost_saved_usd -= wasted_usd
+            METRICS.count("chatbot_route_escalations_total", reason=escalated_from["reason"])
+            METRICS.count("chatbot_route_escalation_overhead_ms_total", escalated_from["duration_ms"])
+            route["escalated_from"] = escalated_from
+        return route
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "turns": dict(self.turns),
+            "tokens": dict(self.tokens),
+            "escalations": self.escalations,
+            "reasons": dict(self.reasons),
+            "full_turn_ms": round(self.full_turn_ms, 1),
+            "latency_saved_ms": round(self.latency_saved_ms, 1),
+            "escalation_overhead_ms": round(self.escalation_overhead_ms, 1),
+            "cost_saved_usd": round(self.cost_saved_usd, 6),
+        }
+
+
+ROUTER_STATS = RouterStats()
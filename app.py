@@ -1,39 +1,310 @@
+import os
+import math
+import time
 import asyncio
-from typing import List, Optional
+import logging
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
 import chainlit as cl
+from chainlit.server import app as chainlit_server
 from chainlit.types import ThreadDict
-from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
-from langchain_core.runnables import RunnableConfig
+from langchain_core.messages import HumanMessage, BaseMessage
+from langgraph.errors import GraphRecursionError
 
 from mcp_client.client import MCPClientManager
 from agents.research_agent import create_research_agent
-from utils.llm import get_llm
+from agents.router import FAST, FULL, ROUTER_STATS, Tier, classify, validate_answer
+from utils.llm import get_llm, close_llm_clients, model_name
+from utils.llm_scheduler import LLMOverloadedError, llm_user, queue_listener
+from utils.answer_cache import ANSWER_CACHE, ANSWER_CACHE_ENABLED, cached_chunks, is_standalone, knowledge_version
 from utils.database import get_data_layer
+from utils.memory import ConversationMemory
+from utils.metrics import (
+    METRICS, METRICS_TIMINGS_ROLES, current_span, format_breakdown, record_span,
+    register_endpoints, span, turn
+)
+from utils.tokens import CHARS_PER_TOKEN, estimate_tokens, message_tokens
+
+logger = logging.getLogger(__name__)
+
+# Seconds a disconnected session has to reconnect before its running turn is
+# cancelled (negative: let turns finish).
+TURN_DISCONNECT_GRACE = float(os.getenv("TURN_DISCONNECT_GRACE", "10"))
 
 _mcp_manager = None
 _mcp_tools = None
 _initialization_lock = asyncio.Lock()
 _is_initialized = False
+# Running turn of each chat session, cancelled on stop or disconnect.
+_active_turns: Dict[str, asyncio.Task] = {}
+_disconnected: set = set()
+# LLM calls and output tokens of completed agent turns, to estimate what the
+# rest of a cancelled turn would have cost.
+_turn_usage = {"turns": 0, "llm_calls": 0, "output_tokens": 0}
+
+register_endpoints(chainlit_server)
+
+def _on_tools_changed(tools):
+    global _mcp_tools
+    _mcp_tools = tools
 
 async def ensure_mcp_initialized():
     global _mcp_manager, _mcp_tools, _is_initialized
     
-    if _is_initialized and _mcp_manager and _mcp_tools:
+    if _is_initialized and _mcp_manager:
         return _mcp_manager, _mcp_tools
     
+    waited = time.perf_counter()
     async with _initialization_lock:
-        if _is_initialized and _mcp_manager and _mcp_tools:
+        record_span("mcp.init_wait", waited)
+        if _is_initialized and _mcp_manager:
             return _mcp_manager, _mcp_tools
         
         if _mcp_manager is None:
             _mcp_manager = MCPClientManager()
+            _mcp_manager.add_tools_listener(_on_tools_changed)
         
-        await _mcp_manager.initialize_all_servers()
+        servers = await _mcp_manager.initialize_all_servers()
         _mcp_tools = await _mcp_manager.get_all_tools()
+        _mcp_manager.start_background_refresh()
         _is_initialized = True
         
+        for server in servers:
+            logger.info(
+                "MCP server %s: %s (%d tools)",
+                server["name"], server["status"], len(server["tools"])
+            )
+        
         return _mcp_manager, _mcp_tools
 
+async def get_shared_agent(tier: Tier = FULL):
+    # LLM clients and compiled graphs are process-wide (see utils/llm.py and
+    # agents/research_agent.py). The agent is looked up per turn so sessions
+    # pick up tools refreshed from mcp.json.
+    _, tools = await ensure_mcp_initialized()
+    llm = get_llm(temperature=tier.temperature, streaming=True, model=tier.model)
+    return create_research_agent(tools, llm)
+
+def _content_text(item: Any) -> str:
+    content = getattr(item, "content", item)
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            part if isinstance(part, str) else part.get("text", "")
+            for part in content
+            if isinstance(part, str) or (isinstance(part, dict) and part.get("type") == "text")
+        )
+    return "" if content is None else str(content)
+
+def _token_usage(output: Any, model: str, estimated_input: int) -> Dict[str, Any]:
+    """Token counts of a finished LLM call, estimated if the provider sent none."""
+    usage = getattr(output, "usage_metadata", None) or {}
+    counts = {
+        "input_tokens": usage.get("input_tokens", estimated_input),
+        "output_tokens": usage.get("output_tokens", estimate_tokens(_content_text(output))),
+    }
+    if not usage:
+        counts["estimated"] = True
+    for kind in ("input", "output"):
+        if counts[f"{kind}_tokens"]:
+            METRICS.count("chatbot_llm_tokens_total", counts[f"{kind}_tokens"], model=model, kind=kind)
+    return counts
+
+USAGE_KEYS = ("llm_calls", "tool_calls", "tool_errors", "tokens", "output_tokens")
+
+async def stream_agent_response(
+    agent,
+    messages: List[BaseMessage],
+    msg: cl.Message,
+    progress: Optional[Dict[str, Any]] = None,
+    config: Optional[Dict[str, Any]] = None
+) -> Tuple[str, Dict[str, Any]]:
+    """Run one agent turn over the LangGraph event stream.
+    
+    Tokens are pushed into ``msg`` as soon as the model emits them and every
+    tool call is shown as a child step of the current run, so the user sees
+    progress instead of waiting for the whole ReAct loop.
+    
+    Cancelling the calling task cancels the LLM stream and pending tool calls
+    with it; open tool steps are closed and ``progress`` keeps the calls made
+    and tokens spent so far. ``progress`` accumulates across runs, so a turn
+    answered twice (see ``run_routed_turn``) counts both.
+    
+    Returns:
+        The final answer text and the turn's latency metrics.
+    """
+    started = time.perf_counter()
+    first_token_at: Optional[float] = None
+    parent = cl.context.current_step
+    tool_steps: Dict[str, cl.Step] = {}
+    llm_spans: Dict[str, Any] = {}
+    final_message = None
+    progress = progress if progress is not None else {}
+    for key in USAGE_KEYS:
+        progress.setdefault(key, 0)
+    progress.setdefault("prompt_tokens", 0)
+    progress.setdefault("streaming", [])
+    
+    try:
+        async for event in agent.astream_events({"messages": messages}, config=config, version="v2"):
+            kind = event["event"]
+        
+            if kind == "on_chat_model_start":
+                progress["llm_calls"] += 1
+                model = (event.get("metadata") or {}).get("ls_model_name") or event["name"]
+                prompt = (event["data"].get("input") or {}).get("messages") or [[]]
+                progress["prompt_tokens"] = sum(message_tokens(m) for m in prompt[0])
+                llm_spans[event["run_id"]] = span(
+                    "llm.call", {"prompt_tokens": progress["prompt_tokens"]}, model=model
+                )
+            elif kind == "on_chat_model_stream":
+                token = _content_text(event["data"]["chunk"])
+                if token:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    call = llm_spans.get(event["run_id"])
+                    if call is not None:
+                        if "ttft_ms" not in call.attrs:
+                            call.attrs["ttft_ms"] = round(call.duration_ms, 1)
+                            METRICS.observe("chatbot_llm_ttft_ms", call.duration_ms, model=call.labels["model"])
+                        call.attrs["streamed_chars"] = call.attrs.get("streamed_chars", 0) + len(token)
+                    await msg.stream_token(token)
+            elif kind == "on_chat_model_end":
+                call = llm_spans.pop(event["run_id"], None)
+                if call is not None:
+                    call.attrs.pop("streamed_chars", None)
+                    usage = _token_usage(
+                        event["data"].get("output"), call.labels["model"], call.attrs.pop("prompt_tokens")
+                    )
+                    progress["tokens"] += usage["input_tokens"] + usage["output_tokens"]
+                    progress["output_tokens"] += usage["output_tokens"]
+                    call.finish(**usage)
+            elif kind == "on_tool_start":
+                progress["tool_calls"] += 1
+                step = cl.Step(
+                    name=event["name"],
+                    type="tool",
+                    parent_id=parent.id if parent else None
+                )
+                step.input = event["data"].get("input")
+                await step.send()
+                tool_steps[event["run_id"]] = step
+            elif kind in ("on_tool_end", "on_tool_error"):
+                step = tool_steps.pop(event["run_id"], None)
+                if step:
+                    if kind == "on_tool_error":
+                        progress["tool_errors"] += 1
+                        step.is_error = True
+                        step.output = str(event["data"].get("error"))
+                    else:
+                        step.output = _content_text(event["data"].get("output"))
+                    await step.update()
+            elif kind == "on_chain_end" and not event.get("parent_ids"):
+                output = event["data"].get("output")
+                if isinstance(output, dict) and output.get("messages"):
+                    final_message = output["messages"][-1]
+    except asyncio.CancelledError:
+        for call in llm_spans.values():
+            # The prompt was sent and whatever streamed back is billed.
+            streamed = math.ceil(call.attrs.pop("streamed_chars", 0) / CHARS_PER_TOKEN)
+            progress["tokens"] += call.attrs.pop("prompt_tokens", 0) + streamed
+            progress["streaming"].append(streamed)
+            call.finish(cancelled=True)
+        for step in tool_steps.values():
+            step.is_error = True
+            step.output = "Cancelled"
+            await asyncio.shield(step.update())
+        raise
+    
+    finished = time.perf_counter()
+    trace = current_span()
+    metrics = {
+        "trace_id": trace.attrs.get("trace_id") if trace else None,
+        "ttft_ms": round((first_token_at - started) * 1000, 1) if first_token_at else None,
+        "total_ms": round((finished - started) * 1000, 1),
+        "llm_calls": progress["llm_calls"],
+        "tool_calls": progress["tool_calls"],
+    }
+    logger.info("Turn latency: %s", metrics)
+    
+    final_content = _content_text(final_message) if final_message is not None else msg.content
+    return final_content, metrics
+
+async def run_routed_turn(
+    question: str,
+    history: List[BaseMessage],
+    msg: cl.Message,
+    progress: Dict[str, Any],
+    has_history: bool
+) -> Tuple[str, Dict[str, Any], Dict[str, Any]]:
+    """Answer on the tier the router picks for the question.
+    
+    A fast-tier run that wants more tool rounds than its budget, fails or
+    gives an answer that does not pass validation is discarded and the turn
+    is answered again by the full model. ``progress`` and the metrics cover
+    both runs; the routing record splits the usage per tier.
+    
+    Returns:
+        The final answer text, the latency metrics and the routing record.
+    """
+    tier, reason = classify(question, has_history)
+    escalated_from = None
+    started = turn_started = time.perf_counter()
+    if tier is FAST:
+        try:
+            final_content, metrics = await stream_agent_response(
+                await get_shared_agent(FAST), history, msg, progress, FAST.run_config()
+            )
+            problem = validate_answer(final_content, progress)
+        except GraphRecursionError:
+            problem = "more_tools"
+        except LLMOverloadedError:
+            raise
+        except Exception as e:
+            problem = f"error: {type(e).__name__}"
+        if problem is None:
+            route = ROUTER_STATS.record(FAST, reason, (time.perf_counter() - started) * 1000, progress["tokens"])
+            route["usage"] = {"fast": {key: progress[key] for key in USAGE_KEYS}}
+            return final_content, metrics, route
+        
+        escalated_from = {
+            "model": FAST.model,
+            "reason": problem,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+            **{key: progress.get(key, 0) for key in USAGE_KEYS},
+        }
+        logger.info("Escalating turn to the full model: %s", escalated_from)
+        msg.content = ""
+        await msg.update()
+        started = time.perf_counter()
+    
+    final_content, metrics = await stream_agent_response(await get_shared_agent(FULL), history, msg, progress)
+    full_usage = {key: progress[key] - (escalated_from or {}).get(key, 0) for key in USAGE_KEYS}
+    route = ROUTER_STATS.record(
+        FULL, reason, (time.perf_counter() - started) * 1000, full_usage["tokens"], escalated_from
+    )
+    route["usage"] = {"full": full_usage}
+    if escalated_from is not None:
+        route["usage"]["fast"] = {key: escalated_from[key] for key in USAGE_KEYS}
+        # The user waited through the discarded fast run as well.
+        metrics["total_ms"] = round((time.perf_counter() - turn_started) * 1000, 1)
+        if metrics["ttft_ms"] is not None:
+            metrics["ttft_ms"] = round(metrics["ttft_ms"] + escalated_from["duration_ms"], 1)
+    return final_content, metrics, route
+
+@cl.on_app_startup
+async def on_app_startup():
+    # Spawn every MCP server and cache its tool schemas before the first
+    # chat, so no session pays the cold start.
+    await ensure_mcp_initialized()
+
+@cl.on_app_shutdown
+async def on_app_shutdown():
+    if _mcp_manager:
+        await _mcp_manager.cleanup()
+    await close_llm_clients()
+    await get_data_layer().close()
+
 @cl.data_layer
 def init_data_layer():
     return get_data_layer()
@@ -50,13 +321,8 @@ async def auth_callback(username: str, password: str):
 @cl.on_chat_start
 async def on_chat_start():
     try:
-        mcp_manager, tools = await ensure_mcp_initialized()
-        
-        llm = get_llm(temperature=0.7, streaming=True)
-        agent = create_research_agent(tools, llm)
-        
-        cl.user_session.set("agent", agent)
-        cl.user_session.set("message_history", [])
+        await get_shared_agent()
+        cl.user_session.set("memory", ConversationMemory())
         
         await cl.Message(
             content="✨ Ready! Ask me anything."
@@ -68,25 +334,31 @@ async def on_chat_start():
             content=f"❌ Error: {str(e)}\n```\n{traceback.format_exc()}\n```"
         ).send()
 
+def _recent_turns(thread: ThreadDict) -> Iterator[Tuple[str, str]]:
+    """Yield the thread's turns newest first."""
+    ai_text: Optional[str] = None
+    for step in reversed(thread.get("steps") or []):
+        if step["type"] == "user_message":
+            yield step.get("output") or "", ai_text or ""
+            ai_text = None
+        elif step["type"] == "assistant_message" and ai_text is None:
+            # The last reply of a turn is its answer.
+            ai_text = step.get("output") or ""
+
 @cl.on_chat_resume
 async def on_chat_resume(thread: ThreadDict):
     try:
-        mcp_manager, tools = await ensure_mcp_initialized()
-        
-        llm = get_llm(temperature=0.7, streaming=True)
-        agent = create_research_agent(tools, llm)
-        
-        cl.user_session.set("agent", agent)
-        
-        message_history = []
-        if "steps" in thread:
-            for step in thread["steps"]:
-                if step.get("type") == "user_message":
-                    message_history.append(HumanMessage(content=step.get("output", "")))
-                elif step.get("type") in ["assistant_message", "run"]:
-                    message_history.append(AIMessage(content=step.get("output", "")))
+        await get_shared_agent()
         
-        cl.user_session.set("message_history", message_history)
+        # get_thread only loaded the thread's messages (see
+        # SQLiteFriendlyDataLayer.get_thread); memory is rebuilt from those.
+        steps = thread.get("steps") or []
+        memory = ConversationMemory.from_recent_turns(
+            cl.user_session.get("memory_state"),
+            sum(1 for step in steps if step["type"] == "user_message"),
+            _recent_turns(thread)
+        )
+        cl.user_session.set("memory", memory)
         
     except Exception as e:
         import traceback
@@ -94,12 +366,86 @@ async def on_chat_resume(thread: ThreadDict):
             content=f"❌ Error resuming: {str(e)}\n```\n{traceback.format_exc()}\n```"
         ).send()
 
+async def answer_from_cache(
+    message: cl.Message, memory: ConversationMemory
+) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """Look a standalone question up in the answer cache.
+    
+    Answers are cached per model. A question the router sends to the full
+    model only takes full-model answers; one it sends to the fast tier also
+    takes the fast model's.
+    
+    Returns:
+        The cache hit, if any, and the knowledge version to store the answer
+        under, or None if the question depends on the conversation.
+    """
+    has_history = bool(memory.turn_count or memory.summary)
+    if not ANSWER_CACHE_ENABLED or not is_standalone(message.content, has_history):
+        return None, None
+    manager, _ = await ensure_mcp_initialized()
+    version = knowledge_version(manager.server_configs)
+    tier, _ = classify(message.content, has_history)
+    models = list(dict.fromkeys([model_name(FULL.model), model_name(tier.model)]))
+    with span("answer_cache") as lookup:
+        hit = ANSWER_CACHE.get(models, message.content, version)
+        lookup.attrs["cache"] = hit["match"] if hit else "miss"
+    METRICS.count("chatbot_answer_cache_total", result=hit["match"] if hit else "miss")
+    return hit, version
+
+def _queue_notifier() -> Callable[[Dict[str, Any]], Awaitable[None]]:
+    """Show the turn's place in the LLM queue while it waits for a slot."""
+    step: Optional[cl.Step] = None
+    
+    async def notify(status: Dict[str, Any]):
+        nonlocal step
+        if status.get("admitted"):
+            if step is not None:
+                step.output = f"Waited {status['waited_s']:g} s for the model"
+                await step.update()
+                step = None
+            return
+        text = f"⏳ Waiting for the model: position {status['position']}, about {status['eta_s']:.0f} s"
+        if step is None:
+            step = cl.Step(name="Queue", type="undefined")
+            step.output = text
+            await step.send()
+        else:
+            step.output = text
+            await step.update()
+    
+    return notify
+
+def _timings_visible() -> bool:
+    user = cl.user_session.get("user")
+    role = (getattr(user, "metadata", None) or {}).get("role")
+    return role in METRICS_TIMINGS_ROLES
+
 @cl.on_message
 async def on_message(message: cl.Message):
-    agent = cl.user_session.get("agent")
-    message_history: List[BaseMessage] = cl.user_session.get("message_history") or []
+    session_id = cl.context.session.id
+    task = asyncio.current_task()
+    if task is not None:
+        _active_turns[session_id] = task
+    user = cl.user_session.get("user")
+    # LLM calls queue fairly per user (per session for anonymous chats).
+    llm_user.set(getattr(user, "identifier", None) or session_id)
+    try:
+        with turn(thread_id=message.thread_id) as trace:
+            await answer_message(message)
+    finally:
+        if _active_turns.get(session_id) is task:
+            del _active_turns[session_id]
+    
+    if _timings_visible():
+        async with cl.Step(name="Timing", type="undefined") as timing:
+            timing.output = format_breakdown(trace)
+
+async def answer_message(message: cl.Message):
+    memory: ConversationMemory = cl.user_session.get("memory") or ConversationMemory()
     
-    if not agent:
+    try:
+        await get_shared_agent()
+    except Exception:
         await cl.Message(
             content="❌ Agent not initialized. Please refresh the page."
         ).send()
@@ -109,40 +455,146 @@ async def on_message(message: cl.Message):
     await msg.send()
     
     try:
-        message_history.append(HumanMessage(content=message.content))
-        
-        config = RunnableConfig(
-            callbacks=[cl.LangchainCallbackHandler(stream_final_answer=True)]
-        )
+        cached, cache_version = await answer_from_cache(message, memory)
+    except Exception as e:
+        logger.warning("Answer cache lookup failed: %s", e)
+        cached, cache_version = None, None
+    
+    if cached:
+        started = time.perf_counter()
+        for chunk in cached_chunks(cached["answer"]):
+            await msg.stream_token(chunk)
+        trace = current_span()
+        msg.content = cached["answer"]
+        msg.metadata = {
+            **(msg.metadata or {}),
+            "cached": {k: v for k, v in cached.items() if k != "answer"},
+            "latency": {
+                "trace_id": trace.attrs.get("trace_id") if trace else None,
+                "ttft_ms": round((time.perf_counter() - started) * 1000, 1),
+                "total_ms": round((time.perf_counter() - started) * 1000, 1),
+                "llm_calls": 0,
+                "tool_calls": 0,
+                "history_tokens": memory.total_tokens,
+            },
+        }
+        memory.add_turn(message.content, cached["answer"])
+        cl.user_session.set("memory", memory)
+        await msg.update()
+        return
+    
+    progress: Dict[str, Any] = {}
+    queue_listener.set(_queue_notifier())
+    try:
+        has_history = bool(memory.turn_count or memory.summary)
+        history = memory.messages() + [HumanMessage(content=message.content)]
         
-        response = await agent.ainvoke(
-            {"messages": message_history},
-            config=config
-        )
+        final_content, metrics, route = await run_routed_turn(message.content, history, msg, progress, has_history)
+        metrics["history_tokens"] = memory.total_tokens
+        _turn_usage["turns"] += 1
+        _turn_usage["llm_calls"] += progress["llm_calls"]
+        _turn_usage["output_tokens"] += progress["output_tokens"]
         
-        if "messages" in response and len(response["messages"]) > 0:
-            final_message = response["messages"][-1]
-            
-            if hasattr(final_message, "content"):
-                msg.content = final_message.content
-                message_history.append(AIMessage(content=final_message.content))
-            else:
-                msg.content = str(final_message)
-                message_history.append(AIMessage(content=str(final_message)))
-        else:
-            msg.content = str(response)
-            message_history.append(AIMessage(content=str(response)))
+        msg.content = final_content
+        msg.metadata = {**(msg.metadata or {}), "latency": metrics, "route": route}
+        trace = current_span()
+        if trace is not None:
+            trace.attrs.update(tier=route["tier"], route_reason=route["reason"])
+        memory.add_turn(message.content, final_content)
+        # Only answers the tools backed are worth replaying.
+        if cache_version and metrics["tool_calls"] and final_content:
+            answered_by = FAST if route["tier"] == FAST.name else FULL
+            ANSWER_CACHE.put(model_name(answered_by.model), message.content, cache_version, final_content)
         
-        cl.user_session.set("message_history", message_history)
+        cl.user_session.set("memory", memory)
         await msg.update()
         
+    except asyncio.CancelledError:
+        await _persist_cancelled_turn(message, msg, memory, progress)
+        raise
+    except LLMOverloadedError as e:
+        memory.add_turn(message.content)
+        cl.user_session.set("memory", memory)
+        msg.content = msg.content + ("\n\n" if msg.content else "") + f"⏳ {e}"
+        await msg.update()
+        return
     except Exception as e:
+        memory.add_turn(message.content)
+        cl.user_session.set("memory", memory)
         msg.content = f"❌ **Error processing request**: {str(e)}\n\nTraceback: {e.__traceback__}"
         await msg.update()
+        return
+    
+    if memory.needs_compaction():
+        with span("memory.compact"):
+            await memory.compact(get_llm(temperature=0.0, streaming=False, model=FAST.model))
+        cl.user_session.set("memory_state", memory.to_state())
+
+def _tokens_saved(progress: Dict[str, Any]) -> int:
+    """Estimate the tokens a cancelled turn would still have used.
+    
+    Completed turns give the average LLM calls per turn and output tokens per
+    call; each call the turn did not get to would have resent the latest
+    prompt, and calls cut off mid-stream would have finished their answer.
+    """
+    if not _turn_usage["turns"] or not _turn_usage["llm_calls"]:
+        return 0
+    calls_per_turn = _turn_usage["llm_calls"] / _turn_usage["turns"]
+    output_per_call = _turn_usage["output_tokens"] / _turn_usage["llm_calls"]
+    remaining_calls = max(0.0, calls_per_turn - progress.get("llm_calls", 0))
+    unfinished = sum(max(0.0, output_per_call - streamed) for streamed in progress.get("streaming", []))
+    return round(remaining_calls * (progress.get("prompt_tokens", 0) + output_per_call) + unfinished)
+
+async def _persist_cancelled_turn(
+    message: cl.Message, msg: cl.Message, memory: ConversationMemory, progress: Dict[str, Any]
+):
+    """Keep what was streamed of a cancelled answer, in the thread and in memory."""
+    session_id = cl.context.session.id
+    reason = "disconnect" if session_id in _disconnected else "stop"
+    spent = progress.get("tokens", 0)
+    saved = _tokens_saved(progress)
+    METRICS.count("chatbot_turns_cancelled_total", reason=reason)
+    if saved:
+        METRICS.count("chatbot_llm_tokens_saved_total", saved)
+    logger.info(
+        "Turn cancelled (%s) after %d LLM and %d tool calls, ~%d tokens spent, ~%d saved",
+        reason, progress.get("llm_calls", 0), progress.get("tool_calls", 0), spent, saved
+    )
+    
+    partial = msg.content
+    memory.add_turn(message.content, partial)
+    cl.user_session.set("memory", memory)
+    msg.content = partial + ("\n\n" if partial else "") + "⏹️ *Stopped*"
+    msg.metadata = {
+        **(msg.metadata or {}),
+        "cancelled": {
+            "reason": reason,
+            "llm_calls": progress.get("llm_calls", 0),
+            "tool_calls": progress.get("tool_calls", 0),
+            "tokens_spent": spent,
+            "tokens_saved_estimate": saved,
+        },
+    }
+    # The turn's task is being cancelled; finish the write regardless.
+    await asyncio.shield(msg.update())
+
+async def _cancel_after_disconnect(session, socket_id: Optional[str]):
+    await asyncio.sleep(TURN_DISCONNECT_GRACE)
+    task = _active_turns.get(session.id)
+    # A reconnect moves the session to a new socket.
+    if task is not None and not task.done() and getattr(session, "socket_id", None) == socket_id:
+        _disconnected.add(session.id)
+        task.cancel()
+        await asyncio.wait([task])
+        _disconnected.discard(session.id)
 
 @cl.on_chat_end
 async def on_chat_end():
-    pass
+    session = cl.context.session
+    if session.id in _active_turns and TURN_DISCONNECT_GRACE >= 0:
+        asyncio.create_task(_cancel_after_disconnect(session, getattr(session, "socket_id", None)))
+    # Persist the thread's buffered steps now rather than on the next tick.
+    await get_data_layer().flush()
 
 @cl.on_settings_update
 async def on_settings_update(settings):
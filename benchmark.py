@@ -0,0 +1,397 @@
+#!/usr/bin/env python
+"""
+Offline benchmark and load test of the chat pipeline.
+
+Drives the real ``on_chat_start`` / ``on_message`` handlers of app.py for N
+concurrent sessions against the real MCP servers from mcp.json and a
+throwaway SQLite database. The OpenRouter model is replaced by a scripted
+chat model with a configurable time to first token and token rate that
+calls tools the way the research agent does, so runs need no network and
+are reproducible. Results can be saved as JSON and compared against a
+baseline to fail a build on regressions.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import zlib
+import random
+import asyncio
+import argparse
+import resource
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+QUERY_TERMS = [
+    "API", "rate", "limits", "architecture", "microservices", "roadmap", "onboarding",
+    "vacation", "policy", "revenue", "quarter", "budget", "deployment", "security",
+    "database", "sprint", "hiring", "benefits", "metrics", "incident",
+]
+PAGE_IDS = ["eng-001", "eng-002", "eng-003", "prod-001", "prod-002", "hr-001", "hr-002", "fin-001"]
+ANSWER_WORDS = "Based on the Confluence pages the figures show a steady increase across the period".split()
+
+# Stages reported per turn: total time spent in spans with these names.
+STAGES = ["llm.queue", "llm.call", "mcp.tool", "mcp.acquire", "mcp.spawn", "mcp.execute", "db.write", "memory.compact", "mcp.init_wait"]
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Offline chat model for benchmarks.
+    
+    For a new user message it answers with ``tools_per_turn`` tool calls
+    (searches, page fetches and calculations picked deterministically from
+    the message), and once tool results are in it streams an answer of
+    ``answer_tokens`` tokens. Each response waits ``latency`` seconds before
+    its first token and then emits ``tokens_per_second``.
+    """
+    
+    latency: float = 0.3
+    tokens_per_second: float = 50.0
+    answer_tokens: int = 60
+    tools_per_turn: int = 2
+    seed: int = 0
+    
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+    
+    def bind_tools(self, tools, **kwargs):  # type: ignore
+        return self
+    
+    def _tool_calls(self, text: str) -> List[Dict[str, Any]]:
+        rng = random.Random(self.seed * 1_000_003 + zlib.crc32(text.encode("utf-8")))
+        calls = []
+        for i in range(self.tools_per_turn):
+            kind = (rng.randrange(4) + i) % 4
+            if kind == 0:
+                call = ("search_confluence", {"query": " ".join(rng.sample(QUERY_TERMS, 2))})
+            elif kind == 1:
+                call = ("get_confluence_page", {"page_id": rng.choice(PAGE_IDS)})
+            elif kind == 2:
+                numbers = [round(rng.uniform(1, 1000), 2) for _ in range(rng.randint(3, 12))]
+                call = ("statistics", {"numbers": numbers, "operation": rng.choice(["mean", "median", "stdev"])})
+            else:
+                call = ("calculate", {"expression": f"{rng.randint(1, 9999)} * {rng.randint(1, 99)} / 7"})
+            calls.append({"name": call[0], "args": call[1], "id": f"call_{uuid.uuid4().hex[:12]}"})
+        return calls
+    
+    def _respond(self, messages: List[BaseMessage]) -> AIMessage:
+        last = messages[-1]
+        text = str(last.content)
+        if isinstance(last, HumanMessage) and self.tools_per_turn and not text.startswith("Update the running summary"):
+            return AIMessage(content="", tool_calls=self._tool_calls(text))
+        words = [ANSWER_WORDS[i % len(ANSWER_WORDS)] for i in range(self.answer_tokens)]
+        return AIMessage(content=" ".join(words))
+    
+    def _usage(self, messages: List[BaseMessage], output_tokens: int) -> Dict[str, int]:
+        input_tokens = sum(len(str(m.content)) // 4 + 4 for m in messages)
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+    
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        response = self._respond(messages)
+        time.sleep(self.latency + self.answer_tokens / self.tokens_per_second)
+        return ChatResult(generations=[ChatGeneration(message=response)])
+    
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        response = self._respond(messages)
+        await asyncio.sleep(self.latency + self.answer_tokens / self.tokens_per_second)
+        response.usage_metadata = self._usage(messages, self.answer_tokens)  # type: ignore
+        return ChatResult(generations=[ChatGeneration(message=response)])
+    
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        response = self._respond(messages)
+        await asyncio.sleep(self.latency)
+        if response.tool_calls:
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content="",
+                tool_call_chunks=[
+                    {"name": c["name"], "args": json.dumps(c["args"]), "id": c["id"], "index": i}
+                    for i, c in enumerate(response.tool_calls)
+                ],
+                usage_metadata=self._usage(messages, 10 * len(response.tool_calls))  # type: ignore
+            ))
+            return
+        words = str(response.content).split(" ")
+        for i, word in enumerate(words):
+            if i:
+                await asyncio.sleep(1 / self.tokens_per_second)
+            chunk = AIMessageChunk(content=word if i == 0 else " " + word)
+            if i == len(words) - 1:
+                chunk.usage_metadata = self._usage(messages, len(words))  # type: ignore
+            yield ChatGenerationChunk(message=chunk)
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1)
+
+def _summary(values: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        "p50": _percentile(values, 0.50),
+        "p95": _percentile(values, 0.95),
+        "p99": _percentile(values, 0.99),
+        "mean": round(sum(values) / len(values), 1) if values else None,
+    }
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        return 0.0
+
+def _stage_totals(trace: Dict[str, Any]) -> Dict[str, float]:
+    totals: Dict[str, float] = {}
+    ttft = None
+    stack = list(trace.get("children", []))
+    while stack:
+        node = stack.pop()
+        totals[node["name"]] = totals.get(node["name"], 0.0) + node["duration_ms"]
+        if node["name"] == "llm.call" and ttft is None and "ttft_ms" in node.get("attrs", {}):
+            ttft = node["attrs"]["ttft_ms"]
+        stack.extend(node.get("children", []))
+    if ttft is not None:
+        totals["llm.ttft"] = ttft
+    return totals
+
+
+async def run_benchmark(args, work_dir: Path) -> Dict[str, Any]:
+    # Everything the app reads from the environment at import time is set
+    # before it is imported.
+    db_path = work_dir / "bench.db"
+    os.environ["CHAINLIT_DB_PATH"] = str(db_path)
+    os.environ["CHAINLIT_DB_WRITE_BEHIND"] = "true" if args.write_behind else "false"
+    if args.llm_concurrency:
+        os.environ["LLM_MAX_CONCURRENCY"] = str(args.llm_concurrency)
+    if args.llm_tokens_per_minute:
+        os.environ["LLM_TOKENS_PER_MINUTE"] = str(args.llm_tokens_per_minute)
+    if args.fast_speedup:
+        os.environ["LLM_FAST_MODEL"] = "scripted-fast"
+    os.environ.setdefault("CHAINLIT_AUTH_SECRET", "benchmark")
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    
+    from init_db import init_database
+    await init_database(str(db_path))
+    
+    import chainlit as cl
+    from chainlit.context import init_http_context
+    import app
+    from utils import metrics
+    from agents.router import ROUTER_STATS
+    from utils.answer_cache import ANSWER_CACHE
+    from utils.llm_scheduler import LLM_SCHEDULER, ScheduledChatModel
+    
+    class ScheduledScriptedChatModel(ScheduledChatModel, ScriptedChatModel):
+        pass
+    
+    # Admitted through the LLM scheduler like the real client.
+    full_model = ScheduledScriptedChatModel(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        answer_tokens=args.answer_tokens,
+        tools_per_turn=args.tools_per_turn,
+        seed=args.seed
+    )
+    # The fast tier, if enabled, is the same script running ``fast_speedup``
+    # times faster.
+    fast_model = full_model
+    if args.fast_speedup:
+        fast_model = ScheduledScriptedChatModel(
+            latency=args.latency / args.fast_speedup,
+            tokens_per_second=args.tokens_per_second * args.fast_speedup,
+            answer_tokens=args.answer_tokens,
+            tools_per_turn=args.tools_per_turn,
+            seed=args.seed
+        )
+    app.get_llm = lambda *a, model=None, **kw: fast_model if model else full_model  # type: ignore
+    
+    traces: List[Dict[str, float]] = []
+    metrics.add_trace_listener(lambda trace: traces.append(_stage_totals(trace)))
+    
+    setup_started = time.perf_counter()
+    await app.on_app_startup()
+    setup_s = time.perf_counter() - setup_started
+    
+    latencies: List[float] = []
+    errors = 0
+    rng = random.Random(args.seed)
+    # With a fast tier, every other question asks for analysis and stays on
+    # the full model.
+    questions = [
+        ("Compare and explain" if args.fast_speedup and i % 2 else "What does Confluence say about")
+        + f" {' '.join(rng.sample(QUERY_TERMS, 3))}? (#{i})"
+        for i in range(args.questions or args.sessions * args.turns)
+    ]
+    
+    async def session(index: int):
+        nonlocal errors
+        init_http_context(
+            thread_id=str(uuid.uuid4()),
+            user=cl.User(identifier=f"bench-{index}", metadata={"role": "user"})
+        )
+        await app.on_chat_start()
+        for turn in range(args.turns):
+            message = cl.Message(content=questions[(index * args.turns + turn) % len(questions)], type="user_message")
+            await message.send()
+            started = time.perf_counter()
+            try:
+                await app.on_message(message)
+            except Exception:
+                errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+            if args.think_time:
+                await asyncio.sleep(rng.uniform(0, 2 * args.think_time))
+        await app.on_chat_end()
+    
+    rss_before = _rss_mb()
+    started = time.perf_counter()
+    await asyncio.gather(*(session(i) for i in range(args.sessions)))
+    await app.get_data_layer().flush()
+    wall_s = time.perf_counter() - started
+    rss_after = _rss_mb()
+    
+    steps = await app.get_data_layer().execute_sql(query="SELECT COUNT(*) AS n FROM steps", parameters={})
+    steps_written = int(steps[0]["n"]) if steps else 0
+    manager = app._mcp_manager
+    pools = manager.get_pool_stats() if manager else []
+    cache = manager.get_cache_stats() if manager else {}
+    outputs = manager.get_output_stats() if manager else {}
+    db_writes = sum(
+        h.count for (name, labels), h in metrics.METRICS.histograms.items()
+        if name == "chatbot_span_duration_ms" and ("span", "db.write") in labels
+    )
+    await app.on_app_shutdown()
+    
+    stage_names = STAGES + ["llm.ttft"]
+    return {
+        "config": {k: v for k, v in vars(args).items() if k not in ("json", "compare", "tolerance", "keep")},
+        "turns": len(latencies),
+        "errors": errors,
+        "setup_s": round(setup_s, 2),
+        "wall_s": round(wall_s, 2),
+        "throughput_turns_per_s": round(len(latencies) / wall_s, 2) if wall_s else None,
+        "turn_latency_ms": _summary(latencies),
+        "stages_ms": {
+            name: _summary([t[name] for t in traces if name in t])
+            for name in stage_names if any(name in t for t in traces)
+        },
+        "rss_mb": {"before": round(rss_before, 1), "after": round(rss_after, 1),
+                   "peak": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)},
+        "sqlite": {
+            "steps_written": steps_written,
+            "steps_per_s": round(steps_written / wall_s, 1) if wall_s else None,
+            "write_transactions": db_writes,
+            "write_transactions_per_s": round(db_writes / wall_s, 1) if wall_s else None,
+        },
+        "mcp": {"pools": pools, "cache_hit_rate": cache.get("hit_rate"), "outputs_truncated": outputs.get("truncated")},
+        "answer_cache": ANSWER_CACHE.stats(),
+        "llm_scheduler": LLM_SCHEDULER.stats(),
+        "router": ROUTER_STATS.stats(),
+    }
+
+def print_report(result: Dict[str, Any]):
+    config = result["config"]
+    print(
+        f"\n📊 {config['sessions']} sessions × {config['turns']} turns, fake LLM "
+        f"{config['latency']:g}s to first token at {config['tokens_per_second']:g} tok/s, "
+        f"{config['tools_per_turn']} tools/turn, write-behind {'on' if config['write_behind'] else 'off'}"
+    )
+    print(f"   Setup (MCP servers): {result['setup_s']} s")
+    print(f"   Throughput: {result['throughput_turns_per_s']} turns/s over {result['wall_s']} s, {result['errors']} errors")
+    latency = result["turn_latency_ms"]
+    print(f"   Turn latency ms: p50={latency['p50']} p95={latency['p95']} p99={latency['p99']}")
+    print("   Per-turn stage totals ms (parallel spans add up):")
+    for name, s in result["stages_ms"].items():
+        print(f"     {name:<15} p50={s['p50']:<9} p95={s['p95']:<9} mean={s['mean']}")
+    rss = result["rss_mb"]
+    print(f"   RSS MB: {rss['before']} → {rss['after']} (peak {rss['peak']}); MCP servers run as separate processes")
+    db = result["sqlite"]
+    print(
+        f"   SQLite: {db['steps_written']} steps ({db['steps_per_s']}/s), "
+        f"{db['write_transactions']} write transactions ({db['write_transactions_per_s']}/s)"
+    )
+    print(
+        f"   MCP cache hit rate: {result['mcp']['cache_hit_rate']}, "
+        f"{result['mcp'].get('outputs_truncated') or 0} tool outputs shortened"
+    )
+    answers = result["answer_cache"]
+    if answers["hits"] or answers["near_hits"] or answers["misses"]:
+        print(f"   Answer cache: {answers['hits']} hits, {answers['near_hits']} near hits, {answers['misses']} misses")
+    scheduler = result["llm_scheduler"]
+    print(
+        f"   LLM scheduler: {scheduler['admitted']} calls, {scheduler['queued_calls']} queued, "
+        f"{scheduler['shed']} shed (max {scheduler['max_concurrency']} concurrent)"
+    )
+    router = result["router"]
+    if router["turns"]["fast"] or router["escalations"]:
+        print(
+            f"   Router: {router['turns']['fast']} fast / {router['turns']['full']} full turns, "
+            f"{router['escalations']} escalated, {router['latency_saved_ms']} ms saved"
+        )
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Regressions of more than ``tolerance`` against a saved run."""
+    problems = []
+    for q in ("p50", "p95", "p99"):
+        old, new = baseline["turn_latency_ms"].get(q), result["turn_latency_ms"].get(q)
+        if old and new and new > old * (1 + tolerance):
+            problems.append(f"turn latency {q} {old} → {new} ms")
+    old, new = baseline.get("throughput_turns_per_s"), result.get("throughput_turns_per_s")
+    if old and new and new < old * (1 - tolerance):
+        problems.append(f"throughput {old} → {new} turns/s")
+    if result["errors"] > baseline.get("errors", 0):
+        problems.append(f"errors {baseline.get('errors', 0)} → {result['errors']}")
+    return problems
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Offline benchmark of the chat pipeline")
+    parser.add_argument("--sessions", type=int, default=10, help="Concurrent chat sessions")
+    parser.add_argument("--turns", type=int, default=5, help="Messages per session")
+    parser.add_argument("--latency", type=float, default=0.3, help="Fake LLM seconds to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="Fake LLM streaming rate")
+    parser.add_argument("--answer-tokens", type=int, default=60, help="Tokens per final answer")
+    parser.add_argument("--tools-per-turn", type=int, default=2, help="Tool calls the fake LLM makes per turn")
+    parser.add_argument("--questions", type=int, default=0, help="Distinct questions shared by all sessions (0: every message is new)")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean seconds between a session's messages")
+    parser.add_argument("--write-behind", action="store_true", help="Enable CHAINLIT_DB_WRITE_BEHIND")
+    parser.add_argument("--llm-concurrency", type=int, default=0, help="LLM_MAX_CONCURRENCY (0: keep the environment's)")
+    parser.add_argument("--llm-tokens-per-minute", type=int, default=0, help="LLM_TOKENS_PER_MINUTE (0: keep the environment's)")
+    parser.add_argument("--fast-speedup", type=float, default=0.0, help="Route simple turns to a fake fast model this many times faster (0: off)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="Keep the work directory (database) after the run")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--compare", help="Baseline results JSON; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression against the baseline")
+    args = parser.parse_args(argv)
+    
+    work_dir = Path(tempfile.mkdtemp(prefix="chatbot-bench-"))
+    try:
+        result = asyncio.run(run_benchmark(args, work_dir))
+        print_report(result)
+        
+        if args.json:
+            Path(args.json).write_text(json.dumps(result, indent=2))
+            print(f"\n💾 Results written to {args.json}")
+        if args.compare:
+            problems = compare(result, json.loads(Path(args.compare).read_text()), args.tolerance)
+            if problems:
+                print("\n❌ Regressions against " + args.compare + ":\n   " + "\n   ".join(problems))
+                sys.exit(1)
+            print(f"\n✅ No regressions against {args.compare}")
+    finally:
+        if args.keep:
+            print(f"\n📁 Work directory kept at {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
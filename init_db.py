@@ -1,10 +1,69 @@
+import os
 import asyncio
 import aiosqlite
 
-async def init_database():
-    """Initialize the Chainlit database with required tables."""
+DB_PATH = os.getenv("CHAINLIT_DB_PATH", "./chatbot.db")
     
-    async with aiosqlite.connect("chatbot.db") as db:
+# Columns Chainlit writes that databases created by older versions of this
+# script lack; they are added in place. New databases get them from the
+# CREATE TABLE statements below, which must list them too.
+MIGRATED_COLUMNS = {
+    "steps": {
+        "command": "TEXT",
+        "modes": "TEXT",
+        "autoCollapse": "INTEGER",
+        "icon": "TEXT",
+    },
+    "elements": {
+        "objectKey": "TEXT",
+        "page": "INTEGER",
+        "props": "TEXT",
+        "autoPlay": "INTEGER",
+        "playerConfig": "TEXT",
+    },
+}
+
+# Indexes behind thread listing, resume and cascading deletes.
+INDEXES = {
+    "idx_steps_thread_created": 'steps("threadId", "createdAt")',
+    "idx_steps_thread_messages": (
+        'steps("threadId", "createdAt", "id") '
+        "WHERE \"type\" IN ('user_message', 'assistant_message')"
+    ),
+    "idx_steps_parent": 'steps("parentId")',
+    "idx_threads_user_created": 'threads("userId", "createdAt")',
+    "idx_elements_thread": 'elements("threadId")',
+    "idx_feedbacks_for": 'feedbacks("forId")',
+}
+
+async def migrate_database(db: aiosqlite.Connection):
+    """Bring an existing database up to date: WAL journaling, missing columns and indexes."""
+    
+    # WAL lets the data layer's readers run while its writer commits; the
+    # setting is stored in the database file.
+    await db.execute("PRAGMA journal_mode=WAL")
+    
+    for table, columns in MIGRATED_COLUMNS.items():
+        async with db.execute(f"PRAGMA table_info({table})") as cursor:
+            existing = {row[1] for row in await cursor.fetchall()}
+        for column, column_type in columns.items():
+            if column not in existing:
+                await db.execute(f'ALTER TABLE {table} ADD COLUMN "{column}" {column_type}')
+                print(f"   Added column {table}.{column}")
+    
+    for name, target in INDEXES.items():
+        await db.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+    
+    await db.execute("ANALYZE")
+
+async def init_database(db_path: str = DB_PATH):
+    """Initialize the Chainlit database with required tables, or migrate an existing one."""
+    
+    async with aiosqlite.connect(db_path) as db:
+        # Only takes effect on a new, empty file; existing databases are
+        # switched with `python maintain_db.py --enable-incremental-vacuum`.
+        await db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        
         # Create users table
         await db.execute("""
             CREATE TABLE IF NOT EXISTS users (
@@ -52,6 +111,10 @@ async def init_database():
                 "language" TEXT,
                 "indent" INTEGER,
                 "defaultOpen" INTEGER,
+                "command" TEXT,
+                "modes" TEXT,
+                "autoCollapse" INTEGER,
+                "icon" TEXT,
                 FOREIGN KEY("threadId") REFERENCES threads("id") ON DELETE CASCADE,
                 FOREIGN KEY("parentId") REFERENCES steps("id") ON DELETE CASCADE
             )
@@ -71,6 +134,11 @@ async def init_database():
                 "language" TEXT,
                 "forId" TEXT,
                 "mime" TEXT,
+                "objectKey" TEXT,
+                "page" INTEGER,
+                "props" TEXT,
+                "autoPlay" INTEGER,
+                "playerConfig" TEXT,
                 FOREIGN KEY("threadId") REFERENCES threads("id") ON DELETE CASCADE
             )
         """)
@@ -86,6 +154,8 @@ async def init_database():
             )
         """)
         
+        await migrate_database(db)
+        
         await db.commit()
         print("✅ Database tables created successfully!")
 
@@ -0,0 +1,433 @@
+#!/usr/bin/env python
+"""
+Retention, compaction and archival for the Chainlit database.
+
+Safe to run while the app is up: work is done a few threads per transaction,
+and each write transaction re-checks that its threads are still cold.
+"""
+import os
+import zlib
+import asyncio
+import argparse
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import aiosqlite
+
+from init_db import DB_PATH, init_database
+
+def parse_days(value: Optional[str]) -> Optional[float]:
+    """Parse an age in days; empty or 'never' disables the policy."""
+    if value is None or str(value).strip().lower() in ("", "never", "none"):
+        return None
+    return float(value)
+
+ARCHIVE_DB_PATH = os.getenv("CHAINLIT_ARCHIVE_DB_PATH", "./chatbot-archive.db")
+DELETE_AFTER_DAYS = parse_days(os.getenv("CHAINLIT_DELETE_AFTER_DAYS", ""))
+ARCHIVE_AFTER_DAYS = parse_days(os.getenv("CHAINLIT_ARCHIVE_AFTER_DAYS", "90"))
+COMPACT_AFTER_DAYS = parse_days(os.getenv("CHAINLIT_COMPACT_AFTER_DAYS", "7"))
+MAX_PAYLOAD_CHARS = int(os.getenv("CHAINLIT_MAX_PAYLOAD_CHARS", "4000"))
+
+# Characters of a compacted payload left in place so the step still reads
+# sensibly in the UI.
+PREVIEW_CHARS = 500
+BATCH_THREADS = 20
+BATCH_PAUSE = 0.05
+BUSY_TIMEOUT_MS = 30000
+VACUUM_PAGES_PER_STEP = 1000
+
+MESSAGE_TYPES = ("user_message", "assistant_message")
+
+def _cutoff(days: float) -> str:
+    moment = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=days)
+    return moment.isoformat() + "Z"
+
+def _marks(values: Sequence[Any]) -> str:
+    return ", ".join("?" * len(values))
+
+def _batches(items: List[str], size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _last_activity(schema: str) -> str:
+    # The MAX subquery is answered from idx_steps_thread_created.
+    return f"""COALESCE(
+        (SELECT MAX(s."createdAt") FROM {schema}.steps s WHERE s."threadId" = t."id"),
+        t."createdAt"
+    )"""
+
+async def _cold_threads(
+    db: aiosqlite.Connection,
+    schema: str,
+    cutoff: str,
+    where: str = "1 = 1",
+    params: Sequence[Any] = ()
+) -> List[str]:
+    """Threads in ``schema`` with no activity since ``cutoff``."""
+    cursor = await db.execute(
+        f'SELECT t."id" FROM {schema}.threads t WHERE {where} AND {_last_activity(schema)} < ?',
+        (*params, cutoff)
+    )
+    return [row[0] for row in await cursor.fetchall()]
+
+async def _still_cold(db: aiosqlite.Connection, schema: str, ids: List[str], cutoff: str) -> List[str]:
+    """Drop threads that saw activity since they were selected."""
+    return await _cold_threads(db, schema, cutoff, f't."id" IN ({_marks(ids)})', ids)
+
+async def _columns(db: aiosqlite.Connection, schema: str, table: str) -> List[str]:
+    cursor = await db.execute(f"PRAGMA {schema}.table_info({table})")
+    return [row[1] for row in await cursor.fetchall()]
+
+async def _copy_threads(db: aiosqlite.Connection, ids: List[str], source: str, dest: str):
+    """Copy threads with their steps, elements, feedbacks and owners."""
+    marks = _marks(ids)
+    scopes = {
+        "users": (f'"id" IN (SELECT "userId" FROM {source}.threads WHERE "id" IN ({marks}))', "OR IGNORE"),
+        "threads": (f'"id" IN ({marks})', "OR REPLACE"),
+        "steps": (f'"threadId" IN ({marks})', "OR REPLACE"),
+        "elements": (f'"threadId" IN ({marks})', "OR REPLACE"),
+        "feedbacks": (f'"forId" IN (SELECT "id" FROM {source}.steps WHERE "threadId" IN ({marks}))', "OR REPLACE"),
+    }
+    for table, (where, conflict) in scopes.items():
+        dest_columns = set(await _columns(db, dest, table))
+        columns = ", ".join(f'"{c}"' for c in await _columns(db, source, table) if c in dest_columns)
+        await db.execute(
+            f"INSERT {conflict} INTO {dest}.{table} ({columns}) SELECT {columns} FROM {source}.{table} WHERE {where}",
+            ids
+        )
+
+async def _delete_threads(db: aiosqlite.Connection, schema: str, ids: List[str]):
+    marks = _marks(ids)
+    await db.execute(
+        f'DELETE FROM {schema}.feedbacks WHERE "forId" IN (SELECT "id" FROM {schema}.steps WHERE "threadId" IN ({marks}))',
+        ids
+    )
+    await db.execute(f'DELETE FROM {schema}.elements WHERE "threadId" IN ({marks})', ids)
+    await db.execute(f'DELETE FROM {schema}.steps WHERE "threadId" IN ({marks})', ids)
+    await db.execute(f'DELETE FROM {schema}.threads WHERE "id" IN ({marks})', ids)
+
+async def _delete_payloads(db: aiosqlite.Connection, schema: str, ids: List[str]):
+    """Drop the archived originals of compacted payloads of threads in ``schema``."""
+    marks = _marks(ids)
+    await db.execute(
+        f'''DELETE FROM archive.step_payloads WHERE "threadId" IN ({marks})
+        OR "stepId" IN (SELECT "id" FROM {schema}.steps WHERE "threadId" IN ({marks}))''',
+        (*ids, *ids)
+    )
+
+def _compacted(value: str) -> str:
+    return value[:PREVIEW_CHARS] + f"\n… [{len(value) - PREVIEW_CHARS} characters compacted]"
+
+class DatabaseMaintenance:
+    """
+    One maintenance pass over the live database and its archive.
+    
+    Passes run in order: retention deletes, archival of cold threads,
+    payload compaction, then incremental vacuum and a WAL checkpoint. Reads
+    run in deferred transactions and every write transaction covers at most
+    ``batch_size`` threads, so the app's writer waits at most one short batch.
+    """
+    
+    def __init__(
+        self,
+        db_path: str = DB_PATH,
+        archive_path: str = ARCHIVE_DB_PATH,
+        delete_after: Optional[float] = DELETE_AFTER_DAYS,
+        user_policies: Optional[Dict[str, Optional[float]]] = None,
+        archive_after: Optional[float] = ARCHIVE_AFTER_DAYS,
+        compact_after: Optional[float] = COMPACT_AFTER_DAYS,
+        max_payload: int = MAX_PAYLOAD_CHARS,
+        keep_payloads: bool = True,
+        batch_size: int = BATCH_THREADS,
+        pause: float = BATCH_PAUSE,
+        dry_run: bool = False
+    ):
+        """
+        Args:
+            db_path: Live database
+            archive_path: Archive database; created with the live schema if missing
+            delete_after: Delete threads idle for this many days (None keeps them)
+            user_policies: Per-user-identifier overrides of ``delete_after``
+            archive_after: Move threads idle for this many days to the archive
+            compact_after: Compact payloads of threads idle for this many days
+            max_payload: Tool/run step inputs and outputs longer than this are compacted
+            keep_payloads: Store compacted payloads zlib-compressed in the archive
+            batch_size: Threads per write transaction
+            pause: Seconds to yield to the app between batches
+            dry_run: Only count what would change
+        """
+        self.db_path = db_path
+        self.archive_path = archive_path
+        self.delete_after = delete_after
+        self.user_policies = user_policies or {}
+        self.archive_after = archive_after
+        self.compact_after = compact_after
+        self.max_payload = max(max_payload, PREVIEW_CHARS * 2)
+        self.keep_payloads = keep_payloads
+        self.batch_size = max(1, batch_size)
+        self.pause = pause
+        self.dry_run = dry_run
+        self.stats: Dict[str, int] = {
+            "deleted_threads": 0,
+            "deleted_archived_threads": 0,
+            "archived_threads": 0,
+            "compacted_steps": 0,
+            "compacted_chars": 0,
+            "vacuumed_pages": 0,
+        }
+        self.db: Optional[aiosqlite.Connection] = None
+        self.has_archive = False
+    
+    async def _connect(self) -> aiosqlite.Connection:
+        # Explicit BEGIN/COMMIT below, so autocommit at the driver level.
+        db = await aiosqlite.connect(self.db_path, isolation_level=None)
+        await db.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        
+        if not self.dry_run and not os.path.exists(self.archive_path):
+            await init_database(self.archive_path)
+        
+        if os.path.exists(self.archive_path):
+            await db.execute("ATTACH DATABASE ? AS archive", (self.archive_path,))
+            self.has_archive = True
+            if not self.dry_run:
+                await db.execute("""
+                    CREATE TABLE IF NOT EXISTS archive.step_payloads (
+                        "stepId" TEXT NOT NULL,
+                        "field" TEXT NOT NULL,
+                        "threadId" TEXT,
+                        "data" BLOB,
+                        "compactedAt" TEXT,
+                        PRIMARY KEY("stepId", "field")
+                    )
+                """)
+        return db
+    
+    async def _write(self, statements):
+        """Run ``statements(db)`` in one IMMEDIATE transaction."""
+        assert self.db is not None
+        await self.db.execute("BEGIN IMMEDIATE")
+        try:
+            result = await statements(self.db)
+            await self.db.execute("COMMIT")
+            return result
+        except BaseException:
+            await self.db.execute("ROLLBACK")
+            raise
+    
+    def _retention_rules(self) -> List[Tuple[str, str, List[Any]]]:
+        """(cutoff, WHERE clause, params) per retention policy."""
+        rules = []
+        for identifier, days in self.user_policies.items():
+            if days is not None:
+                rules.append((_cutoff(days), 't."userIdentifier" = ?', [identifier]))
+        if self.delete_after is not None:
+            listed = list(self.user_policies)
+            where = f'COALESCE(t."userIdentifier", \'\') NOT IN ({_marks(listed)})' if listed else "1 = 1"
+            rules.append((_cutoff(self.delete_after), where, listed))
+        return rules
+    
+    async def apply_retention(self):
+        assert self.db is not None
+        schemas = ["main", "archive"] if self.has_archive else ["main"]
+        for cutoff, where, params in self._retention_rules():
+            for schema in schemas:
+                ids = await _cold_threads(self.db, schema, cutoff, where, params)
+                key = "deleted_threads" if schema == "main" else "deleted_archived_threads"
+                if self.dry_run:
+                    self.stats[key] += len(ids)
+                    continue
+                for batch in _batches(ids, self.batch_size):
+                    async def delete(db, batch=batch, schema=schema):
+                        cold = await _still_cold(db, schema, batch, cutoff)
+                        if cold:
+                            # Retention also purges the originals that
+                            # compaction kept; archival moves leave them.
+                            await _delete_payloads(db, schema, cold)
+                            await _delete_threads(db, schema, cold)
+                        return len(cold)
+                    self.stats[key] += await self._write(delete)
+                    await asyncio.sleep(self.pause)
+    
+    async def archive_threads(self):
+        assert self.db is not None
+        if self.archive_after is None:
+            return
+        cutoff = _cutoff(self.archive_after)
+        ids = await _cold_threads(self.db, "main", cutoff)
+        if self.dry_run:
+            self.stats["archived_threads"] += len(ids)
+            return
+        
+        for batch in _batches(ids, self.batch_size):
+            # The copy only reads the live database, so it runs deferred.
+            # It commits before the delete: a crash in between leaves a
+            # duplicate in the archive, never a lost thread.
+            await self.db.execute("BEGIN")
+            try:
+                await _copy_threads(self.db, batch, "main", "archive")
+                await self.db.execute("COMMIT")
+            except BaseException:
+                await self.db.execute("ROLLBACK")
+                raise
+            
+            async def move(db, batch=batch):
+                cold = await _still_cold(db, "main", batch, cutoff)
+                if cold:
+                    await _delete_threads(db, "main", cold)
+                return cold
+            moved = set(await self._write(move))
+            self.stats["archived_threads"] += len(moved)
+            
+            # Threads resumed mid-batch stay live; drop their stale copies.
+            warmed = [thread_id for thread_id in batch if thread_id not in moved]
+            if warmed:
+                await self._write(lambda db: _delete_threads(db, "archive", warmed))
+            await asyncio.sleep(self.pause)
+    
+    async def compact_payloads(self):
+        assert self.db is not None
+        if self.compact_after is None:
+            return
+        cutoff = _cutoff(self.compact_after)
+        ids = await _cold_threads(self.db, "main", cutoff)
+        now = _cutoff(0)
+        
+        for batch in _batches(ids, self.batch_size):
+            cursor = await self.db.execute(
+                f"""
+                SELECT "id", "threadId", "input", "output" FROM main.steps
+                WHERE "threadId" IN ({_marks(batch)})
+                AND "type" NOT IN ({_marks(MESSAGE_TYPES)})
+                AND (length("input") > ? OR length("output") > ?)
+                """,
+                (*batch, *MESSAGE_TYPES, self.max_payload, self.max_payload)
+            )
+            rows = await cursor.fetchall()
+            updates = []
+            for step_id, thread_id, *values in rows:
+                for field, value in zip(("input", "output"), values):
+                    if isinstance(value, str) and len(value) > self.max_payload:
+                        updates.append((step_id, thread_id, field, value))
+            if not updates:
+                continue
+            
+            self.stats["compacted_steps"] += len({u[0] for u in updates})
+            self.stats["compacted_chars"] += sum(len(u[3]) - PREVIEW_CHARS for u in updates)
+            if self.dry_run:
+                continue
+            
+            if self.keep_payloads:
+                await self._write(lambda db: db.executemany(
+                    'INSERT OR REPLACE INTO archive.step_payloads VALUES (?, ?, ?, ?, ?)',
+                    [
+                        (step_id, field, thread_id, zlib.compress(value.encode("utf-8")), now)
+                        for step_id, thread_id, field, value in updates
+                    ]
+                ))
+            
+            async def compact(db, batch=batch, updates=updates):
+                cold = set(await _still_cold(db, "main", batch, cutoff))
+                for step_id, thread_id, field, value in updates:
+                    if thread_id in cold:
+                        await db.execute(
+                            f'UPDATE main.steps SET "{field}" = ? WHERE "id" = ?',
+                            (_compacted(value), step_id)
+                        )
+            await self._write(compact)
+            await asyncio.sleep(self.pause)
+    
+    async def vacuum(self, schema: str = "main"):
+        """Return free pages to the filesystem a slice at a time."""
+        assert self.db is not None
+        mode = (await (await self.db.execute(f"PRAGMA {schema}.auto_vacuum")).fetchone())[0]
+        if mode != 2:
+            print(f"ℹ️  {schema}: auto_vacuum is not INCREMENTAL; run once with --enable-incremental-vacuum")
+            return
+        while not self.dry_run:
+            free = (await (await self.db.execute(f"PRAGMA {schema}.freelist_count")).fetchone())[0]
+            if not free:
+                break
+            # execute() stops after the first freed page; a script runs
+            # the pragma to completion.
+            await self.db.executescript(f"PRAGMA {schema}.incremental_vacuum({VACUUM_PAGES_PER_STEP})")
+            left = (await (await self.db.execute(f"PRAGMA {schema}.freelist_count")).fetchone())[0]
+            self.stats["vacuumed_pages"] += free - left
+            if left >= free:
+                break
+            await asyncio.sleep(self.pause)
+    
+    async def run(self) -> Dict[str, int]:
+        self.db = await self._connect()
+        try:
+            await self.apply_retention()
+            await self.archive_threads()
+            await self.compact_payloads()
+            await self.vacuum("main")
+            if self.has_archive:
+                await self.vacuum("archive")
+            if not self.dry_run:
+                await self.db.execute("PRAGMA main.wal_checkpoint(PASSIVE)")
+                await self.db.execute("PRAGMA optimize")
+        finally:
+            await self.db.close()
+            self.db = None
+        return self.stats
+
+async def enable_incremental_vacuum(db_path: str):
+    """Switch a database to incremental auto-vacuum; rewrites the whole file."""
+    async with aiosqlite.connect(db_path, isolation_level=None) as db:
+        await db.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        await db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        await db.execute("VACUUM")
+
+def _user_policy(value: str) -> Tuple[str, Optional[float]]:
+    identifier, sep, days = value.rpartition("=")
+    if not sep or not identifier:
+        raise argparse.ArgumentTypeError(f"expected IDENTIFIER=DAYS, got '{value}'")
+    return identifier, parse_days(days)
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Chainlit database retention, compaction and archival")
+    parser.add_argument("--db", default=DB_PATH, help="Live database")
+    parser.add_argument("--archive", default=ARCHIVE_DB_PATH, help="Archive database")
+    parser.add_argument("--delete-after", type=parse_days, default=DELETE_AFTER_DAYS, metavar="DAYS",
+                        help="Delete threads idle this long, from the live database and the archive")
+    parser.add_argument("--user", type=_user_policy, action="append", default=[], metavar="IDENTIFIER=DAYS",
+                        help="Per-user --delete-after override ('never' keeps the user's threads)")
+    parser.add_argument("--archive-after", type=parse_days, default=ARCHIVE_AFTER_DAYS, metavar="DAYS",
+                        help="Move threads idle this long to the archive")
+    parser.add_argument("--compact-after", type=parse_days, default=COMPACT_AFTER_DAYS, metavar="DAYS",
+                        help="Compact large tool payloads of threads idle this long")
+    parser.add_argument("--max-payload", type=int, default=MAX_PAYLOAD_CHARS, metavar="CHARS",
+                        help="Step inputs/outputs longer than this are compacted")
+    parser.add_argument("--strip", action="store_true",
+                        help="Discard compacted payloads instead of keeping them compressed in the archive")
+    parser.add_argument("--batch-size", type=int, default=BATCH_THREADS, help="Threads per write transaction")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                        help="One-off: rewrite the database for incremental vacuum (blocks writers while it runs)")
+    args = parser.parse_args(argv)
+    
+    if args.enable_incremental_vacuum:
+        asyncio.run(enable_incremental_vacuum(args.db))
+        print(f"✅ {args.db} now uses incremental auto-vacuum")
+        return
+    
+    stats = asyncio.run(DatabaseMaintenance(
+        db_path=args.db,
+        archive_path=args.archive,
+        delete_after=args.delete_after,
+        user_policies=dict(args.user),
+        archive_after=args.archive_after,
+        compact_after=args.compact_after,
+        max_payload=args.max_payload,
+        keep_payloads=not args.strip,
+        batch_size=args.batch_size,
+        dry_run=args.dry_run
+    ).run())
+    
+    print(("🔎 Dry run: " if args.dry_run else "✅ Maintenance complete: ") + ", ".join(
+        f"{name.replace('_', ' ')}={value}" for name, value in stats.items()
+    ))
+
+if __name__ == "__main__":
+    main()
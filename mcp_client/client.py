@@ -1,20 +1,673 @@
 import os
 import json
-from typing import Dict, List, Any
-from langchain_core.tools import BaseTool
+import math
+import time
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, List, Any, AsyncIterator, Callable, Optional, Tuple
+from langchain_core.tools import BaseTool, StructuredTool
 from langchain_mcp_adapters.client import MultiServerMCPClient
+from langchain_mcp_adapters.sessions import create_session
+from langchain_mcp_adapters.tools import convert_mcp_tool_to_langchain_tool
+from mcp import ClientSession
+from mcp.shared.exceptions import McpError
+from mcp.types import TextContent
+
+from utils.metrics import METRICS, current_span, span
+from utils.tokens import CHARS_PER_TOKEN, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+MCP_CONFIG_POLL_INTERVAL = float(os.getenv("MCP_CONFIG_POLL_INTERVAL", "5"))
+MCP_RETRY_INTERVAL = float(os.getenv("MCP_RETRY_INTERVAL", "60"))
+MCP_TOOL_CACHE_SIZE = int(os.getenv("MCP_TOOL_CACHE_SIZE", "1024"))
+MCP_CALL_TIMEOUT = float(os.getenv("MCP_CALL_TIMEOUT", "60"))
+MCP_TOOL_OUTPUT_TOKENS = int(os.getenv("MCP_TOOL_OUTPUT_TOKENS", "2000"))
+MCP_TOOL_OUTPUT_STORE_SIZE = int(os.getenv("MCP_TOOL_OUTPUT_STORE_SIZE", "256"))
+MCP_TOOL_OUTPUT_TTL = float(os.getenv("MCP_TOOL_OUTPUT_TTL", "3600"))
+
+DEFAULT_POOL_CONFIG = {
+    "size": 1,
+    "min_idle": 1,
+    "idle_timeout": 300.0,
+    "health_check_interval": 30.0,
+    "connect_timeout": 30.0,
+    "call_timeout": MCP_CALL_TIMEOUT,
+}
+
+
+class PooledSession:
+    """A long-lived MCP session owned by a dedicated task.
+    
+    The transport context is entered and exited inside ``_run`` so that the
+    anyio cancel scopes of the stdio/http clients never cross task boundaries.
+    """
+    
+    def __init__(self, connection: Dict[str, Any]):
+        self.connection = connection
+        self.session: ClientSession | None = None
+        self.broken = False
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self._closing = asyncio.Event()
+        self._task: asyncio.Task | None = None
+    
+    @property
+    def alive(self) -> bool:
+        return (
+            self.session is not None
+            and not self.broken
+            and self._task is not None
+            and not self._task.done()
+        )
+    
+    async def open(self, timeout: float):
+        ready = asyncio.get_running_loop().create_future()
+        self._task = asyncio.create_task(self._run(ready))
+        try:
+            await asyncio.wait_for(ready, timeout)
+        except BaseException:
+            self._closing.set()
+            self._task.cancel()
+            raise
+    
+    async def _run(self, ready: asyncio.Future):
+        try:
+            async with create_session(self.connection) as session:  # type: ignore
+                await session.initialize()
+                self.session = session
+                ready.set_result(None)
+                await self._closing.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                logger.warning("MCP session terminated: %s", e)
+        finally:
+            self.session = None
+    
+    async def ping(self, timeout: float):
+        if self.session is None:
+            raise RuntimeError("Session is not open")
+        await asyncio.wait_for(self.session.send_ping(), timeout)
+    
+    async def close(self):
+        self._closing.set()
+        if self._task is None or self._task.done():
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), 5.0)
+        except (asyncio.TimeoutError, Exception):
+            self._task.cancel()
+
+
+class MCPSessionPool:
+    """Keeps up to ``size`` warm sessions for one MCP server.
+    
+    ``size`` is also the server's concurrency limit: at most that many tool
+    calls run at once and the rest queue for a session. Each call, queueing
+    included, is bounded by ``call_timeout`` seconds. Idle sessions are
+    health-checked with MCP pings, evicted after ``idle_timeout`` seconds (down
+    to ``min_idle``) and respawned when they die.
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        connection: Dict[str, Any],
+        size: int = 1,
+        min_idle: int = 1,
+        idle_timeout: float = 300.0,
+        health_check_interval: float = 30.0,
+        connect_timeout: float = 30.0,
+        call_timeout: float = MCP_CALL_TIMEOUT,
+    ):
+        self.name = name
+        self.connection = connection
+        self.size = max(1, size)
+        self.min_idle = max(0, min(min_idle, self.size))
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.connect_timeout = connect_timeout
+        self.call_timeout = call_timeout
+        self._idle: List[PooledSession] = []
+        self._sessions: set[PooledSession] = set()
+        self._slots = asyncio.Semaphore(self.size)
+        self._maintenance_task: asyncio.Task | None = None
+        self._closed = False
+        self.spawned = 0
+        self.evicted = 0
+        self.timeouts = 0
+    
+    async def start(self):
+        await self._fill_min_idle()
+        if self._maintenance_task is None and self.health_check_interval > 0:
+            self._maintenance_task = asyncio.create_task(self._maintain())
+    
+    async def _spawn(self) -> PooledSession:
+        pooled = PooledSession(self.connection)
+        with span("mcp.spawn", server=self.name):
+            await pooled.open(self.connect_timeout)
+        self._sessions.add(pooled)
+        self.spawned += 1
+        return pooled
+    
+    def _discard(self, pooled: PooledSession):
+        self._sessions.discard(pooled)
+        self.evicted += 1
+        asyncio.create_task(pooled.close())
+    
+    async def _fill_min_idle(self):
+        while not self._closed and len(self._sessions) < self.min_idle:
+            self._idle.append(await self._spawn())
+    
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[PooledSession]:
+        if self._closed:
+            raise RuntimeError(f"Session pool for '{self.name}' is closed")
+        
+        with span("mcp.acquire", server=self.name):
+            await self._slots.acquire()
+        pooled = None
+        try:
+            while self._idle:
+                candidate = self._idle.pop()
+                if candidate.alive:
+                    pooled = candidate
+                    break
+                self._discard(candidate)
+            
+            if pooled is None:
+                pooled = await self._spawn()
+            
+            yield pooled
+        finally:
+            if pooled is not None:
+                if pooled.alive and not self._closed:
+                    pooled.last_used = time.monotonic()
+                    self._idle.append(pooled)
+                else:
+                    self._discard(pooled)
+            self._slots.release()
+    
+    async def call_tool(self, name: str, arguments: Dict[str, Any]):
+        if self.call_timeout <= 0:
+            return await self._call_tool(name, arguments)
+        try:
+            return await asyncio.wait_for(self._call_tool(name, arguments), self.call_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise TimeoutError(
+                f"Tool '{name}' on '{self.name}' timed out after {self.call_timeout:g}s"
+            ) from None
+    
+    async def _call_tool(self, name: str, arguments: Dict[str, Any]):
+        for attempt in range(2):
+            async with self.acquire() as pooled:
+                try:
+                    with span("mcp.execute", server=self.name, tool=name):
+                        return await pooled.session.call_tool(name, arguments)  # type: ignore
+                except McpError:
+                    raise
+                except asyncio.CancelledError:
+                    # The server may still answer the abandoned request, so
+                    # the session is not reused.
+                    pooled.broken = True
+                    raise
+                except Exception:
+                    # Transport-level failure: drop the session and retry once
+                    # on a freshly spawned one.
+                    pooled.broken = True
+                    if attempt:
+                        raise
+    
+    async def list_tools(self) -> List[Any]:
+        tools = []
+        async with self.acquire() as pooled:
+            result = await pooled.session.list_tools()  # type: ignore
+            tools.extend(result.tools)
+            while result.nextCursor:
+                result = await pooled.session.list_tools(cursor=result.nextCursor)  # type: ignore
+                tools.extend(result.tools)
+        return tools
+    
+    async def _maintain(self):
+        while not self._closed:
+            await asyncio.sleep(self.health_check_interval)
+            try:
+                await self._check_idle_sessions()
+                await self._fill_min_idle()
+            except Exception as e:
+                logger.warning("MCP pool '%s' maintenance failed: %s", self.name, e)
+    
+    async def _check_idle_sessions(self):
+        now = time.monotonic()
+        keep: List[PooledSession] = []
+        for pooled in list(self._idle):
+            if pooled not in self._idle:
+                continue
+            expired = now - pooled.last_used > self.idle_timeout
+            if not pooled.alive or (expired and len(keep) >= self.min_idle):
+                self._idle.remove(pooled)
+                self._discard(pooled)
+                continue
+            try:
+                await pooled.ping(self.connect_timeout)
+                keep.append(pooled)
+            except Exception:
+                pooled.broken = True
+                if pooled in self._idle:
+                    self._idle.remove(pooled)
+                    self._discard(pooled)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "size": self.size,
+            "open": len(self._sessions),
+            "idle": len(self._idle),
+            "in_use": len(self._sessions) - len(self._idle),
+            "spawned": self.spawned,
+            "evicted": self.evicted,
+            "timeouts": self.timeouts,
+        }
+    
+    async def close(self):
+        self._closed = True
+        if self._maintenance_task:
+            self._maintenance_task.cancel()
+            self._maintenance_task = None
+        sessions = list(self._sessions)
+        self._idle.clear()
+        self._sessions.clear()
+        await asyncio.gather(*(s.close() for s in sessions), return_exceptions=True)
+
+
+class PooledSessionInterceptor:
+    """Innermost tool interceptor that runs calls on a pooled session
+    instead of letting the adapter spawn a fresh one per call."""
+    
+    def __init__(self, pools: Dict[str, MCPSessionPool]):
+        self.pools = pools
+    
+    async def __call__(self, request, handler):
+        pool = self.pools.get(request.server_name)
+        if pool is None:
+            return await handler(request)
+        return await pool.call_tool(request.name, request.args)
+
+
+def tool_call_key(server: str, tool: str, arguments: Dict[str, Any]) -> Tuple[str, str, str]:
+    """Identify a tool call by server, tool and canonical JSON of its arguments."""
+    return (
+        server,
+        tool,
+        json.dumps(arguments, sort_keys=True, separators=(",", ":"), default=str)
+    )
+
+
+class ToolResultCache:
+    """
+    Process-wide LRU cache of tool results with per-tool TTLs.
+    
+    Entries are keyed on server, tool and canonical JSON of the arguments, so
+    every session shares them. TTLs come from the ``cache`` block of a server
+    in mcp.json: ``ttl`` applies to all of its tools and ``tools`` overrides
+    it per tool. A TTL is a number of seconds or ``"forever"``; tools without
+    a positive TTL are not cached.
+    """
+    
+    def __init__(self, max_entries: int = MCP_TOOL_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Tuple[str, str, str], Tuple[float, Any]] = OrderedDict()
+        self._rules: Dict[str, Dict[str, Any]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+    
+    @staticmethod
+    def _parse_ttl(value: Any) -> Optional[float]:
+        if value == "forever":
+            return math.inf
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0:
+            return float(value)
+        return None
+    
+    def configure(self, server: str, config: Dict[str, Any]):
+        """Set a server's TTLs from its mcp.json ``cache`` block and drop its entries."""
+        self.invalidate(server)
+        if not config:
+            self._rules.pop(server, None)
+            return
+        self._rules[server] = {
+            "ttl": self._parse_ttl(config.get("ttl")),
+            "tools": {
+                tool: self._parse_ttl(ttl)
+                for tool, ttl in config.get("tools", {}).items()
+            },
+        }
+    
+    def ttl(self, server: str, tool: str) -> Optional[float]:
+        rules = self._rules.get(server)
+        if rules is None:
+            return None
+        return rules["tools"].get(tool, rules["ttl"])
+    
+    def get(self, key: Tuple[str, str, str]) -> Tuple[bool, Any]:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[1]
+        if entry is not None:
+            del self._entries[key]
+        self.misses += 1
+        return False, None
+    
+    def put(self, key: Tuple[str, str, str], value: Any, ttl: float):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evicted += 1
+    
+    def invalidate(self, server: Optional[str] = None):
+        if server is None:
+            self._entries.clear()
+            return
+        for key in [key for key in self._entries if key[0] == server]:
+            del self._entries[key]
+    
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evicted": self.evicted,
+        }
+
+
+class ToolOutputStore:
+    """
+    Full text of tool outputs that were too large for the agent context.
+    
+    Each oversized output gets a handle; ``read_tool_output`` pages through it
+    in pages of the tool's budget. Entries are evicted least-recently-used
+    beyond ``max_entries`` and expire after ``ttl`` seconds. Budgets come from
+    the ``output`` block of a server in mcp.json: ``max_tokens`` applies to all
+    of its tools (default ``MCP_TOOL_OUTPUT_TOKENS``) and ``tools`` overrides it
+    per tool; 0 leaves a tool's output untouched.
+    """
+    
+    def __init__(self, max_entries: int = MCP_TOOL_OUTPUT_STORE_SIZE, ttl: float = MCP_TOOL_OUTPUT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, Tuple[float, str, int]] = OrderedDict()
+        self._rules: Dict[str, Dict[str, Any]] = {}
+        self.truncated = 0
+        self.tokens_saved = 0
+        self.pages_read = 0
+        self.evicted = 0
+    
+    def configure(self, server: str, config: Optional[Dict[str, Any]]):
+        if config is None:
+            self._rules.pop(server, None)
+            return
+        self._rules[server] = {
+            "max_tokens": int(config.get("max_tokens", MCP_TOOL_OUTPUT_TOKENS)),
+            "tools": {tool: int(tokens) for tool, tokens in config.get("tools", {}).items()},
+        }
+    
+    def budget(self, server: str, tool: str) -> int:
+        rules = self._rules.get(server)
+        if rules is None:
+            return MCP_TOOL_OUTPUT_TOKENS
+        return rules["tools"].get(tool, rules["max_tokens"])
+    
+    def enabled(self) -> bool:
+        return any(
+            rules["max_tokens"] > 0 or any(tokens > 0 for tokens in rules["tools"].values())
+            for rules in self._rules.values()
+        )
+    
+    def put(self, tool: str, text: str, page_tokens: int) -> str:
+        handle = f"{tool}-{uuid.uuid4().hex[:10]}"
+        self._entries[handle] = (time.monotonic() + self.ttl, text, page_tokens)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evicted += 1
+        return handle
+    
+    def pages(self, text: str, page_tokens: int) -> int:
+        return max(1, math.ceil(len(text) / (page_tokens * CHARS_PER_TOKEN)))
+    
+    def read(self, handle: str, page: int = 1) -> str:
+        """Page ``page`` (1-based) of a stored output, with a header saying where it is."""
+        entry = self._entries.get(handle)
+        if entry is None or entry[0] <= time.monotonic():
+            self._entries.pop(handle, None)
+            return f"Error: no stored tool output '{handle}' (it may have expired); call the tool again."
+        self._entries.move_to_end(handle)
+        _, text, page_tokens = entry
+        pages = self.pages(text, page_tokens)
+        if not 1 <= page <= pages:
+            return f"Error: '{handle}' has pages 1-{pages}."
+        
+        self.pages_read += 1
+        size = int(page_tokens * CHARS_PER_TOKEN)
+        return f"[{handle} page {page} of {pages}]\n" + text[(page - 1) * size:page * size]
+    
+    def as_tool(self) -> BaseTool:
+        async def read_tool_output(handle: str, page: int = 1) -> str:
+            with span("mcp.tool", server="tool_outputs", tool="read_tool_output"):
+                return self.read(handle, page)
+        
+        return StructuredTool.from_function(
+            coroutine=read_tool_output,
+            name="read_tool_output",
+            description=(
+                "Read one page of a tool output that was shortened because it was too large. "
+                "Pass the handle from the shortened output and a 1-based page number."
+            )
+        )
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "truncated": self.truncated,
+            "tokens_saved": self.tokens_saved,
+            "pages_read": self.pages_read,
+            "evicted": self.evicted,
+        }
+
+
+def _cut(text: str, max_chars: int, from_end: bool = False) -> str:
+    """At most ``max_chars`` of one end of ``text``, cut at a line break or
+    space when there is one near the limit."""
+    if len(text) <= max_chars:
+        return text
+    piece = text[-max_chars:] if from_end else text[:max_chars]
+    breaks = [piece.find(sep) if from_end else piece.rfind(sep) for sep in ("\n", " ")]
+    for at in breaks:
+        if at >= 0 and (at < max_chars // 5 if from_end else at > max_chars * 4 // 5):
+            return piece[at + 1:] if from_end else piece[:at]
+    return piece
+
+
+class ToolOutputBudgetInterceptor:
+    """Tool interceptor that keeps each tool output within its token budget.
+    
+    An output over budget is replaced by its beginning and end (about three
+    quarters and a quarter of the budget) and a note with its size and a
+    handle into ``ToolOutputStore``, so the agent can page through the rest
+    with ``read_tool_output`` only if it needs to. Non-text content and error
+    results pass through unchanged.
+    """
+    
+    def __init__(self, store: ToolOutputStore):
+        self.store = store
+    
+    async def __call__(self, request, handler):
+        result = await handler(request)
+        budget = self.store.budget(request.server_name, request.name)
+        content = getattr(result, "content", None)
+        if budget <= 0 or not content or getattr(result, "isError", False):
+            return result
+        
+        text = "\n".join(block.text for block in content if isinstance(block, TextContent))
+        tokens = estimate_tokens(text)
+        if tokens <= budget:
+            return result
+        
+        handle = self.store.put(request.name, text, budget)
+        pages = self.store.pages(text, budget)
+        max_chars = int(budget * CHARS_PER_TOKEN)
+        head = _cut(text, max_chars * 3 // 4)
+        tail = _cut(text[len(head):], max_chars // 4, from_end=True)
+        shown = estimate_tokens(head) + estimate_tokens(tail)
+        note = (
+            f"\n\n[... output shortened: showing about {shown} of {tokens} tokens. "
+            f"The full output is stored as '{handle}' in {pages} pages; call "
+            f"read_tool_output(handle='{handle}', page=N) to read more ...]\n\n"
+        )
+        others = [block for block in content if not isinstance(block, TextContent)]
+        
+        self.store.truncated += 1
+        self.store.tokens_saved += tokens - shown
+        METRICS.count("chatbot_tool_output_truncated_total", tool=request.name)
+        METRICS.count("chatbot_tool_output_tokens_saved_total", tokens - shown, tool=request.name)
+        traced = current_span()
+        if traced is not None:
+            traced.attrs.update(truncated=True, output_tokens=tokens)
+        return result.model_copy(update={"content": [TextContent(type="text", text=head + note + tail), *others]})
+
+
+class ToolTracingInterceptor:
+    """Outermost tool interceptor that records each call as an ``mcp.tool``
+    span; the cache, coalescing and pool layers annotate it or add children."""
+    
+    async def __call__(self, request, handler):
+        with span("mcp.tool", server=request.server_name, tool=request.name):
+            return await handler(request)
+
+
+class ToolResultCacheInterceptor:
+    """Outermost tool interceptor that answers repeated calls from
+    ``ToolResultCache`` without a round trip to the server."""
+    
+    def __init__(self, cache: ToolResultCache):
+        self.cache = cache
+    
+    async def __call__(self, request, handler):
+        ttl = self.cache.ttl(request.server_name, request.name)
+        if ttl is None:
+            return await handler(request)
+        
+        key = tool_call_key(request.server_name, request.name, request.args)
+        found, result = self.cache.get(key)
+        traced = current_span()
+        if traced is not None:
+            traced.attrs["cache"] = "hit" if found else "miss"
+        if found:
+            return result
+        
+        result = await handler(request)
+        if not getattr(result, "isError", False):
+            self.cache.put(key, result, ttl)
+        return result
+
+
+class SingleFlightInterceptor:
+    """Tool interceptor that lets concurrent identical calls share one request.
+    
+    The first caller starts the call as a task; callers with the same tool and
+    arguments that arrive while it is in flight await the same task, and its
+    result or exception is delivered to all of them. Nothing is kept once the
+    call finishes, so coalescing never serves stale results. A caller that is
+    cancelled does not cancel the call for the others, but once every caller
+    has given up the call itself is cancelled.
+    """
+    
+    def __init__(self):
+        self._in_flight: Dict[Tuple[str, str, str], asyncio.Task] = {}
+        self._waiters: Dict[asyncio.Task, int] = {}
+        self.calls = 0
+        self.coalesced = 0
+        self.cancelled = 0
+    
+    async def __call__(self, request, handler):
+        key = tool_call_key(request.server_name, request.name, request.args)
+        task = self._in_flight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(handler(request))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.coalesced += 1
+            traced = current_span()
+            if traced is not None:
+                traced.attrs["coalesced"] = True
+        
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._waiters[task] == 1 and not task.done():
+                task.cancel()
+                self.cancelled += 1
+            raise
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+    
+    def _finish(self, key: Tuple[str, str, str], task: asyncio.Task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            task.exception()
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "cancelled": self.cancelled,
+            "in_flight": len(self._in_flight),
+        }
+
 
 class MCPClientManager:
     def __init__(self, config_path: str = "mcp.json"):
         self.config_path = config_path
         self.client: MultiServerMCPClient | None = None
         self.server_configs: Dict[str, Dict] = {}
+        self.connections: Dict[str, Dict[str, Any]] = {}
+        self.pools: Dict[str, MCPSessionPool] = {}
+        self.tool_cache = ToolResultCache()
+        self.single_flight = SingleFlightInterceptor()
+        self.output_store = ToolOutputStore()
+        self.output_tool = self.output_store.as_tool()
+        self.server_status: Dict[str, str] = {}
         self.tools: List[BaseTool] = []
+        self._server_tools: Dict[str, List[BaseTool]] = {}
+        self._last_attempt: Dict[str, float] = {}
+        self._config_mtime: float | None = None
+        self._tools_listeners: List[Callable[[List[BaseTool]], None]] = []
+        self._refresh_task: asyncio.Task | None = None
         
     def load_config(self) -> Dict:
         if not os.path.exists(self.config_path):
             raise FileNotFoundError(f"MCP config not found: {self.config_path}")
         
+        self._config_mtime = os.path.getmtime(self.config_path)
         with open(self.config_path, 'r') as f:
             config = json.load(f)
         
@@ -47,36 +700,159 @@ class MCPClientManager:
         else:
             raise ValueError(f"Unsupported transport type: {transport}")
     
-    async def initialize_all_servers(self):
-        self.server_configs = self.load_config()
-        
-        connections = {
-            name: self._build_connection_config(config)
-            for name, config in self.server_configs.items()
+    def _build_pool_config(self, config: Dict) -> Dict[str, Any]:
+        pool_config = {**DEFAULT_POOL_CONFIG, **config.get("pool", {})}
+        return {
+            "size": int(pool_config["size"]),
+            "min_idle": int(pool_config["min_idle"]),
+            "idle_timeout": float(pool_config["idle_timeout"]),
+            "health_check_interval": float(pool_config["health_check_interval"]),
+            "connect_timeout": float(pool_config["connect_timeout"]),
+            "call_timeout": float(pool_config["call_timeout"]),
         }
+    
+    def _build_tool_interceptors(self) -> List[Any]:
+        # Interceptors run outermost first.
+        return [
+            ToolTracingInterceptor(),
+            ToolOutputBudgetInterceptor(self.output_store),
+            ToolResultCacheInterceptor(self.tool_cache),
+            self.single_flight,
+            PooledSessionInterceptor(self.pools)
+        ]
+    
+    def _build_client(self):
+        self.client = MultiServerMCPClient(
+            self.connections,  # type: ignore
+            tool_interceptors=self._build_tool_interceptors()
+        )
         
-        try:
-            self.client = MultiServerMCPClient(connections)  # type: ignore
+    def _add_server(self, name: str, config: Dict):
+        self.server_configs[name] = config
+        self.connections[name] = self._build_connection_config(config)
+        self.pools[name] = MCPSessionPool(name, self.connections[name], **self._build_pool_config(config))
+        self.tool_cache.configure(name, config.get("cache", {}))
+        self.output_store.configure(name, config.get("output", {}))
+        self.server_status[name] = "starting"
             
-            results = [
-                {
-                    "name": name,
-                    "description": config.get("description", ""),
-                    "status": "connected"
-                }
-                for name, config in self.server_configs.items()
-            ]
-            
-            return results
+    async def _remove_server(self, name: str):
+        pool = self.pools.pop(name, None)
+        self.server_configs.pop(name, None)
+        self.connections.pop(name, None)
+        self.server_status.pop(name, None)
+        self._server_tools.pop(name, None)
+        self.tool_cache.configure(name, {})
+        self.output_store.configure(name, None)
+        if pool:
+            await pool.close()
+    
+    async def _start_server(self, name: str) -> str:
+        # Each server starts and lists its tools independently, so a slow or
+        # dead server only loses its own tools.
+        self._last_attempt[name] = time.monotonic()
+        try:
+            await self.pools[name].start()
+            self._server_tools[name] = await self._load_server_tools(name)
+            self.server_status[name] = "connected"
         except Exception as e:
-            return [
-                {
-                    "name": name,
-                    "description": config.get("description", ""),
-                    "status": f"error: {str(e)}"
-                }
-                for name, config in self.server_configs.items()
-            ]
+            self._server_tools.pop(name, None)
+            self.server_status[name] = f"error: {str(e) or type(e).__name__}"
+        return self.server_status[name]
+    
+    def _collect_tools(self):
+        self.tools = [
+            tool
+            for name in self.pools
+            for tool in self._server_tools.get(name, [])
+        ]
+        if self.tools and self.output_store.enabled():
+            self.tools.append(self.output_tool)
+        for listener in self._tools_listeners:
+            listener(self.tools)
+    
+    async def initialize_all_servers(self):
+        for name, config in self.load_config().items():
+            self._add_server(name, config)
+        self._build_client()
+        
+        await asyncio.gather(*(self._start_server(name) for name in self.pools))
+        self._collect_tools()
+        
+        return self.get_server_status()
+    
+    def get_server_status(self) -> List[Dict]:
+        return [
+            {
+                "name": name,
+                "description": self.server_configs[name].get("description", ""),
+                "status": self.server_status.get(name, "unknown"),
+                "tools": [tool.name for tool in self._server_tools.get(name, [])]
+            }
+            for name in self.pools
+        ]
+    
+    def add_tools_listener(self, listener: Callable[[List[BaseTool]], None]):
+        self._tools_listeners.append(listener)
+    
+    def _config_changed(self) -> bool:
+        try:
+            return os.path.getmtime(self.config_path) != self._config_mtime
+        except OSError:
+            return False
+    
+    async def refresh(self) -> bool:
+        """Apply mcp.json changes and retry failed servers.
+        
+        Only servers whose configuration changed, or that failed more than
+        ``MCP_RETRY_INTERVAL`` seconds ago, are restarted; healthy pools are
+        left untouched.
+        
+        Returns:
+            True if the tool list was rebuilt
+        """
+        configs = self.server_configs
+        if self._config_changed():
+            try:
+                configs = self.load_config()
+            except Exception as e:
+                logger.warning("Ignoring unreadable MCP config %s: %s", self.config_path, e)
+                return False
+        
+        now = time.monotonic()
+        removed = [name for name in self.server_configs if name not in configs]
+        restart = [
+            name for name, config in configs.items()
+            if self.server_configs.get(name) != config
+            or (
+                self.server_status.get(name, "").startswith("error")
+                and now - self._last_attempt.get(name, 0.0) >= MCP_RETRY_INTERVAL
+            )
+        ]
+        if not removed and not restart:
+            return False
+        
+        for name in removed + [name for name in restart if name in self.pools]:
+            await self._remove_server(name)
+        for name in restart:
+            self._add_server(name, configs[name])
+        self._build_client()
+        
+        await asyncio.gather(*(self._start_server(name) for name in restart))
+        self._collect_tools()
+        logger.info("MCP tools refreshed: %s", self.get_server_status())
+        return True
+    
+    async def _refresh_loop(self, poll_interval: float):
+        while True:
+            await asyncio.sleep(poll_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning("MCP refresh failed: %s", e)
+    
+    def start_background_refresh(self, poll_interval: float = MCP_CONFIG_POLL_INTERVAL):
+        if self._refresh_task is None and poll_interval > 0:
+            self._refresh_task = asyncio.create_task(self._refresh_loop(poll_interval))
     
     def get_server_info(self) -> List[Dict]:
         return [
@@ -89,19 +865,51 @@ class MCPClientManager:
             for name, config in self.server_configs.items()
         ]
     
+    def get_pool_stats(self) -> List[Dict]:
+        return [pool.stats() for pool in self.pools.values()]
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        return self.tool_cache.stats()
+    
+    def get_coalescing_stats(self) -> Dict[str, Any]:
+        return self.single_flight.stats()
+    
+    def get_output_stats(self) -> Dict[str, Any]:
+        return self.output_store.stats()
+    
+    async def _load_server_tools(self, name: str) -> List[BaseTool]:
+        mcp_tools = await self.pools[name].list_tools()
+        interceptors = self.client.tool_interceptors if self.client else []
+        return [
+            convert_mcp_tool_to_langchain_tool(
+                None,
+                tool,
+                connection=self.connections[name],  # type: ignore
+                server_name=name,
+                tool_interceptors=interceptors
+            )
+            for tool in mcp_tools
+        ]
+    
     async def get_all_tools(self) -> List[BaseTool]:
         if not self.client:
             raise RuntimeError("Client not initialized. Call initialize_all_servers first.")
         
-        self.tools = await self.client.get_tools()
         return self.tools
     
     async def cleanup(self):
-        if self.client:
-            try:
-                await self.client.cleanup()
-            except Exception:
-                pass
+        if self._refresh_task:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+        await asyncio.gather(
+            *(pool.close() for pool in self.pools.values()),
+            return_exceptions=True
+        )
+        self.pools.clear()
+        self.tool_cache.invalidate()
         self.client = None
         self.server_configs.clear()
+        self.connections.clear()
+        self.server_status.clear()
+        self._server_tools.clear()
         self.tools.clear()
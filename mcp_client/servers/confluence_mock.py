@@ -1,4 +1,20 @@
 #!/usr/bin/env python3
+import os
+import re
+import sys
+import json
+import math
+import time
+import zlib
+import mmap
+import shutil
+import struct
+import argparse
+import itertools
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
 from fastmcp import FastMCP
 
 MOCK_CONFLUENCE_DATA = {
@@ -176,35 +192,1080 @@ Planned: December 15, 2024
     }
 }
 
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i in is it its "
+    "me my of on or our should that the their there this to was we what when "
+    "where which who why will with you your".split()
+)
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+TITLE_WEIGHT = 3
+HASH_BITS = 20
+CHUNK_WORDS = 120
+VECTOR_DIM = int(os.getenv("CONFLUENCE_VECTOR_DIM", "128"))
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Inverted index over Confluence pages with BM25 ranking.
+    
+    Postings live in a frozen segment, stored as CSR-style NumPy arrays and
+    scored with vectorized operations, plus an append-only delta segment for
+    pages added since the last freeze. Updating or removing a page only
+    tombstones its old document number, so page changes never rebuild the
+    index; dead postings are dropped when the delta is merged.
+    """
+    
+    def __init__(self, k1: float = 1.2, b: float = 0.75, delta_limit: int = 2000):
+        self.k1 = k1
+        self.b = b
+        self.delta_limit = delta_limit
+        self.spaces: List[str] = []
+        self._space_codes: Dict[str, int] = {}
+        self._vocab: Dict[str, int] = {}
+        self._doc_ids: List[str] = []
+        self._doc_titles: List[str] = []
+        self._doc_nos: Dict[str, int] = {}
+        self._doc_len = np.zeros(0, dtype=np.float32)
+        self._doc_space = np.zeros(0, dtype=np.int32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._total_length = 0
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._post_docs = np.zeros(0, dtype=np.int32)
+        self._post_tfs = np.zeros(0, dtype=np.float32)
+        self._delta_terms = np.zeros(0, dtype=np.int32)
+        self._delta_docs = np.zeros(0, dtype=np.int32)
+        self._delta_tfs = np.zeros(0, dtype=np.float32)
+        self._delta_size = 0
+        self._delta_doc_count = 0
+    
+    def __len__(self) -> int:
+        return len(self._doc_nos)
+    
+    def __contains__(self, page_id: str) -> bool:
+        return page_id in self._doc_nos
+    
+    @staticmethod
+    def _grow(array: np.ndarray, size: int) -> np.ndarray:
+        if size <= len(array):
+            return array
+        grown = np.zeros(max(size, 2 * len(array), 64), dtype=array.dtype)
+        grown[:len(array)] = array
+        return grown
+    
+    def _term_id(self, term: str) -> int:
+        term_id = self._vocab.get(term)
+        if term_id is None:
+            term_id = self._vocab[term] = len(self._vocab)
+        return term_id
+    
+    def add(self, page_id: str, space: str, title: str, content: str):
+        if page_id in self._doc_nos:
+            self.remove(page_id)
+        
+        if space not in self._space_codes:
+            self._space_codes[space] = len(self.spaces)
+            self.spaces.append(space)
+        
+        doc_no = len(self._doc_ids)
+        term_counts = Counter(tokenize(title) * TITLE_WEIGHT + tokenize(content))
+        length = sum(term_counts.values())
+        
+        self._doc_len = self._grow(self._doc_len, doc_no + 1)
+        self._doc_space = self._grow(self._doc_space, doc_no + 1)
+        self._alive = self._grow(self._alive, doc_no + 1)
+        self._doc_ids.append(page_id)
+        self._doc_titles.append(title)
+        self._doc_nos[page_id] = doc_no
+        self._doc_len[doc_no] = length
+        self._doc_space[doc_no] = self._space_codes[space]
+        self._alive[doc_no] = True
+        self._total_length += length
+        
+        start, end = self._delta_size, self._delta_size + len(term_counts)
+        self._delta_terms = self._grow(self._delta_terms, end)
+        self._delta_docs = self._grow(self._delta_docs, end)
+        self._delta_tfs = self._grow(self._delta_tfs, end)
+        self._delta_terms[start:end] = [self._term_id(term) for term in term_counts]
+        self._delta_docs[start:end] = doc_no
+        self._delta_tfs[start:end] = list(term_counts.values())
+        self._delta_size = end
+        self._delta_doc_count += 1
+        
+        # Growing the threshold with the index keeps bulk loads amortized
+        # O(n log n) instead of re-merging the frozen segment every batch.
+        if self._delta_doc_count >= max(self.delta_limit, len(self._doc_nos) // 4):
+            self.freeze()
+    
+    def remove(self, page_id: str):
+        doc_no = self._doc_nos.pop(page_id, None)
+        if doc_no is None:
+            return
+        
+        self._alive[doc_no] = False
+        self._total_length -= int(self._doc_len[doc_no])
+    
+    def freeze(self):
+        """Merge the delta segment into the frozen CSR arrays, dropping dead postings."""
+        base_terms = np.repeat(
+            np.arange(len(self._offsets) - 1, dtype=np.int32),
+            np.diff(self._offsets)
+        )
+        size = self._delta_size
+        terms = np.concatenate([base_terms, self._delta_terms[:size]])
+        docs = np.concatenate([self._post_docs, self._delta_docs[:size]])
+        tfs = np.concatenate([self._post_tfs, self._delta_tfs[:size]])
+        
+        keep = self._alive[docs]
+        terms, docs, tfs = terms[keep], docs[keep], tfs[keep]
+        order = np.argsort(terms, kind="stable")
+        
+        self._post_docs = docs[order]
+        self._post_tfs = tfs[order]
+        self._offsets = np.zeros(len(self._vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(self._vocab)), out=self._offsets[1:])
+        self._delta_size = 0
+        self._delta_doc_count = 0
+    
+    def _postings(self, term_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        docs = np.zeros(0, dtype=np.int32)
+        tfs = np.zeros(0, dtype=np.float32)
+        if term_id < len(self._offsets) - 1:
+            start, end = self._offsets[term_id], self._offsets[term_id + 1]
+            docs, tfs = self._post_docs[start:end], self._post_tfs[start:end]
+        if self._delta_size:
+            match = self._delta_terms[:self._delta_size] == term_id
+            docs = np.concatenate([docs, self._delta_docs[:self._delta_size][match]])
+            tfs = np.concatenate([tfs, self._delta_tfs[:self._delta_size][match]])
+        keep = self._alive[docs]
+        return docs[keep], tfs[keep]
+    
+    def search(self, query: str, space: str = "", top_k: int = 10) -> List[Tuple[str, str, str, float]]:
+        """Return up to ``top_k`` (page_id, space, title, score) hits, best first."""
+        term_ids = {self._vocab[term] for term in tokenize(query) if term in self._vocab}
+        doc_count = len(self._doc_nos)
+        if not term_ids or not doc_count:
+            return []
+        if space and space not in self._space_codes:
+            return []
+        
+        avg_length = self._total_length / doc_count
+        scores = np.zeros(len(self._doc_ids), dtype=np.float32)
+        
+        for term_id in term_ids:
+            docs, tfs = self._postings(term_id)
+            if not len(docs):
+                continue
+            idf = math.log(1.0 + (doc_count - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * self._doc_len[docs] / avg_length)
+            scores[docs] += idf * tfs * (self.k1 + 1.0) / (tfs + norm)
+        
+        if space:
+            scores[self._doc_space[:len(scores)] != self._space_codes[space]] = 0.0
+        
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(scores[candidates], -top_k)[-top_k:]]
+        ranked = candidates[np.argsort(-scores[candidates], kind="stable")]
+        
+        return [
+            (
+                self._doc_ids[doc_no],
+                self.spaces[self._doc_space[doc_no]],
+                self._doc_titles[doc_no],
+                float(scores[doc_no])
+            )
+            for doc_no in ranked
+        ]
+
+    def save(self, directory: str, stamp: List[Any]):
+        """Persist the index next to a pack file; ``stamp`` identifies the pack version."""
+        self.freeze()
+        os.makedirs(directory, exist_ok=True)
+        count = len(self._doc_ids)
+        arrays = {
+            "offsets": self._offsets,
+            "post_docs": self._post_docs,
+            "post_tfs": self._post_tfs,
+            "doc_len": self._doc_len[:count],
+            "doc_space": self._doc_space[:count],
+            "alive": self._alive[:count],
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(directory, f"{name}.npy"), array)
+
+        meta = {
+            "stamp": stamp,
+            "k1": self.k1,
+            "b": self.b,
+            "total_length": self._total_length,
+            "spaces": self.spaces,
+            "doc_ids": self._doc_ids,
+            "doc_titles": self._doc_titles,
+            "vocab": list(self._vocab),
+        }
+        with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+    
+    @classmethod
+    def load(cls, directory: str, stamp: List[Any]) -> Optional["BM25Index"]:
+        """Load a saved index, or return None if it is missing or was built for another pack."""
+        meta_path = os.path.join(directory, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("stamp") != stamp:
+            return None
+        
+        index = cls(k1=meta["k1"], b=meta["b"])
+        index.spaces = meta["spaces"]
+        index._space_codes = {space: code for code, space in enumerate(index.spaces)}
+        index._vocab = {term: term_id for term_id, term in enumerate(meta["vocab"])}
+        index._doc_ids = meta["doc_ids"]
+        index._doc_titles = meta["doc_titles"]
+        index._total_length = meta["total_length"]
+        
+        def load_array(name: str, mmap_mode: Optional[str] = None) -> np.ndarray:
+            return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)  # type: ignore
+        
+        # Postings stay on disk and are paged in by the queries that touch them.
+        index._offsets = load_array("offsets", "r")
+        index._post_docs = load_array("post_docs", "r")
+        index._post_tfs = load_array("post_tfs", "r")
+        index._doc_len = load_array("doc_len")
+        index._doc_space = load_array("doc_space")
+        index._alive = load_array("alive")
+        index._doc_nos = {
+            page_id: doc_no
+            for doc_no, page_id in enumerate(index._doc_ids)
+            if index._alive[doc_no]
+        }
+        return index
+
+
+_FEATURE_MASK = (1 << HASH_BITS) - 1
+
+def _feature_id(feature: str) -> int:
+    # Hashed on every use rather than memoized: a cache of every term seen in
+    # queries and added pages would grow without bound.
+    return zlib.crc32(feature.encode("utf-8")) & _FEATURE_MASK
+
+def hashed_features(text: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Sorted hashed feature IDs of ``text`` and their counts; each word also counts under a crude stem."""
+    tokens = tokenize(text)
+    tokens += [token[:6] + "~" for token in tokens if len(token) > 6 and not token.isdigit()]
+    ids = np.fromiter(map(_feature_id, tokens), dtype=np.int64, count=len(tokens))
+    keys, counts = np.unique(ids, return_counts=True)
+    return keys, counts.astype(np.float32)
+
+def chunk_page(title: str, content: str, words: int = CHUNK_WORDS) -> List[str]:
+    """Split a page into paragraph-aligned chunks of about ``words`` words, each prefixed with the title."""
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    for paragraph in re.split(r"\n\s*\n", content):
+        count = len(paragraph.split())
+        if current and size + count > words:
+            chunks.append("\n\n".join(current))
+            current, size = [], 0
+        if count:
+            current.append(paragraph)
+            size += count
+    if current or not chunks:
+        chunks.append("\n\n".join(current))
+    return [f"{title}\n{chunk}" for chunk in chunks]
+
+def _segment_dot(ptr: np.ndarray, idx: np.ndarray, weights: np.ndarray, dense: np.ndarray, max_elements: int = 1 << 25) -> np.ndarray:
+    """Row ``i`` of the result is ``sum(weights[j] * dense[idx[j]])`` over ``j`` in ``ptr[i]:ptr[i+1]``.
+    
+    Products are gathered from the transposed matrix and reduced along
+    contiguous memory, in batches of at most ``max_elements`` floats.
+    """
+    segments, width = len(ptr) - 1, dense.shape[1]
+    dense_t = np.ascontiguousarray(dense.T, dtype=np.float32)
+    out = np.zeros((segments, width), dtype=np.float32)
+    budget = max(1, max_elements // max(1, width))
+    start = 0
+    while start < segments:
+        end = int(np.searchsorted(ptr, ptr[start] + budget, side="right")) - 1
+        end = min(max(end, start + 1), segments)
+        lo, hi = ptr[start], ptr[end]
+        if hi > lo:
+            products = dense_t.take(idx[lo:hi], axis=1)
+            products *= weights[lo:hi]
+            starts = ptr[start:end] - lo
+            nonempty = ptr[start + 1:end + 1] > ptr[start:end]
+            out[start:end][nonempty] = np.add.reduceat(products, starts[nonempty], axis=1).T
+        start = end
+    return out
+
+
+class VectorIndex:
+    """
+    Dense semantic index over Confluence page chunks.
+    
+    Chunks are embedded with latent semantic analysis: hashed TF-IDF features
+    reduced to ``dim`` dimensions with a randomized SVD, all in NumPy on the
+    CPU. Chunk vectors are L2-normalized rows of one contiguous float32 matrix,
+    so a query is a single matrix-vector product; a page scores as its best
+    chunk. Pages added after the build are folded into the existing
+    projection, and removed pages are tombstoned like in ``BM25Index``.
+    """
+    
+    def __init__(self, dim: int = VECTOR_DIM):
+        self.dim = dim
+        self.spaces: List[str] = []
+        self._space_codes: Dict[str, int] = {}
+        self._doc_ids: List[str] = []
+        self._doc_titles: List[str] = []
+        self._doc_nos: Dict[str, int] = {}
+        self._doc_space = np.zeros(0, dtype=np.int32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._doc_chunks = np.zeros(0, dtype=np.int64)
+        self._columns = np.zeros(0, dtype=np.int64)
+        self._idf = np.zeros(0, dtype=np.float32)
+        self._components = np.zeros((0, 0), dtype=np.float32)
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._chunk_count = 0
+        self.build_seconds = 0.0
+    
+    def __len__(self) -> int:
+        return len(self._doc_nos)
+    
+    def _add_doc(self, page_id: str, space: str, title: str, first_chunk: int):
+        if page_id in self._doc_nos:
+            self.remove(page_id)
+        if space not in self._space_codes:
+            self._space_codes[space] = len(self.spaces)
+            self.spaces.append(space)
+        
+        doc_no = len(self._doc_ids)
+        self._doc_space = BM25Index._grow(self._doc_space, doc_no + 1)
+        self._alive = BM25Index._grow(self._alive, doc_no + 1)
+        self._doc_chunks = BM25Index._grow(self._doc_chunks, doc_no + 1)
+        self._doc_ids.append(page_id)
+        self._doc_titles.append(title)
+        self._doc_nos[page_id] = doc_no
+        self._doc_space[doc_no] = self._space_codes[space]
+        self._alive[doc_no] = True
+        self._doc_chunks[doc_no] = first_chunk
+    
+    def _weigh(self, keys: np.ndarray, counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Map hashed features to known columns and return their normalized TF-IDF weights."""
+        if not len(keys) or not len(self._columns):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        cols = np.minimum(np.searchsorted(self._columns, keys), len(self._columns) - 1)
+        known = self._columns[cols] == keys
+        cols = cols[known]
+        weights = (1.0 + np.log(counts[known])) * self._idf[cols]
+        norm = float(np.linalg.norm(weights))
+        return cols, weights / norm if norm else weights
+    
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self._components.shape[1]), dtype=np.float32)
+        for row, text in enumerate(texts):
+            cols, weights = self._weigh(*hashed_features(text))
+            if len(cols):
+                vectors[row] = weights @ self._components[cols]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1.0)
+    
+    @classmethod
+    def build(cls, pages: Iterable[Tuple[str, str, str, str]], dim: int = VECTOR_DIM) -> "VectorIndex":
+        started = time.perf_counter()
+        index = cls(dim)
+        indptr = [0]
+        keys: List[np.ndarray] = []
+        counts: List[np.ndarray] = []
+        
+        for page_id, space, page_title, content in pages:
+            index._add_doc(page_id, space, page_title, len(indptr) - 1)
+            for chunk in chunk_page(page_title, content):
+                chunk_keys, chunk_counts = hashed_features(chunk)
+                keys.append(chunk_keys)
+                counts.append(chunk_counts)
+                indptr.append(indptr[-1] + len(chunk_keys))
+        
+        rows = len(indptr) - 1
+        index._chunk_count = rows
+        if not rows or not indptr[-1]:
+            index._vectors = np.zeros((rows, 0), dtype=np.float32)
+            return index
+        
+        # Sparse TF-IDF chunk matrix in CSR form, over the hashed columns in use.
+        ptr = np.asarray(indptr, dtype=np.int64)
+        index._columns, cols = np.unique(np.concatenate(keys), return_inverse=True)
+        cols = cols.astype(np.int32)
+        df = np.bincount(cols, minlength=len(index._columns))
+        index._idf = (np.log((1.0 + rows) / (1.0 + df)) + 1.0).astype(np.float32)
+        data = (1.0 + np.log(np.concatenate(counts))) * index._idf[cols]
+        del keys, counts
+        row_ids = np.repeat(np.arange(rows, dtype=np.int32), np.diff(ptr))
+        norms = np.sqrt(np.bincount(row_ids, weights=data * data, minlength=rows))
+        data = (data / norms[row_ids]).astype(np.float32)
+        
+        # Transposed (CSC) view for products with the transpose.
+        order = np.argsort(cols, kind="stable")
+        col_ptr = np.zeros(len(index._columns) + 1, dtype=np.int64)
+        np.cumsum(df, out=col_ptr[1:])
+        t_rows, t_data = row_ids[order], data[order]
+        
+        def matmul(dense: np.ndarray) -> np.ndarray:
+            return _segment_dot(ptr, cols, data, dense)
+        
+        def rmatmul(dense: np.ndarray) -> np.ndarray:
+            return _segment_dot(col_ptr, t_rows, t_data, dense)
+        
+        # Randomized SVD (Halko et al.) with one power iteration. The chunk
+        # vectors X V = Q U S come out of the factorization directly.
+        rank = min(dim, rows, len(index._columns))
+        width = min(rank + 10, rows, len(index._columns))
+        rng = np.random.default_rng(0)
+        sample = matmul(rng.standard_normal((len(index._columns), width)).astype(np.float32))
+        basis = np.linalg.qr(sample)[0]
+        sample = matmul(np.linalg.qr(rmatmul(basis))[0])
+        basis = np.linalg.qr(sample)[0]
+        u, sigma, vt = np.linalg.svd(rmatmul(basis).T, full_matrices=False)
+        index._components = np.ascontiguousarray(vt[:rank].T, dtype=np.float32)
+        
+        vectors = basis @ (u[:, :rank] * sigma[:rank])
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        index._vectors = np.ascontiguousarray(vectors / np.where(norms > 0, norms, 1.0), dtype=np.float32)
+        index.build_seconds = time.perf_counter() - started
+        return index
+    
+    def add(self, page_id: str, space: str, title: str, content: str):
+        vectors = self._embed(chunk_page(title, content))
+        self._add_doc(page_id, space, title, self._chunk_count)
+        
+        end = self._chunk_count + len(vectors)
+        if end > len(self._vectors):
+            grown = np.zeros((max(end, 2 * len(self._vectors), 64), vectors.shape[1]), dtype=np.float32)
+            grown[:self._chunk_count] = self._vectors[:self._chunk_count]
+            self._vectors = grown
+        self._vectors[self._chunk_count:end] = vectors
+        self._chunk_count = end
+    
+    def remove(self, page_id: str):
+        doc_no = self._doc_nos.pop(page_id, None)
+        if doc_no is not None:
+            self._alive[doc_no] = False
+    
+    def search(
+        self, query: str, space: str = "", top_k: int = 10, min_score: float = 0.05
+    ) -> List[Tuple[str, str, str, float]]:
+        """Return up to ``top_k`` (page_id, space, title, score) hits by cosine similarity, best first."""
+        doc_count = len(self._doc_ids)
+        if not self._doc_nos or not self._components.size:
+            return []
+        if space and space not in self._space_codes:
+            return []
+        query_vector = self._embed([query])[0]
+        if not query_vector.any():
+            return []
+        
+        chunk_scores = self._vectors[:self._chunk_count] @ query_vector
+        scores = np.maximum.reduceat(chunk_scores, self._doc_chunks[:doc_count])
+        scores[~self._alive[:doc_count]] = -1.0
+        if space:
+            scores[self._doc_space[:doc_count] != self._space_codes[space]] = -1.0
+        
+        candidates = np.flatnonzero(scores >= min_score)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(scores[candidates], -top_k)[-top_k:]]
+        ranked = candidates[np.argsort(-scores[candidates], kind="stable")]
+        
+        return [
+            (
+                self._doc_ids[doc_no],
+                self.spaces[self._doc_space[doc_no]],
+                self._doc_titles[doc_no],
+                float(scores[doc_no])
+            )
+            for doc_no in ranked
+        ]
+    
+    def stats(self) -> Dict[str, Any]:
+        arrays = [self._vectors, self._components, self._columns, self._idf, self._doc_chunks, self._doc_space, self._alive]
+        return {
+            "pages": len(self._doc_nos),
+            "chunks": self._chunk_count,
+            "dim": int(self._components.shape[1]) if self._components.size else 0,
+            "build_seconds": round(self.build_seconds, 3),
+            "memory_mb": round(sum(array.nbytes for array in arrays) / 2**20, 2),
+        }
+    
+    def save(self, directory: str, stamp: List[Any]):
+        os.makedirs(directory, exist_ok=True)
+        count = len(self._doc_ids)
+        arrays = {
+            "vectors": self._vectors[:self._chunk_count],
+            "components": self._components,
+            "columns": self._columns,
+            "idf": self._idf,
+            "doc_chunks": self._doc_chunks[:count],
+            "doc_space": self._doc_space[:count],
+            "alive": self._alive[:count],
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(directory, f"{name}.npy"), array)
+        
+        meta = {
+            "stamp": stamp,
+            "dim": self.dim,
+            "build_seconds": self.build_seconds,
+            "spaces": self.spaces,
+            "doc_ids": self._doc_ids,
+            "doc_titles": self._doc_titles,
+        }
+        with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+    
+    @classmethod
+    def load(cls, directory: str, stamp: List[Any]) -> Optional["VectorIndex"]:
+        """Load a saved index, or return None if it is missing or was built for another pack."""
+        meta_path = os.path.join(directory, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("stamp") != stamp or meta.get("dim") != VECTOR_DIM:
+            return None
+        
+        index = cls(meta["dim"])
+        index.build_seconds = meta["build_seconds"]
+        index.spaces = meta["spaces"]
+        index._space_codes = {space: code for code, space in enumerate(index.spaces)}
+        index._doc_ids = meta["doc_ids"]
+        index._doc_titles = meta["doc_titles"]
+        
+        def load_array(name: str, mmap_mode: Optional[str] = None) -> np.ndarray:
+            return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)  # type: ignore
+        
+        index._vectors = load_array("vectors", "r")
+        index._components = load_array("components")
+        index._columns = load_array("columns")
+        index._idf = load_array("idf")
+        index._doc_chunks = load_array("doc_chunks")
+        index._doc_space = load_array("doc_space")
+        index._alive = load_array("alive")
+        index._chunk_count = len(index._vectors)
+        index._doc_nos = {
+            page_id: doc_no
+            for doc_no, page_id in enumerate(index._doc_ids)
+            if index._alive[doc_no]
+        }
+        return index
+
+
+PACK_MAGIC = b"CFPACK01"
+
+def _heading_title(content: str, fallback: str) -> str:
+    first_line = content.lstrip().split("\n", 1)[0]
+    return first_line[2:].strip() if first_line.startswith("# ") else fallback
+
+def iter_source_pages(source: str) -> Iterator[Tuple[str, str, str, str]]:
+    """Yield (page_id, space, title, content) from a Confluence export.
+    
+    ``source`` is either a JSONL file with ``id``, ``space``, ``title`` and
+    ``content`` keys per line, or a directory laid out as
+    ``<Space>/<page_id>.md`` whose first ``# `` heading is the title.
+    """
+    if os.path.isdir(source):
+        for space in sorted(os.listdir(source)):
+            space_dir = os.path.join(source, space)
+            if not os.path.isdir(space_dir):
+                continue
+            for file_name in sorted(os.listdir(space_dir)):
+                if not file_name.endswith(".md"):
+                    continue
+                page_id = file_name[:-3]
+                with open(os.path.join(space_dir, file_name), "r", encoding="utf-8") as f:
+                    content = f.read()
+                yield page_id, space, _heading_title(content, page_id), content
+    else:
+        with open(source, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    page = json.loads(line)
+                    yield page["id"], page["space"], page["title"], page["content"]
+
+def iter_mock_pages() -> Iterator[Tuple[str, str, str, str]]:
+    for space, pages in MOCK_CONFLUENCE_DATA.items():
+        for page_title, page_data in pages.items():
+            yield page_data["id"], space, page_title, page_data["content"]
+
+def pack_corpus(pages: Iterable[Tuple[str, str, str, str]], dest: str, index: bool = False) -> int:
+    """Write pages to a packed corpus file and return the page count.
+    
+    Layout: magic, little-endian u64 header length, a JSON header holding the
+    space names and one ``[id, space, title, offset, length]`` row per page,
+    then the UTF-8 page bodies back to back. Bodies are streamed through a
+    temporary file, so memory use does not depend on corpus size. With
+    ``index`` the search indexes are built before the pack replaces ``dest``,
+    so a server watching it finds them ready.
+    """
+    spaces: Dict[str, int] = {}
+    rows = []
+    offset = 0
+    bodies_path = dest + ".bodies.tmp"
+    
+    with open(bodies_path, "wb") as bodies:
+        for page_id, space, title, content in pages:
+            body = content.encode("utf-8")
+            bodies.write(body)
+            space_code = spaces.setdefault(space, len(spaces))
+            rows.append([page_id, space_code, title, offset, len(body)])
+            offset += len(body)
+    
+    header = json.dumps({"spaces": list(spaces), "pages": rows}, ensure_ascii=False).encode("utf-8")
+    tmp_path = dest + ".tmp"
+    with open(tmp_path, "wb") as out, open(bodies_path, "rb") as bodies:
+        out.write(PACK_MAGIC)
+        out.write(struct.pack("<Q", len(header)))
+        out.write(header)
+        shutil.copyfileobj(bodies, out, 1024 * 1024)
+    os.remove(bodies_path)
+    if index:
+        # The rename keeps size and mtime, so the stamp matches ``dest``.
+        store = PageStore.from_pack(tmp_path)
+        try:
+            build_indexes(store, dest, _file_stamp(tmp_path))
+        finally:
+            store.close()
+    os.replace(tmp_path, dest)
+    
+    return len(rows)
+
+
+class PageStore:
+    """
+    Confluence pages addressed by page ID.
+    
+    ``_entries`` maps each page ID to its (space, title, location), so lookups
+    by ID are O(1) regardless of corpus size. Bodies
+    are either kept inline (the built-in mock data and pages upserted at run
+    time) or read lazily from a memory-mapped pack file, so opening a pack of
+    any size does not read page bodies.
+    """
+    
+    def __init__(self):
+        self._entries: Dict[str, Tuple[str, str, Any]] = {}
+        self._spaces: Dict[str, Dict[str, str]] = {}
+        self._file = None
+        self._mmap: Optional[mmap.mmap] = None
+        self._body_start = 0
+        self.path: Optional[str] = None
+    
+    @classmethod
+    def from_pages(cls, pages: Iterable[Tuple[str, str, str, str]]) -> "PageStore":
+        store = cls()
+        for page_id, space, title, content in pages:
+            store.upsert(space, title, page_id, content)
+        return store
+    
+    @classmethod
+    def from_pack(cls, path: str) -> "PageStore":
+        store = cls()
+        store.path = path
+        store._file = open(path, "rb")
+        store._mmap = mmap.mmap(store._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if store._mmap[:len(PACK_MAGIC)] != PACK_MAGIC:
+            store.close()
+            raise ValueError(f"Not a packed Confluence corpus: {path}")
+        
+        header_start = len(PACK_MAGIC) + 8
+        (header_length,) = struct.unpack("<Q", store._mmap[len(PACK_MAGIC):header_start])
+        header = json.loads(store._mmap[header_start:header_start + header_length].decode("utf-8"))
+        store._body_start = header_start + header_length
+        
+        spaces = header["spaces"]
+        for page_id, space_code, title, offset, length in header["pages"]:
+            space = spaces[space_code]
+            store._entries[page_id] = (space, title, (offset, length))
+            store._spaces.setdefault(space, {})[title] = page_id
+        return store
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def _body(self, location: Any) -> str:
+        if isinstance(location, str):
+            return location
+        offset, length = location
+        start = self._body_start + offset
+        return self._mmap[start:start + length].decode("utf-8")  # type: ignore
+    
+    def read(self, page_id: str) -> Optional[Tuple[str, str, str]]:
+        entry = self._entries.get(page_id)
+        if entry is None:
+            return None
+        space, title, location = entry
+        return space, title, self._body(location)
+    
+    def iter_pages(self) -> Iterator[Tuple[str, str, str, str]]:
+        for page_id, (space, title, location) in list(self._entries.items()):
+            yield page_id, space, title, self._body(location)
+    
+    def space_summary(self) -> List[Tuple[str, int, List[str]]]:
+        return [
+            (space, len(titles), list(itertools.islice(titles, 3)))
+            for space, titles in self._spaces.items()
+            if titles
+        ]
+    
+    def upsert(self, space: str, title: str, page_id: str, content: str):
+        self.delete(page_id)
+        self._entries[page_id] = (space, title, content)
+        self._spaces.setdefault(space, {})[title] = page_id
+    
+    def delete(self, page_id: str):
+        entry = self._entries.pop(page_id, None)
+        if entry:
+            space, title, _ = entry
+            self._spaces[space].pop(title, None)
+    
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def build_search_index(pages: Iterable[Tuple[str, str, str, str]]) -> BM25Index:
+    index = BM25Index()
+    for page_id, space, page_title, content in pages:
+        index.add(page_id, space, page_title, content)
+    index.freeze()
+    return index
+
+def _file_stamp(path: str) -> List[Any]:
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+STORE = PageStore.from_pages(iter_mock_pages())
+SEARCH_INDEX: Optional[BM25Index] = build_search_index(STORE.iter_pages())
+VECTOR_INDEX: Optional[VectorIndex] = VectorIndex.build(STORE.iter_pages())
+CORPUS_PATH: Optional[str] = None
+_corpus_stamp: Optional[List[Any]] = None
+# Guards swapping the store and indexes; tool calls take a consistent
+# snapshot of all three with current_corpus().
+_corpus_lock = threading.Lock()
+_build_thread: Optional[threading.Thread] = None
+MAX_BATCH_PAGES = 20
+SNIPPET_CHARS = 300
+SEARCH_CHAR_BUDGET = int(os.getenv("CONFLUENCE_SEARCH_CHAR_BUDGET", "4000"))
+SEARCH_MODES = ("lexical", "semantic", "hybrid")
+SEARCH_MODE = os.getenv("CONFLUENCE_SEARCH_MODE", "hybrid")
+HYBRID_WEIGHT = float(os.getenv("CONFLUENCE_HYBRID_WEIGHT", "0.5"))
+
+def current_corpus() -> Tuple[PageStore, Optional[BM25Index], Optional[VectorIndex]]:
+    with _corpus_lock:
+        return STORE, SEARCH_INDEX, VECTOR_INDEX
+    
+def _swap_corpus(
+    store: PageStore,
+    index: Optional[BM25Index],
+    vectors: Optional[VectorIndex],
+    path: str,
+    stamp: List[Any]
+):
+    # Swap the page-ID index and the search indexes together so a tool call
+    # never sees one from the old corpus and one from the new. The previous
+    # store is not closed: a call holding a snapshot may still read from it,
+    # and its mmap is released once the last reference goes.
+    global STORE, SEARCH_INDEX, VECTOR_INDEX, CORPUS_PATH, _corpus_stamp
+    with _corpus_lock:
+        STORE, SEARCH_INDEX, VECTOR_INDEX = store, index, vectors
+        CORPUS_PATH, _corpus_stamp = path, stamp
+    
+def _load_indexes(path: str, stamp: List[Any]) -> Tuple[Optional[BM25Index], Optional[VectorIndex]]:
+    index_dir = path + ".index"
+    return BM25Index.load(index_dir, stamp), VectorIndex.load(os.path.join(index_dir, "vectors"), stamp)
+
+def build_indexes(
+    store: PageStore,
+    path: str,
+    stamp: List[Any],
+    index: Optional[BM25Index] = None,
+    vectors: Optional[VectorIndex] = None
+) -> Tuple[BM25Index, VectorIndex]:
+    """Build whichever of the BM25 and vector indexes of a pack are missing and
+    save them to ``<path>.index``."""
+    index_dir = path + ".index"
+    if index is None:
+        index = build_search_index(store.iter_pages())
+        try:
+            index.save(index_dir, stamp)
+        except OSError as e:
+            print(f"Could not save search index to {index_dir}: {e}", file=sys.stderr)
+    
+    if vectors is None:
+        vector_dir = os.path.join(index_dir, "vectors")
+        vectors = VectorIndex.build(store.iter_pages())
+        stats = vectors.stats()
+        print(
+            f"Built vector index: {stats['chunks']} chunks x {stats['dim']} dims "
+            f"over {stats['pages']} pages in {stats['build_seconds']:.2f}s, {stats['memory_mb']:.1f} MB",
+            file=sys.stderr
+        )
+        try:
+            vectors.save(vector_dir, stamp)
+        except OSError as e:
+            print(f"Could not save vector index to {vector_dir}: {e}", file=sys.stderr)
+    return index, vectors
+    
+def index_pack(path: str):
+    """Build and save the indexes of a pack (the ``--pack``/``--index`` step)."""
+    stamp = _file_stamp(path)
+    store = PageStore.from_pack(path)
+    try:
+        build_indexes(store, path, stamp)
+    finally:
+        store.close()
+
+def _in_background(target: Callable[[], None]) -> bool:
+    """Run an index build on the background thread unless one is already running."""
+    global _build_thread
+    with _corpus_lock:
+        if _build_thread is not None and _build_thread.is_alive():
+            return False
+        
+        def run():
+            try:
+                target()
+            except Exception as e:
+                print(f"Could not load corpus {CORPUS_PATH}: {e}", file=sys.stderr)
+        
+        _build_thread = threading.Thread(target=run, name="corpus-index", daemon=True)
+        _build_thread.start()
+        return True
+
+def load_corpus(path: str):
+    """Serve a packed corpus instead of the built-in mock data.
+    
+    The indexes that ``--pack`` saved to ``<path>.index`` are memory-mapped,
+    so startup does not depend on corpus size. Missing or stale indexes are
+    rebuilt on a background thread: until then pages can be fetched by ID,
+    search falls back to BM25 alone while only the vector index is missing,
+    and reports that the index is being built while BM25 is missing too.
+    """
+    stamp = _file_stamp(path)
+    store = PageStore.from_pack(path)
+    index, vectors = _load_indexes(path, stamp)
+    _swap_corpus(store, index, vectors, path, stamp)
+    if index is not None and vectors is not None:
+        return
+    
+    def complete():
+        built = build_indexes(store, path, stamp, index, vectors)
+        with _corpus_lock:
+            if STORE is not store:
+                return
+        _swap_corpus(store, *built, path, stamp)
+    
+    _in_background(complete)
+
+def _reload_corpus(path: str):
+    stamp = _file_stamp(path)
+    store = PageStore.from_pack(path)
+    index, vectors = build_indexes(store, path, stamp, *_load_indexes(path, stamp))
+    _swap_corpus(store, index, vectors, path, stamp)
+
+def refresh_corpus():
+    """Reload the pack if it has been rewritten since it was opened.
+    
+    The new pack is opened and indexed on the background thread while calls
+    keep being answered from the old one, which is swapped out once the new
+    indexes are ready.
+    """
+    if not CORPUS_PATH:
+        return
+    path = CORPUS_PATH
+    try:
+        stamp = _file_stamp(path)
+    except OSError:
+        return
+    if stamp != _corpus_stamp:
+        _in_background(lambda: _reload_corpus(path))
+
+def upsert_page(space: str, title: str, page_id: str, content: str):
+    """Add or replace a page and update the search index incrementally."""
+    store, index, vectors = current_corpus()
+    store.upsert(space, title, page_id, content)
+    if index is not None:
+        index.add(page_id, space, title, content)
+    if vectors is not None:
+        vectors.add(page_id, space, title, content)
+
+def delete_page(page_id: str):
+    store, index, vectors = current_corpus()
+    store.delete(page_id)
+    if index is not None:
+        index.remove(page_id)
+    if vectors is not None:
+        vectors.remove(page_id)
+
+def search_pages(
+    query: str,
+    space: str = "",
+    top_k: int = 10,
+    mode: str = SEARCH_MODE,
+    index: Optional[BM25Index] = None,
+    vectors: Optional[VectorIndex] = None
+) -> List[Tuple[str, str, str, float]]:
+    """
+    Rank pages for a query with the lexical index, the vector index or both.
+    
+    Hybrid scores are ``HYBRID_WEIGHT`` times the cosine similarity plus the
+    rest times the BM25 score scaled to the best lexical hit, over the union of
+    both candidate lists. Without a vector index (still being built) every
+    mode ranks by BM25 alone.
+    """
+    if index is None:
+        _, index, vectors = current_corpus()
+    if index is None:
+        return []
+    if mode == "lexical" or vectors is None:
+        return index.search(query, space, top_k)
+    if mode == "semantic":
+        return vectors.search(query, space, top_k)
+    
+    depth = 2 * top_k
+    lexical = index.search(query, space, depth)
+    semantic = vectors.search(query, space, depth)
+    best = lexical[0][3] if lexical else 1.0
+    scores: Dict[str, float] = {}
+    hits: Dict[str, Tuple[str, str, str, float]] = {}
+    for hit in lexical:
+        scores[hit[0]] = (1.0 - HYBRID_WEIGHT) * hit[3] / best
+        hits[hit[0]] = hit
+    for hit in semantic:
+        scores[hit[0]] = scores.get(hit[0], 0.0) + HYBRID_WEIGHT * hit[3]
+        hits.setdefault(hit[0], hit)
+    
+    ranked = sorted(scores, key=lambda page_id: -scores[page_id])[:top_k]
+    return [(page_id, hits[page_id][1], hits[page_id][2], scores[page_id]) for page_id in ranked]
+
 mcp = FastMCP("confluence-mock")
 
+def _clip(line: str, match: Optional[re.Match], max_chars: int) -> str:
+    if len(line) <= max_chars:
+        return line
+    start = max(0, match.start() - max_chars // 3) if match else 0
+    start = min(start, len(line) - max_chars)
+    clipped = line[start:start + max_chars].strip()
+    return ("…" if start > 0 else "") + clipped + ("…" if start + max_chars < len(line) else "")
+
+def extract_snippet(content: str, query: str, max_chars: int = SNIPPET_CHARS) -> str:
+    """
+    Excerpt the passages of a page that best match a query, with matches in bold.
+    
+    Each non-empty line is a passage, ranked by how many distinct query terms it
+    contains and then by total matches. The best passages are kept, in page
+    order, until ``max_chars`` is used up; a long passage is clipped around its
+    first match. Pages without a match fall back to their opening lines.
+    """
+    terms = set(tokenize(query))
+    pattern = re.compile(
+        r"(?<![a-z0-9])(" + "|".join(sorted(map(re.escape, terms), key=len, reverse=True)) + r")(?![a-z0-9])",
+        re.IGNORECASE
+    ) if terms else None
+    
+    passages = []
+    for position, line in enumerate(content.splitlines()):
+        line = line.replace("**", "").strip().lstrip("#").strip()
+        if not line:
+            continue
+        hits = [token for token in tokenize(line) if token in terms]
+        passages.append((len(set(hits)), len(hits), position, line))
+    
+    ranked = sorted((p for p in passages if p[0]), key=lambda p: (-p[0], -p[1], p[2])) or passages
+    chosen = []
+    remaining = max_chars
+    for passage in ranked:
+        if remaining < 40 and chosen:
+            break
+        line = passage[3]
+        text = _clip(line, pattern.search(line) if pattern else None, remaining)
+        chosen.append((passage[2], text))
+        remaining -= len(text) + 3
+    
+    snippet = " … ".join(text for _, text in sorted(chosen))
+    return pattern.sub(r"**\1**", snippet) if pattern else snippet
+
 @mcp.tool()
-def search_confluence(query: str, space: str = "") -> str:
-    """Search for information in the internal Confluence knowledge base. Returns relevant page excerpts based on the query.
+def search_confluence(
+    query: str,
+    space: str = "",
+    max_results: int = 5,
+    cursor: str = "",
+    max_chars: int = 0,
+    mode: str = ""
+) -> str:
+    """Search for information in the internal Confluence knowledge base. Returns the passages of each page that best match the query, best match first. The snippets are often enough to answer without fetching the full page.
     
     Args:
         query: Search query to find relevant pages
         space: Confluence space to search in (Engineering, Product, HR, Finance). Leave empty to search all spaces.
+        max_results: Maximum number of pages to return
+        cursor: Cursor from a previous call to fetch the next page of results
+        max_chars: Character budget for the whole result (0 uses the server default)
+        mode: 'lexical' for keyword matching, 'semantic' for meaning-based matching that also finds paraphrases, or 'hybrid' for both. Leave empty for the server default.
     """
-    query_lower = query.lower()
+    refresh_corpus()
+    store, index, vectors = current_corpus()
+    if index is None:
+        return (
+            f"The search index for {len(store)} pages is still being built; try again shortly. "
+            "Pages can already be fetched by ID."
+        )
+    if cursor and not cursor.isdigit():
+        return f"Invalid cursor: '{cursor}'"
+    mode = mode or SEARCH_MODE
+    if mode not in SEARCH_MODES:
+        return f"Invalid search mode: '{mode}'. Use one of: {', '.join(SEARCH_MODES)}"
+    offset = int(cursor or 0)
+    max_results = max(1, max_results)
+    budget = max_chars if max_chars > 0 else SEARCH_CHAR_BUDGET
+    snippet_chars = max(120, min(SNIPPET_CHARS, budget // max_results))
+    
+    hits = search_pages(query, space, offset + max_results + 1, mode, index, vectors)[offset:]
     results = []
-    spaces_to_search = [space] if space else MOCK_CONFLUENCE_DATA.keys()
+    used = 0
     
-    for search_space in spaces_to_search:
-        if search_space not in MOCK_CONFLUENCE_DATA:
+    for page_id, search_space, page_title, score in hits[:max_results]:
+        page = store.read(page_id)
+        if page is None:
             continue
-            
-        for page_title, page_data in MOCK_CONFLUENCE_DATA[search_space].items():
-            if query_lower in page_title.lower() or query_lower in page_data["content"].lower():
-                preview = page_data["content"][:200].strip()
-                results.append(
-                    f"**[{search_space}] {page_title}** (ID: {page_data['id']})\n{preview}..."
-                )
+        result = (
+            f"**[{search_space}] {page_title}** (ID: {page_id}, score: {score:.2f})\n"
+            f"{extract_snippet(page[2], query, snippet_chars)}"
+        )
+        if results and used + len(result) > budget:
+            break
+        results.append(result)
+        used += len(result)
     
     if not results:
+        if offset:
+            return f"No more results for query: '{query}'"
         return f"No results found for query: '{query}'"
     
-    return f"Found {len(results)} result(s):\n\n" + "\n\n---\n\n".join(results)
+    next_offset = offset + len(results)
+    output = (
+        f"Results {offset + 1}-{next_offset} for '{query}':\n\n"
+        + "\n\n---\n\n".join(results)
+    )
+    if len(hits) > len(results):
+        output += f"\n\nMore results available: call search_confluence again with cursor='{next_offset}'."
+    
+    return output
 
 @mcp.tool()
 def get_confluence_page(page_id: str) -> str:
@@ -213,25 +1274,89 @@ def get_confluence_page(page_id: str) -> str:
     Args:
         page_id: The unique ID of the Confluence page (e.g., 'eng-001', 'prod-002')
     """
-    for space, pages in MOCK_CONFLUENCE_DATA.items():
-        for page_title, page_data in pages.items():
-            if page_data["id"] == page_id:
-                return f"**[{space}] {page_title}**\n\n{page_data['content']}"
+    refresh_corpus()
+    page = current_corpus()[0].read(page_id)
+    if page:
+        space, page_title, content = page
+        return f"**[{space}] {page_title}**\n\n{content}"
     
     return f"Page not found: {page_id}"
 
+@mcp.tool()
+def get_confluence_pages(page_ids: List[str]) -> str:
+    """Retrieve the full content of several Confluence pages in one call. Prefer this over repeated get_confluence_page calls when you need more than one page.
+    
+    Args:
+        page_ids: Page IDs to fetch (e.g., ['eng-001', 'fin-001']), at most 20
+    """
+    refresh_corpus()
+    store = current_corpus()[0]
+    pages = []
+    missing = []
+    
+    for page_id in list(dict.fromkeys(page_ids))[:MAX_BATCH_PAGES]:
+        page = store.read(page_id)
+        if page:
+            space, page_title, content = page
+            pages.append(f"**[{space}] {page_title}** (ID: {page_id})\n\n{content}")
+        else:
+            missing.append(page_id)
+    
+    result = "\n\n---\n\n".join(pages)
+    if missing:
+        result += ("\n\n" if result else "") + f"Pages not found: {', '.join(missing)}"
+    if len(page_ids) > MAX_BATCH_PAGES:
+        result += f"\n\nOnly the first {MAX_BATCH_PAGES} page IDs were fetched."
+    
+    return result
+
 @mcp.tool()
 def list_confluence_spaces() -> str:
     """List all available Confluence spaces and their descriptions."""
+    refresh_corpus()
     spaces_info = []
-    for space, pages in MOCK_CONFLUENCE_DATA.items():
-        page_count = len(pages)
-        page_titles = ", ".join(list(pages.keys())[:3])
+    for space, page_count, first_titles in current_corpus()[0].space_summary():
+        page_titles = ", ".join(first_titles)
         spaces_info.append(
             f"**{space}** ({page_count} pages)\n  Pages: {page_titles}..."
         )
     
     return "Available Confluence Spaces:\n\n" + "\n\n".join(spaces_info)
 
-if __name__ == "__main__":
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Confluence MCP server")
+    parser.add_argument(
+        "--corpus",
+        default=os.getenv("CONFLUENCE_CORPUS_PATH", ""),
+        help="Packed corpus file to serve instead of the built-in mock pages"
+    )
+    parser.add_argument(
+        "--pack",
+        nargs=2,
+        metavar=("SOURCE", "DEST"),
+        help="Pack a JSONL export or a <Space>/<page_id>.md directory ('mock' for the built-in pages), index it and exit"
+    )
+    parser.add_argument(
+        "--index",
+        metavar="PACK",
+        help="Rebuild the saved search indexes of a packed corpus and exit"
+    )
+    args = parser.parse_args(argv)
+    
+    if args.pack:
+        source, dest = args.pack
+        pages = iter_mock_pages() if source == "mock" else iter_source_pages(source)
+        print(f"Packed and indexed {pack_corpus(pages, dest, index=True)} pages into {dest}")
+        return
+    if args.index:
+        index_pack(args.index)
+        print(f"Indexed {args.index} into {args.index}.index")
+        return
+    
+    if args.corpus:
+        load_corpus(args.corpus)
+    
     mcp.run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+"""
+Streaming export and import of Chainlit threads.
+
+An export is a directory of numbered JSONL parts (gzip by default), each
+holding whole threads as one ``{"table": ..., "row": ...}`` record per line:
+the owning user, the thread, then its steps, elements and feedbacks. Rows
+are streamed through the data layer, so memory use does not depend on the
+size of the database, and a checkpoint after every part lets an interrupted
+export or import pick up where it stopped.
+"""
+import os
+import gzip
+import json
+import asyncio
+import argparse
+from pathlib import Path
+from typing import Any, Dict, IO, Iterator, List, Optional, Set, Tuple
+
+from init_db import DB_PATH, init_database
+from utils.sqlite_data_layer import SQLiteFriendlyDataLayer
+
+EXPORT_THREADS_PER_PART = int(os.getenv("CHAINLIT_EXPORT_THREADS_PER_PART", "500"))
+IMPORT_BATCH_ROWS = 1000
+CHECKPOINT_FILE = "checkpoint.json"
+
+TABLES = ("users", "threads", "steps", "elements", "feedbacks")
+
+def _data_layer(db_path: str, read_only: bool = False) -> SQLiteFriendlyDataLayer:
+    # A read-only source keeps its journal mode: the WAL and tuning pragmas
+    # of the high-concurrency setup would persist in the file.
+    if read_only:
+        return SQLiteFriendlyDataLayer(
+            conninfo=f"sqlite+aiosqlite:///file:{Path(db_path).absolute()}?mode=ro&uri=true",
+            high_concurrency=False,
+        )
+    return SQLiteFriendlyDataLayer(conninfo=f"sqlite+aiosqlite:///{Path(db_path).absolute()}")
+
+def _write_json(path: Path, data: Dict[str, Any]):
+    # Replace atomically so a crash never leaves a torn checkpoint.
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(data, indent=2))
+    os.replace(tmp, path)
+
+def _read_json(path: Path) -> Optional[Dict[str, Any]]:
+    return json.loads(path.read_text()) if path.exists() else None
+
+def _open_part(path: Path, mode: str) -> IO[str]:
+    if path.suffix == ".gz":
+        return gzip.open(path, mode + "t", encoding="utf-8")  # type: ignore
+    return open(path, mode, encoding="utf-8")
+
+def _part_path(out_dir: Path, number: int, compress: bool) -> Path:
+    return out_dir / f"part-{number:05d}.jsonl{'.gz' if compress else ''}"
+
+def _parts(directory: Path) -> List[Path]:
+    return sorted(p for p in directory.glob("part-*.jsonl*") if p.suffix in (".jsonl", ".gz"))
+
+def _thread_filter(filters: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    clauses = ['"id" > :after']
+    params: Dict[str, Any] = {}
+    users = filters.get("users") or []
+    if users:
+        names = [f"user_{i}" for i in range(len(users))]
+        clauses.append(f'"userIdentifier" IN ({", ".join(":" + n for n in names)})')
+        params.update(zip(names, users))
+    if filters.get("since"):
+        clauses.append('"createdAt" >= :since')
+        params["since"] = filters["since"]
+    if filters.get("until"):
+        clauses.append('"createdAt" < :until')
+        params["until"] = filters["until"]
+    return " AND ".join(clauses), params
+
+async def _thread_records(data_layer: SQLiteFriendlyDataLayer, thread: Dict[str, Any]):
+    """Yield ``(table, row)`` for a thread's steps, elements and feedbacks."""
+    thread_id = {"thread_id": thread["id"]}
+    async for row in data_layer.stream_rows(
+        'SELECT * FROM steps WHERE "threadId" = :thread_id ORDER BY "createdAt"', thread_id
+    ):
+        yield "steps", row
+    async for row in data_layer.stream_rows('SELECT * FROM elements WHERE "threadId" = :thread_id', thread_id):
+        yield "elements", row
+    async for row in data_layer.stream_rows(
+        'SELECT f.* FROM feedbacks f JOIN steps s ON f."forId" = s."id" WHERE s."threadId" = :thread_id',
+        thread_id
+    ):
+        yield "feedbacks", row
+
+async def export_threads(
+    db_path: str,
+    out_dir: str,
+    users: Optional[List[str]] = None,
+    since: str = "",
+    until: str = "",
+    threads_per_part: int = EXPORT_THREADS_PER_PART,
+    compress: bool = True
+) -> Dict[str, Any]:
+    """
+    Export threads matching the filters into ``out_dir``, resuming a
+    previous export of the same filters if a checkpoint is present.
+    
+    Args:
+        db_path: Source database
+        out_dir: Directory for the parts and the checkpoint
+        users: Only threads of these user identifiers
+        since: Only threads created at or after this ISO date/time
+        until: Only threads created before this ISO date/time
+        threads_per_part: Threads per output part
+        compress: Write gzip parts
+    
+    Returns:
+        The checkpoint: filters, last exported thread id, part and row counts
+    """
+    directory = Path(out_dir)
+    directory.mkdir(parents=True, exist_ok=True)
+    filters = {"users": sorted(users or []), "since": since, "until": until}
+    checkpoint_path = directory / CHECKPOINT_FILE
+    state = _read_json(checkpoint_path) or {"filters": filters, "after": "", "parts": 0, "threads": 0, "rows": 0}
+    if state["filters"] != filters:
+        raise ValueError(f"{out_dir} holds an export with different filters: {state['filters']}")
+    
+    # A part written after the last checkpoint is incomplete.
+    for path in _parts(directory):
+        if int(path.name.split("-")[1].split(".")[0]) > state["parts"]:
+            path.unlink()
+    
+    where, params = _thread_filter(filters)
+    data_layer = _data_layer(db_path, read_only=True)
+    try:
+        while True:
+            threads = await data_layer.execute_sql(
+                query=f'SELECT * FROM threads WHERE {where} ORDER BY "id" LIMIT :limit',
+                parameters={**params, "after": state["after"], "limit": max(1, threads_per_part)}
+            )
+            if not threads:
+                break
+            
+            part = _part_path(directory, state["parts"] + 1, compress)
+            rows = 0
+            seen_users: Set[str] = set()
+            with _open_part(part, "w") as out:
+                def write(table: str, row: Dict[str, Any]):
+                    out.write(json.dumps({"table": table, "row": row}, ensure_ascii=False) + "\n")
+                
+                for thread in threads:
+                    user_id = thread.get("userId")
+                    if user_id and user_id not in seen_users:
+                        seen_users.add(user_id)
+                        for user in await data_layer.execute_sql(
+                            query='SELECT * FROM users WHERE "id" = :id', parameters={"id": user_id}
+                        ) or []:
+                            write("users", user)
+                            rows += 1
+                    write("threads", thread)
+                    rows += 1
+                    async for table, row in _thread_records(data_layer, thread):
+                        write(table, row)
+                        rows += 1
+            
+            state.update(
+                after=threads[-1]["id"],
+                parts=state["parts"] + 1,
+                threads=state["threads"] + len(threads),
+                rows=state["rows"] + rows
+            )
+            _write_json(checkpoint_path, state)
+            print(f"📦 {part.name}: {len(threads)} threads, {rows} rows")
+    finally:
+        await data_layer.close()
+    return state
+
+def _records(path: Path) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    with _open_part(path, "r") as lines:
+        for line in lines:
+            if line.strip():
+                record = json.loads(line)
+                yield record["table"], record["row"]
+
+async def import_threads(
+    db_path: str,
+    in_dir: str,
+    replace: bool = False,
+    batch_rows: int = IMPORT_BATCH_ROWS
+) -> Dict[str, int]:
+    """
+    Import an export directory into ``db_path``, skipping parts a previous
+    run already imported.
+    
+    Existing rows win unless ``replace`` is set. Users are matched by
+    identifier, and threads of a user that already exists under another id
+    are attached to that user.
+    
+    Returns:
+        Rows imported per table
+    """
+    directory = Path(in_dir)
+    checkpoint_path = directory / f"import-{Path(db_path).stem}.{CHECKPOINT_FILE}"
+    state = _read_json(checkpoint_path) or {"done": []}
+    await init_database(db_path)
+    
+    data_layer = _data_layer(db_path)
+    counts = {table: 0 for table in TABLES}
+    try:
+        columns: Dict[str, List[str]] = {}
+        for table in TABLES:
+            info = await data_layer.execute_sql(query=f"PRAGMA table_info({table})", parameters={})
+            columns[table] = [column["name"] for column in info or []]
+        
+        user_ids: Dict[str, str] = {}
+        pending: Dict[str, List[Dict[str, Any]]] = {table: [] for table in TABLES}
+        
+        async def flush():
+            # Parents first, so a reader never sees steps of a missing thread.
+            for table in TABLES:
+                counts[table] += await data_layer.insert_rows(table, pending[table], replace=replace)
+                pending[table] = []
+        
+        for part in _parts(directory):
+            if part.name in state["done"]:
+                continue
+            buffered = 0
+            for table, row in _records(part):
+                if table not in pending:
+                    continue
+                if table == "users":
+                    existing = await data_layer.execute_sql(
+                        query='SELECT "id" FROM users WHERE "identifier" = :identifier',
+                        parameters={"identifier": row.get("identifier")}
+                    )
+                    if existing and existing[0]["id"] != row["id"]:
+                        user_ids[row["id"]] = existing[0]["id"]
+                        continue
+                elif table == "threads" and row.get("userId") in user_ids:
+                    row["userId"] = user_ids[row["userId"]]
+                
+                pending[table].append({column: row.get(column) for column in columns[table]})
+                buffered += 1
+                if buffered >= batch_rows:
+                    await flush()
+                    buffered = 0
+            await flush()
+            
+            state["done"].append(part.name)
+            _write_json(checkpoint_path, state)
+            print(f"📥 {part.name} imported")
+    finally:
+        await data_layer.close()
+    return counts
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Stream Chainlit threads to and from JSONL")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    export_parser = commands.add_parser("export", help="Export threads to a directory of JSONL parts")
+    export_parser.add_argument("out_dir")
+    export_parser.add_argument("--db", default=DB_PATH, help="Source database")
+    export_parser.add_argument("--user", action="append", default=[], help="Only this user identifier (repeatable)")
+    export_parser.add_argument("--since", default="", help="Only threads created at or after this date (YYYY-MM-DD)")
+    export_parser.add_argument("--until", default="", help="Only threads created before this date (YYYY-MM-DD)")
+    export_parser.add_argument("--threads-per-part", type=int, default=EXPORT_THREADS_PER_PART)
+    export_parser.add_argument("--no-compress", action="store_true", help="Write plain .jsonl parts")
+    
+    import_parser = commands.add_parser("import", help="Import an export directory")
+    import_parser.add_argument("in_dir")
+    import_parser.add_argument("--db", default=DB_PATH, help="Destination database")
+    import_parser.add_argument("--replace", action="store_true", help="Overwrite rows that already exist")
+    args = parser.parse_args(argv)
+    
+    if args.command == "export":
+        state = asyncio.run(export_threads(
+            args.db,
+            args.out_dir,
+            users=args.user,
+            since=args.since,
+            until=args.until,
+            threads_per_part=args.threads_per_part,
+            compress=not args.no_compress
+        ))
+        print(f"✅ Exported {state['threads']} threads ({state['rows']} rows) in {state['parts']} parts")
+    else:
+        counts = asyncio.run(import_threads(args.db, args.in_dir, replace=args.replace))
+        print("✅ Imported " + ", ".join(f"{table}={count}" for table, count in counts.items()))
+
+if __name__ == "__main__":
+    main()
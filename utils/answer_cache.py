@@ -0,0 +1,217 @@
+import os
+import re
+import json
+import time
+import hashlib
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "256"))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.8"))
+CONFLUENCE_CORPUS_PATH = os.getenv("CONFLUENCE_CORPUS_PATH", "")
+
+STOP_WORDS = frozenset(
+    "a an and are as at be can could did do does for from has have how i in is me my of on or our "
+    "please s show tell that the there their to us was we were what whats when where which who will "
+    "with would you your".split()
+)
+# Words that point back into the conversation; a question using them is not
+# answerable on its own.
+REFERRING_WORDS = frozenset(
+    "it its this that these those they them their he she him her above previous earlier "
+    "same again also else instead".split()
+)
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def normalize_question(text: str) -> str:
+    """Lowercased words of a question without punctuation."""
+    text = unicodedata.normalize("NFKC", text).lower().replace("’", "").replace("'", "")
+    return " ".join(_WORD.findall(text))
+
+def content_words(normalized: str) -> FrozenSet[str]:
+    return frozenset(word for word in normalized.split() if word not in STOP_WORDS)
+
+def is_standalone(question: str, has_history: bool) -> bool:
+    """Whether a question can be answered without the conversation before it."""
+    if not has_history:
+        return True
+    words = normalize_question(question).split()
+    return len(words) >= 3 and not REFERRING_WORDS.intersection(words)
+
+def knowledge_version(server_configs: Dict[str, Dict[str, Any]]) -> str:
+    """
+    Fingerprint of what the tools answer from: the MCP server configuration
+    and the size and mtime of the files it serves (server scripts, a
+    ``--corpus`` pack, paths in a server's ``env`` block and
+    CONFLUENCE_CORPUS_PATH).
+    """
+    paths = [CONFLUENCE_CORPUS_PATH] if CONFLUENCE_CORPUS_PATH else []
+    for config in server_configs.values():
+        paths.extend(str(arg) for arg in config.get("args", []))
+        paths.extend(str(value) for value in (config.get("env") or {}).values())
+    
+    digest = hashlib.sha1(json.dumps(server_configs, sort_keys=True, default=str).encode("utf-8"))
+    for path in sorted(set(paths)):
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class CachedAnswer:
+    __slots__ = ("question", "answer", "words", "created", "expires")
+    
+    def __init__(self, question: str, answer: str, words: FrozenSet[str], ttl: float):
+        self.question = question
+        self.answer = answer
+        self.words = words
+        self.created = time.time()
+        self.expires = time.monotonic() + ttl
+
+
+class AnswerCache:
+    """
+    Process-wide LRU cache of final answers to standalone questions.
+    
+    Entries are keyed on the model and the normalized question. A miss falls
+    back to the most similar cached question of an accepted model whose content
+    words (stop words removed) overlap by at least ``similarity`` (Jaccard)
+    and that mentions the same numbers, so "Q3 revenue" never answers "Q4
+    revenue". Every entry belongs to one knowledge version; when the version
+    changes the whole cache is dropped.
+    """
+    
+    def __init__(
+        self,
+        max_entries: int = ANSWER_CACHE_SIZE,
+        ttl: float = ANSWER_CACHE_TTL,
+        similarity: float = ANSWER_CACHE_SIMILARITY
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self.version: Optional[str] = None
+        self._entries: OrderedDict[Tuple[str, str], CachedAnswer] = OrderedDict()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.invalidations = 0
+    
+    def _check_version(self, version: str):
+        if version != self.version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self.version = version
+    
+    def _near(self, models: Sequence[str], words: FrozenSet[str]) -> Tuple[Optional[Tuple[str, str]], float]:
+        if self.similarity <= 0 or not words:
+            return None, 0.0
+        numbers = {word for word in words if any(c.isdigit() for c in word)}
+        best, best_score = None, 0.0
+        now = time.monotonic()
+        for key, entry in self._entries.items():
+            if key[0] not in models or entry.expires <= now:
+                continue
+            if numbers != {word for word in entry.words if any(c.isdigit() for c in word)}:
+                continue
+            score = len(words & entry.words) / len(words | entry.words)
+            if score > best_score:
+                best, best_score = key, score
+        return (best, best_score) if best_score >= self.similarity else (None, 0.0)
+    
+    def get(self, models: Sequence[str], question: str, version: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached answer given by any of ``models``; exact matches are
+        tried in the order of ``models``.
+        
+        Returns:
+            ``answer``, the cached ``question``, the ``model`` that gave it,
+            ``match`` ("exact" or "near"), ``similarity`` and ``age_s``, or
+            None on a miss
+        """
+        self._check_version(version)
+        normalized = normalize_question(question)
+        key: Optional[Tuple[str, str]] = None
+        match, similarity = "exact", 1.0
+        entry = None
+        for model in models:
+            key = (model, normalized)
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires <= time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                break
+        if entry is None:
+            match = "near"
+            key, similarity = self._near(models, content_words(normalized))
+            entry = self._entries.get(key) if key else None
+        if entry is None or key is None:
+            self.misses += 1
+            return None
+        
+        self._entries.move_to_end(key)
+        if match == "exact":
+            self.hits += 1
+        else:
+            self.near_hits += 1
+        return {
+            "answer": entry.answer,
+            "question": entry.question,
+            "model": key[0],
+            "match": match,
+            "similarity": round(similarity, 3),
+            "age_s": round(time.time() - entry.created, 1),
+        }
+    
+    def put(self, model: str, question: str, version: str, answer: str):
+        self._check_version(version)
+        normalized = normalize_question(question)
+        if not normalized or not answer or self.ttl <= 0:
+            return
+        key = (model, normalized)
+        self._entries[key] = CachedAnswer(question, answer, content_words(normalized), self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evicted += 1
+    
+    def invalidate(self):
+        self._entries.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.near_hits) / lookups, 3) if lookups else 0.0,
+            "evicted": self.evicted,
+            "invalidations": self.invalidations,
+            "version": self.version,
+        }
+
+
+ANSWER_CACHE = AnswerCache()
+
+def cached_chunks(answer: str, chunk_chars: int = 200) -> List[str]:
+    """Split a cached answer at whitespace into chunks for streaming."""
+    chunks: List[str] = []
+    current = ""
+    for piece in re.findall(r"\S+\s*|\s+", answer):
+        if current and len(current) + len(piece) > chunk_chars:
+            chunks.append(current)
+            current = ""
+        current += piece
+    if current:
+        chunks.append(current)
+    return chunks
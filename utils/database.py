@@ -3,6 +3,8 @@ from pathlib import Path
 from .sqlite_data_layer import SQLiteFriendlyDataLayer
 
 DB_PATH = os.getenv("CHAINLIT_DB_PATH", "./chatbot.db")
+DB_HIGH_CONCURRENCY = os.getenv("CHAINLIT_DB_HIGH_CONCURRENCY", "true").lower() in ("1", "true", "yes")
+DB_WRITE_BEHIND = os.getenv("CHAINLIT_DB_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
 
 _data_layer_instance = None
 
@@ -16,7 +18,9 @@ def get_data_layer() -> SQLiteFriendlyDataLayer:
         _data_layer_instance = SQLiteFriendlyDataLayer(
             conninfo=conninfo,
             ssl_require=False,
-            show_logger=False
+            show_logger=False,
+            high_concurrency=DB_HIGH_CONCURRENCY,
+            write_behind=DB_WRITE_BEHIND
         )
     
     return _data_layer_instance
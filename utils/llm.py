@@ -1,25 +1,92 @@
 import os
+from typing import Dict, Optional, Tuple
+import httpx
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from pydantic import SecretStr
 
+from utils.llm_scheduler import ScheduledChatModel
+
 load_dotenv()
 
-def get_llm(temperature: float = 0.7, streaming: bool = True):
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+
+
+class ScheduledChatOpenAI(ScheduledChatModel, ChatOpenAI):
+    """ChatOpenAI whose calls are admitted and retried by the LLM scheduler."""
+
+
+_llm_cache: Dict[Tuple[str, float, bool], ChatOpenAI] = {}
+_http_client: Optional[httpx.Client] = None
+_http_async_client: Optional[httpx.AsyncClient] = None
+
+def _get_http_clients() -> Tuple[httpx.Client, httpx.AsyncClient]:
+    global _http_client, _http_async_client
+    
+    if _http_client is None or _http_async_client is None:
+        limits = httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY
+        )
+        timeout = httpx.Timeout(LLM_TIMEOUT, connect=10.0)
+        _http_client = httpx.Client(limits=limits, timeout=timeout)
+        _http_async_client = httpx.AsyncClient(limits=limits, timeout=timeout)
+    
+    return _http_client, _http_async_client
+
+def model_name(model: Optional[str] = None) -> str:
+    """The model ``get_llm`` uses for ``model``, without creating a client."""
+    return model or os.getenv("OPENROUTER_MODEL", "x-ai/grok-4-fast:free")
+
+def get_llm(temperature: float = 0.7, streaming: bool = True, model: Optional[str] = None):
+    """Return the process-wide LLM client for this model and temperature.
+    
+    Clients are cached and share one keep-alive HTTP connection pool, so new
+    chat sessions reuse warm TLS connections instead of opening their own.
+    Calls go through the process-wide scheduler in utils/llm_scheduler.py,
+    which also owns retries, so the OpenAI client's own are turned off.
+    """
     api_key = os.getenv("OPENROUTER_API_KEY")
-    model = os.getenv("OPENROUTER_MODEL", "x-ai/grok-4-fast:free")
+    model = model_name(model)
     
     if not api_key:
         raise ValueError("OPENROUTER_API_KEY not found in environment")
     
-    return ChatOpenAI(
+    key = (model, float(temperature), streaming)
+    if key in _llm_cache:
+        return _llm_cache[key]
+    
+    http_client, http_async_client = _get_http_clients()
+    llm = ScheduledChatOpenAI(
         model=model,
         api_key=SecretStr(api_key),
         base_url="https://openrouter.ai/api/v1",
         temperature=temperature,
         streaming=streaming,
+        stream_usage=True,
+        max_retries=0,
+        http_client=http_client,
+        http_async_client=http_async_client,
         default_headers={
             "HTTP-Referer": "https://github.com/chainlit/chatbot",
             "X-Title": "Chainlit MCP Research Assistant"
         }
     )
+    _llm_cache[key] = llm
+    
+    return llm
+
+async def close_llm_clients():
+    global _http_client, _http_async_client
+    
+    if _http_async_client is not None:
+        await _http_async_client.aclose()
+    if _http_client is not None:
+        _http_client.close()
+    _http_client = None
+    _http_async_client = None
+    _llm_cache.clear()
@@ -0,0 +1,352 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional
+
+from utils.metrics import METRICS, span
+from utils.tokens import message_tokens
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "50"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+QUEUE_UPDATE_INTERVAL = 2.0
+RETRYABLE_STATUS = (408, 409, 429, 500, 502, 503, 504)
+
+# Who the current LLM call is for (fairness key) and where queue updates go.
+llm_user: ContextVar[str] = ContextVar("llm_user", default="anonymous")
+queue_listener: ContextVar[Optional[Callable[[Dict[str, Any]], Awaitable[None]]]] = ContextVar(
+    "queue_listener", default=None
+)
+# Set while ScheduledChatModel._agenerate holds a slot.
+_holding_slot: ContextVar[bool] = ContextVar("holding_slot", default=False)
+
+
+class LLMOverloadedError(RuntimeError):
+    """Raised instead of queueing an LLM call when the queue is full."""
+
+
+class _Waiter:
+    __slots__ = ("user", "tokens", "future", "enqueued")
+    
+    def __init__(self, user: str, tokens: int):
+        self.user = user
+        self.tokens = tokens
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.enqueued = time.monotonic()
+
+
+class LLMScheduler:
+    """
+    Process-wide admission control for outbound LLM calls.
+    
+    At most ``max_concurrency`` calls run at once and, if ``tokens_per_minute``
+    is set, calls are only started while a token bucket of that size per
+    minute can cover their estimated prompt and answer. Callers that cannot
+    start wait in one queue per user, served round robin, so a user with many
+    queued calls cannot starve the others. Past ``max_queue`` waiting calls,
+    new ones fail fast with ``LLMOverloadedError``. A provider rate limit
+    pauses all admissions for its Retry-After.
+    """
+    
+    def __init__(
+        self,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        tokens_per_minute: int = LLM_TOKENS_PER_MINUTE,
+        max_queue: int = LLM_MAX_QUEUE
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.tokens_per_minute = max(0, tokens_per_minute)
+        self.max_queue = max(0, max_queue)
+        self._queues: OrderedDict[str, Deque[_Waiter]] = OrderedDict()
+        self._active = 0
+        self._tokens = float(self.tokens_per_minute)
+        self._refilled = time.monotonic()
+        self._paused_until = 0.0
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+        self._call_seconds = 2.0
+        self._output_tokens = 256.0
+        self.admitted = 0
+        self.queued_calls = 0
+        self.shed = 0
+        self.rate_limited = 0
+    
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+    
+    def estimate_tokens(self, prompt_tokens: int) -> int:
+        """Prompt tokens plus the average answer length seen so far."""
+        return prompt_tokens + round(self._output_tokens)
+    
+    def _bucket_tokens(self) -> float:
+        if self.tokens_per_minute:
+            now = time.monotonic()
+            self._tokens = min(
+                self.tokens_per_minute,
+                self._tokens + (now - self._refilled) * self.tokens_per_minute / 60
+            )
+            self._refilled = now
+        return self._tokens
+    
+    def _ready_in(self, tokens: int) -> float:
+        """Seconds until a call of ``tokens`` may start."""
+        delay = max(0.0, self._paused_until - time.monotonic())
+        if self.tokens_per_minute:
+            missing = min(tokens, self.tokens_per_minute) - self._bucket_tokens()
+            if missing > 0:
+                delay = max(delay, missing * 60 / self.tokens_per_minute)
+        return delay
+    
+    def _admit(self, tokens: int):
+        self._active += 1
+        self.admitted += 1
+        if self.tokens_per_minute:
+            self._tokens -= min(tokens, self.tokens_per_minute)
+    
+    def _schedule_wakeup(self, delay: float):
+        if self._wakeup is not None:
+            if self._wakeup.when() <= asyncio.get_running_loop().time() + delay:
+                return
+            self._wakeup.cancel()
+        self._wakeup = asyncio.get_running_loop().call_later(delay, self._on_wakeup)
+    
+    def _on_wakeup(self):
+        self._wakeup = None
+        self._dispatch()
+    
+    def _dispatch(self):
+        while self._active < self.max_concurrency and self._queues:
+            user, queue = next(iter(self._queues.items()))
+            waiter = queue[0]
+            delay = self._ready_in(waiter.tokens)
+            if delay > 0:
+                self._schedule_wakeup(delay)
+                return
+            queue.popleft()
+            # The user goes to the back of the rotation.
+            del self._queues[user]
+            if queue:
+                self._queues[user] = queue
+            if waiter.future.done():
+                continue
+            self._admit(waiter.tokens)
+            waiter.future.set_result(None)
+    
+    def _remove(self, waiter: _Waiter):
+        queue = self._queues.get(waiter.user)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self._queues[waiter.user]
+    
+    def status(self, waiter: _Waiter) -> Dict[str, Any]:
+        """Queue position of a waiting call and a rough wait estimate."""
+        own = self._queues.get(waiter.user) or deque()
+        index = own.index(waiter) if waiter in own else 0
+        ahead = index
+        before = True
+        for user, queue in self._queues.items():
+            if user == waiter.user:
+                before = False
+                continue
+            # Users ahead in the rotation get one more turn before this call.
+            ahead += min(len(queue), index + (1 if before else 0))
+        rounds = ahead // self.max_concurrency + 1
+        return {
+            "position": ahead + 1,
+            "queued": self.queued,
+            "eta_s": round(self._ready_in(waiter.tokens) + rounds * self._call_seconds, 1),
+        }
+    
+    async def _wait(self, waiter: _Waiter):
+        listener = queue_listener.get()
+        while not waiter.future.done():
+            if listener is not None:
+                try:
+                    await listener(self.status(waiter))
+                except Exception as e:
+                    logger.warning("Queue listener failed: %s", e)
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), QUEUE_UPDATE_INTERVAL)
+            except asyncio.TimeoutError:
+                continue
+    
+    def _release(self, reserved: int, used: Optional[int], output_tokens: Optional[int], started: Optional[float]):
+        self._active -= 1
+        if started is not None:
+            self._call_seconds = 0.8 * self._call_seconds + 0.2 * (time.monotonic() - started)
+        if output_tokens is not None:
+            self._output_tokens = 0.8 * self._output_tokens + 0.2 * output_tokens
+        if self.tokens_per_minute and used is not None:
+            # Settle the reservation against what the call actually used.
+            self._tokens = min(self.tokens_per_minute, self._tokens + min(reserved, self.tokens_per_minute) - used)
+        self._dispatch()
+    
+    @asynccontextmanager
+    async def slot(self, tokens: int) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Hold a call slot for the block. Set ``usage["tokens"]`` and
+        ``usage["output_tokens"]`` on the yielded dict once known.
+        
+        Raises:
+            LLMOverloadedError: if the queue is full
+        """
+        user = llm_user.get()
+        if not self._queues and self._active < self.max_concurrency and self._ready_in(tokens) <= 0:
+            self._admit(tokens)
+        else:
+            if self.queued >= self.max_queue:
+                self.shed += 1
+                METRICS.count("chatbot_llm_shed_total")
+                raise LLMOverloadedError(
+                    f"The assistant is handling too many requests right now ({self.queued} waiting). "
+                    "Please try again in a minute."
+                )
+            waiter = _Waiter(user, tokens)
+            self._queues.setdefault(user, deque()).append(waiter)
+            self.queued_calls += 1
+            self._dispatch()
+            with span("llm.queue"):
+                try:
+                    await self._wait(waiter)
+                except BaseException:
+                    if waiter.future.done() and not waiter.future.cancelled():
+                        self._release(tokens, 0, None, None)
+                    else:
+                        waiter.future.cancel()
+                        self._remove(waiter)
+                    raise
+            listener = queue_listener.get()
+            if listener is not None:
+                try:
+                    await listener({"admitted": True, "waited_s": round(time.monotonic() - waiter.enqueued, 1)})
+                except Exception as e:
+                    logger.warning("Queue listener failed: %s", e)
+        
+        started = time.monotonic()
+        usage: Dict[str, Any] = {}
+        try:
+            yield usage
+        finally:
+            self._release(tokens, usage.get("tokens"), usage.get("output_tokens"), started)
+    
+    def pause(self, seconds: float):
+        """Hold all admissions for ``seconds`` (a provider rate limit)."""
+        self.rate_limited += 1
+        METRICS.count("chatbot_llm_rate_limited_total")
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        logger.warning("LLM provider rate limit, pausing calls for %.1fs", seconds)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self._active,
+            "max_concurrency": self.max_concurrency,
+            "queued": self.queued,
+            "users_waiting": len(self._queues),
+            "admitted": self.admitted,
+            "queued_calls": self.queued_calls,
+            "shed": self.shed,
+            "rate_limited": self.rate_limited,
+            "tokens_available": round(self._bucket_tokens()) if self.tokens_per_minute else None,
+            "paused_s": round(max(0.0, self._paused_until - time.monotonic()), 1),
+        }
+
+
+LLM_SCHEDULER = LLMScheduler()
+
+def retry_delay(error: Exception, attempt: int) -> Optional[float]:
+    """
+    Seconds to wait before retrying a failed LLM call, or None if the error
+    is not transient. Rate limits honor the provider's ``retry-after-ms`` or
+    ``Retry-After`` header (seconds or an HTTP date).
+    """
+    status = getattr(error, "status_code", None)
+    if status is None and type(error).__name__ not in ("APIConnectionError", "APITimeoutError"):
+        return None
+    if status is not None and status not in RETRYABLE_STATUS:
+        return None
+    
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            value = headers["retry-after"]
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        pass
+    return min(30.0, 0.5 * 2 ** attempt)
+
+def _prompt_tokens(messages: List[Any]) -> int:
+    return sum(message_tokens(m) for m in messages)
+
+
+class ScheduledChatModel:
+    """
+    Mixin for a LangChain chat model whose calls go through ``LLM_SCHEDULER``.
+    
+    Transient failures are retried up to ``LLM_MAX_RETRIES`` times outside the
+    slot; a rate limit pauses every caller, not just this one. Streams are
+    only retried if nothing has been emitted yet.
+    """
+    
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            try:
+                async with LLM_SCHEDULER.slot(LLM_SCHEDULER.estimate_tokens(_prompt_tokens(messages))) as usage:
+                    # A streaming model generates through _astream, which
+                    # must not take a second slot.
+                    token = _holding_slot.set(True)
+                    try:
+                        result = await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)  # type: ignore
+                    finally:
+                        _holding_slot.reset(token)
+                    counts = getattr(result.generations[0].message, "usage_metadata", None) if result.generations else None
+                    if counts:
+                        usage.update(tokens=counts.get("total_tokens"), output_tokens=counts.get("output_tokens"))
+                    return result
+            except Exception as e:
+                delay = retry_delay(e, attempt)
+                if delay is None or attempt == LLM_MAX_RETRIES:
+                    raise
+                await self._back_off(e, delay)
+    
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        if _holding_slot.get():
+            async for chunk in super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs):  # type: ignore
+                yield chunk
+            return
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            emitted = False
+            try:
+                async with LLM_SCHEDULER.slot(LLM_SCHEDULER.estimate_tokens(_prompt_tokens(messages))) as usage:
+                    async for chunk in super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs):  # type: ignore
+                        emitted = True
+                        counts = getattr(chunk.message, "usage_metadata", None)
+                        if counts:
+                            usage.update(tokens=counts.get("total_tokens"), output_tokens=counts.get("output_tokens"))
+                        yield chunk
+                    return
+            except Exception as e:
+                delay = retry_delay(e, attempt)
+                if emitted or delay is None or attempt == LLM_MAX_RETRIES:
+                    raise
+                await self._back_off(e, delay)
+    
+    @staticmethod
+    async def _back_off(error: Exception, delay: float):
+        if getattr(error, "status_code", None) == 429:
+            LLM_SCHEDULER.pause(delay)
+        else:
+            await asyncio.sleep(delay)
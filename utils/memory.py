@@ -0,0 +1,191 @@
+import os
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+from utils.tokens import estimate_tokens, message_tokens
+
+logger = logging.getLogger(__name__)
+
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "6000"))
+MEMORY_KEEP_TURNS = int(os.getenv("MEMORY_KEEP_TURNS", "6"))
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+SUMMARIZE_PROMPT = """Update the running summary of a conversation between a user and a research assistant.
+Keep facts the user stated about themselves, questions asked, answers given (with figures and Confluence page IDs) and open follow-ups.
+Write at most {max_words} words. Reply with the updated summary only.
+
+Current summary:
+{summary}
+
+New conversation turns:
+{turns}
+"""
+
+
+class ConversationMemory:
+    """
+    Token-budgeted conversation memory.
+
+    The most recent ``keep_turns`` turns are kept verbatim as long as they fit
+    in ``token_budget``; older turns are folded into a running summary. Token
+    counts are computed once per message, and the summary is only recomputed
+    when turns actually leave the window.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = MEMORY_TOKEN_BUDGET,
+        keep_turns: int = MEMORY_KEEP_TURNS,
+        summary: str = "",
+        summarized_turns: int = 0,
+    ):
+        self.token_budget = token_budget
+        self.keep_turns = max(1, keep_turns)
+        self.summary = summary
+        self.summary_tokens = estimate_tokens(summary)
+        self.summarized_turns = summarized_turns
+        self._turns: List[List[BaseMessage]] = []
+        self._turn_tokens: List[int] = []
+        # Turns outside the window that still have to be summarized, oldest
+        # first (see from_recent_turns).
+        self._unsummarized: List[List[BaseMessage]] = []
+
+    @property
+    def total_tokens(self) -> int:
+        return self.summary_tokens + sum(self._turn_tokens)
+
+    @property
+    def turn_count(self) -> int:
+        return len(self._turns)
+
+    @staticmethod
+    def _make_turn(user_text: str, ai_text: str = "") -> Tuple[List[BaseMessage], int]:
+        turn: List[BaseMessage] = [HumanMessage(content=user_text)]
+        if ai_text:
+            turn.append(AIMessage(content=ai_text))
+        return turn, sum(message_tokens(m) for m in turn)
+    
+    def add_turn(self, user_text: str, ai_text: str = ""):
+        turn, tokens = self._make_turn(user_text, ai_text)
+        self._turns.append(turn)
+        self._turn_tokens.append(tokens)
+
+    def messages(self) -> List[BaseMessage]:
+        history: List[BaseMessage] = []
+        if self.summary:
+            history.append(SystemMessage(content=SUMMARY_PREFIX + self.summary))
+        for turn in self._turns:
+            history.extend(turn)
+        return history
+
+    def needs_compaction(self) -> bool:
+        if self._unsummarized:
+            return True
+        if len(self._turns) <= 1:
+            return False
+        return len(self._turns) > self.keep_turns or self.total_tokens > self.token_budget
+
+    def _evict(self) -> List[List[BaseMessage]]:
+        evicted, self._unsummarized = self._unsummarized, []
+        while self.needs_compaction():
+            evicted.append(self._turns.pop(0))
+            self._turn_tokens.pop(0)
+        return evicted
+
+    async def compact(self, llm) -> bool:
+        """Fold turns that fell out of the window into the summary.
+
+        Returns:
+            True if the summary changed
+        """
+        evicted = self._evict()
+        if not evicted:
+            return False
+
+        # A backlog of unsummarized turns is folded in slices that each fit
+        # the token budget, so no summarization prompt outgrows it.
+        while evicted:
+            count, tokens = 0, 0
+            for turn in evicted:
+                turn_tokens = sum(message_tokens(m) for m in turn)
+                if count and tokens + turn_tokens > self.token_budget:
+                    break
+                count += 1
+                tokens += turn_tokens
+            await self._fold(llm, evicted[:count])
+            evicted = evicted[count:]
+        return True
+
+    async def _fold(self, llm, turns: List[List[BaseMessage]]):
+        transcript = "\n".join(
+            f"{'User' if isinstance(m, HumanMessage) else 'Assistant'}: {m.content}"
+            for turn in turns
+            for m in turn
+        )
+        try:
+            response = await llm.ainvoke(SUMMARIZE_PROMPT.format(
+                max_words=max(50, self.token_budget // 8),
+                summary=self.summary or "(none)",
+                turns=transcript
+            ))
+            summary = str(response.content).strip()
+        except Exception as e:
+            logger.warning("Memory summarization failed, keeping a truncated transcript: %s", e)
+            summary = "\n".join(filter(None, [self.summary, transcript[:1000]]))
+
+        self.summary = summary
+        self.summary_tokens = estimate_tokens(summary)
+        self.summarized_turns += len(turns)
+
+    def to_state(self) -> Dict[str, Any]:
+        return {"summary": self.summary, "summarized_turns": self.summarized_turns}
+
+    @classmethod
+    def from_recent_turns(
+        cls,
+        state: Optional[Dict[str, Any]],
+        total_turns: int,
+        recent_turns: Iterable[Tuple[str, str]],
+    ) -> "ConversationMemory":
+        """Rebuild memory from a persisted summary and the thread's newest turns.
+
+        ``recent_turns`` yields turns newest first and is only consumed until
+        the turns not yet in the summary are read: turns already folded into
+        it are never rebuilt. Unsummarized turns beyond ``keep_turns`` or past
+        ``token_budget`` stay out of the window and are folded into the
+        summary by the next ``compact``.
+        """
+        state = state or {}
+        memory = cls(
+            summary=state.get("summary", ""),
+            summarized_turns=int(state.get("summarized_turns", 0))
+        )
+        pending = max(0, total_turns - memory.summarized_turns)
+        window = min(pending, memory.keep_turns)
+        loaded: List[Tuple[List[BaseMessage], int]] = []
+        older: List[List[BaseMessage]] = []
+        tokens = memory.summary_tokens
+        
+        if pending:
+            for user_text, ai_text in recent_turns:
+                turn, turn_tokens = cls._make_turn(user_text, ai_text)
+                if not older and len(loaded) < window and (
+                    not loaded or tokens + turn_tokens <= memory.token_budget
+                ):
+                    loaded.append((turn, turn_tokens))
+                    tokens += turn_tokens
+                else:
+                    older.append(turn)
+                if len(loaded) + len(older) >= pending:
+                    break
+        
+        for turn, turn_tokens in reversed(loaded):
+            memory._turns.append(turn)
+            memory._turn_tokens.append(turn_tokens)
+        memory._unsummarized = older[::-1]
+        
+        if older:
+            logger.info("Resumed memory with %d unsummarized turns outside the window", len(older))
+        return memory
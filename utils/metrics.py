@@ -0,0 +1,300 @@
+import os
+import json
+import time
+import uuid
+import logging
+from bisect import bisect_left
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+METRICS_TRACE_FILE = os.getenv("METRICS_TRACE_FILE", "")
+METRICS_TRACE_HISTORY = int(os.getenv("METRICS_TRACE_HISTORY", "100"))
+METRICS_ALLOW_REMOTE = os.getenv("METRICS_ALLOW_REMOTE", "false").lower() in ("1", "true", "yes")
+METRICS_TIMINGS_ROLES = {
+    role.strip() for role in os.getenv("METRICS_TIMINGS_ROLES", "admin").split(",") if role.strip()
+}
+
+LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 120000)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Histogram:
+    """Cumulative latency histogram over fixed millisecond buckets."""
+    
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+    
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+    
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the ``q`` quantile."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsRegistry:
+    """Process-wide histograms and counters, keyed by name and labels."""
+    
+    def __init__(self):
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+    
+    @staticmethod
+    def _key(name: str, labels: Dict[str, Any]) -> Tuple[str, Labels]:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+    
+    def observe(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+    
+    def count(self, name: str, value: float = 1, **labels):
+        key = self._key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+    
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "histograms": [
+                {
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": h.count,
+                    "sum_ms": round(h.sum, 3),
+                    "p50_ms": h.quantile(0.5),
+                    "p95_ms": h.quantile(0.95),
+                    "p99_ms": h.quantile(0.99),
+                }
+                for (name, labels), h in sorted(self.histograms.items())
+            ],
+            "counters": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self.counters.items())
+            ],
+        }
+    
+    def render_prometheus(self) -> str:
+        """Text exposition format, scrapeable by Prometheus."""
+        def fmt(labels: Labels, extra: Labels = ()) -> str:
+            pairs = [f'{k}="{_escape(v)}"' for k, v in (*labels, *extra)]
+            return "{" + ",".join(pairs) + "}" if pairs else ""
+        
+        lines: List[str] = []
+        typed = set()
+        for (name, labels), h in sorted(self.histograms.items()):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, count in zip(h.buckets, h.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{fmt(labels, (('le', f'{bound:g}'),))} {cumulative}")
+            lines.append(f"{name}_bucket{fmt(labels, (('le', '+Inf'),))} {h.count}")
+            lines.append(f"{name}_sum{fmt(labels)} {h.sum:.3f}")
+            lines.append(f"{name}_count{fmt(labels)} {h.count}")
+        for (name, labels), value in sorted(self.counters.items()):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{fmt(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+
+
+class Span:
+    """
+    One timed operation in a turn's trace.
+    
+    ``labels`` are low-cardinality and also label the
+    ``chatbot_span_duration_ms`` histogram; ``attrs`` are kept on the trace
+    only. Spans opened with ``with span(...)`` become the parent of spans
+    started inside them, including in tasks spawned from that block.
+    """
+    
+    def __init__(self, name: str, parent: Optional["Span"] = None, attrs: Optional[Dict[str, Any]] = None, **labels):
+        self.name = name
+        self.labels = labels
+        self.attrs: Dict[str, Any] = dict(attrs or {})
+        self.parent = parent
+        self.children: List["Span"] = []
+        self.started = time.perf_counter()
+        self.ended: Optional[float] = None
+        self._token = None
+        # Background tasks inherit the context they were created in; once
+        # that span has finished, their spans are recorded as metrics only.
+        if parent is not None and parent.ended is None:
+            parent.children.append(self)
+    
+    @property
+    def duration_ms(self) -> float:
+        return ((self.ended or time.perf_counter()) - self.started) * 1000
+    
+    def finish(self, **attrs):
+        if self.ended is not None:
+            return
+        self.ended = time.perf_counter()
+        self.attrs.update(attrs)
+        if METRICS_ENABLED:
+            METRICS.observe("chatbot_span_duration_ms", self.duration_ms, span=self.name, **self.labels)
+    
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.finish()
+        if self._token is not None:
+            _current_span.reset(self._token)
+            self._token = None
+    
+    def to_dict(self, origin: Optional[float] = None) -> Dict[str, Any]:
+        origin = self.started if origin is None else origin
+        return {
+            "name": self.name,
+            "start_ms": round((self.started - origin) * 1000, 2),
+            "duration_ms": round(self.duration_ms, 2),
+            **({"labels": self.labels} if self.labels else {}),
+            **({"attrs": self.attrs} if self.attrs else {}),
+            **({"children": [c.to_dict(origin) for c in self.children]} if self.children else {}),
+        }
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+def span(name: str, attrs: Optional[Dict[str, Any]] = None, **labels) -> Span:
+    """Start a child of the current span.
+    
+    Use it as a context manager around a block, or call ``finish()`` on it
+    for operations observed through callbacks.
+    """
+    return Span(name, current_span(), attrs, **labels)
+
+def record_span(name: str, started: float, attrs: Optional[Dict[str, Any]] = None, **labels) -> Span:
+    """Record an already-measured interval that began at ``started`` (perf_counter)."""
+    recorded = Span(name, current_span(), attrs, **labels)
+    recorded.started = started
+    recorded.finish()
+    return recorded
+
+
+_recent_traces: Deque[Dict[str, Any]] = deque(maxlen=max(1, METRICS_TRACE_HISTORY))
+_trace_listeners: List[Callable[[Dict[str, Any]], None]] = []
+
+class Turn(Span):
+    """Root span of one chat turn; exported when it finishes."""
+    
+    def __init__(self, attrs: Optional[Dict[str, Any]] = None):
+        super().__init__("turn", None, {"trace_id": uuid.uuid4().hex, **(attrs or {})})
+    
+    def __exit__(self, exc_type, exc, tb):
+        super().__exit__(exc_type, exc, tb)
+        if METRICS_ENABLED:
+            export_trace(self.to_dict())
+
+def turn(**attrs) -> Turn:
+    return Turn(attrs)
+
+def add_trace_listener(listener: Callable[[Dict[str, Any]], None]):
+    """Call ``listener`` with every finished turn trace."""
+    _trace_listeners.append(listener)
+
+def export_trace(trace: Dict[str, Any]):
+    _recent_traces.append(trace)
+    for listener in _trace_listeners:
+        try:
+            listener(trace)
+        except Exception as e:
+            logger.warning("Trace listener failed: %s", e)
+    if not METRICS_TRACE_FILE:
+        return
+    try:
+        with open(METRICS_TRACE_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(trace, default=str) + "\n")
+    except OSError as e:
+        logger.warning("Could not write trace to %s: %s", METRICS_TRACE_FILE, e)
+
+def recent_traces(limit: int = 20) -> List[Dict[str, Any]]:
+    return list(_recent_traces)[-limit:]
+
+BREAKDOWN_ATTRS = ("ttft_ms", "input_tokens", "output_tokens", "cache", "coalesced", "truncated", "steps", "error")
+
+def format_breakdown(trace: Span, min_ms: float = 1.0) -> str:
+    """Indented markdown timing tree of a turn, for the admin view."""
+    lines = [f"**Turn** {trace.duration_ms:.0f} ms"]
+    
+    def walk(node: Span, depth: int):
+        for child in node.children:
+            if child.duration_ms < min_ms and not (child.children or child.attrs):
+                continue
+            label = " ".join(f"{v}" for v in child.labels.values())
+            extra = ", ".join(
+                f"{k}={v}" for k, v in child.attrs.items() if k in BREAKDOWN_ATTRS and v is not None
+            )
+            lines.append(
+                f"{'  ' * depth}- `{child.name}` {label} — {child.duration_ms:.0f} ms"
+                + (f" ({extra})" if extra else "")
+            )
+            walk(child, depth + 1)
+    
+    walk(trace, 0)
+    return "\n".join(lines)
+
+def register_endpoints(app):
+    """Serve ``/metrics`` (Prometheus text) and ``/metrics/traces`` (recent
+    turn traces as JSON) from the Chainlit server, to local clients only
+    unless METRICS_ALLOW_REMOTE is set."""
+    from fastapi import HTTPException, Request
+    from fastapi.responses import JSONResponse, PlainTextResponse
+    
+    if any(getattr(route, "path", None) == "/metrics" for route in app.router.routes):
+        return
+    
+    def check_local(request: Request):
+        host = request.client.host if request.client else ""
+        if not METRICS_ALLOW_REMOTE and host not in ("127.0.0.1", "::1", "localhost"):
+            raise HTTPException(status_code=403, detail="Metrics are only served to local clients")
+    
+    async def metrics(request: Request):
+        check_local(request)
+        return PlainTextResponse(METRICS.render_prometheus(), media_type="text/plain; version=0.0.4")
+    
+    async def traces(request: Request, limit: int = 20):
+        check_local(request)
+        return JSONResponse({"traces": recent_traces(limit), "summary": METRICS.snapshot()})
+    
+    app.add_api_route("/metrics", metrics, methods=["GET"])
+    app.add_api_route("/metrics/traces", traces, methods=["GET"])
+    # Chainlit serves its UI from a catch-all route; ours must come first.
+    added = app.router.routes[-2:]
+    del app.router.routes[-2:]
+    app.router.routes[0:0] = added
@@ -1,10 +1,46 @@
+import os
 import json
-from typing import Optional, List, Dict, Any, cast
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional, List, Dict, Any, AsyncIterator, Tuple, cast
+from chainlit.context import context
 from chainlit.data.sql_alchemy import SQLAlchemyDataLayer
+from chainlit.data.utils import queue_until_user_message
 from chainlit.types import Pagination, ThreadFilter, ThreadDict
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 
+from utils.metrics import span
+
+logger = logging.getLogger(__name__)
+
+SQLITE_READ_POOL_SIZE = int(os.getenv("CHAINLIT_DB_READ_POOL_SIZE", "4"))
+SQLITE_SYNCHRONOUS = os.getenv("CHAINLIT_DB_SYNCHRONOUS", "NORMAL")
+SQLITE_CACHE_SIZE_KB = int(os.getenv("CHAINLIT_DB_CACHE_SIZE_KB", "65536"))
+SQLITE_MMAP_SIZE = int(os.getenv("CHAINLIT_DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+STEP_FLUSH_INTERVAL = float(os.getenv("CHAINLIT_DB_FLUSH_INTERVAL", "0.5"))
+STEP_FLUSH_BATCH_SIZE = int(os.getenv("CHAINLIT_DB_FLUSH_BATCH_SIZE", "200"))
+
+# Creates the thread a buffered step belongs to if the thread upsert has not
+# landed yet, and fills in its owner if it was created without one.
+THREAD_PLACEHOLDER_SQL = text(
+    'INSERT INTO threads ("id", "createdAt", "metadata", "userId", "userIdentifier") '
+    'VALUES (:id, :createdAt, :metadata, :userId, :userIdentifier) '
+    'ON CONFLICT ("id") DO UPDATE SET '
+    '"userId" = COALESCE(threads."userId", excluded."userId"), '
+    '"userIdentifier" = COALESCE(threads."userIdentifier", excluded."userIdentifier")'
+)
+
+def _set_pragmas(engine: AsyncEngine, pragmas: List[str]):
+    @event.listens_for(engine.sync_engine, "connect")
+    def _on_connect(dbapi_connection, _):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(f"PRAGMA {pragma}")
+        cursor.close()
+
 
 class SQLiteFriendlyDataLayer(SQLAlchemyDataLayer):
     """
@@ -14,24 +50,58 @@ class SQLiteFriendlyDataLayer(SQLAlchemyDataLayer):
     'tags' field, causing sqlite3.InterfaceError since SQLite doesn't support arrays.
     
     Solution: JSON-serialize tags on write, deserialize on read (like metadata field).
+    
+    In high-concurrency mode (the default) the database runs in WAL mode with
+    two engines: ``engine`` holds the single connection all writes are
+    serialized on, and ``read_engine`` is a pool of read-only connections that
+    serve SELECTs without waiting for writes. Run ``init_db.py`` to switch an
+    existing database to WAL and create the indexes these queries rely on.
+    
+    With ``write_behind`` enabled, step writes return immediately: steps are
+    buffered by id, so repeated updates of a streaming step collapse into one
+    row write, and flushed in a single transaction every ``flush_interval``
+    seconds or once ``flush_batch_size`` steps are pending. Reads and deletes
+    flush first, so they always see buffered steps. A crash loses at most the
+    last ``flush_interval`` seconds of steps; CHAINLIT_DB_SYNCHRONOUS decides
+    whether committed batches also survive power loss.
     """
     
-    def __init__(self, conninfo: str, ssl_require: bool = False, show_logger: bool = False):
+    def __init__(
+        self,
+        conninfo: str,
+        ssl_require: bool = False,
+        show_logger: bool = False,
+        high_concurrency: bool = True,
+        read_pool_size: int = SQLITE_READ_POOL_SIZE,
+        write_behind: bool = False,
+        flush_interval: float = STEP_FLUSH_INTERVAL,
+        flush_batch_size: int = STEP_FLUSH_BATCH_SIZE,
+    ):
         self._conninfo = conninfo
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self.flush_batch_size = max(1, flush_batch_size)
+        self._pending_steps: Dict[str, Dict[str, Any]] = {}
+        self._pending_owners: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+        self.failed_steps = 0
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flusher_task: Optional[asyncio.Task] = None
         self.user_thread_limit = 1000
         self.show_logger = show_logger
         self.storage_provider = None
         
+        connect_args = {
+            "timeout": 30,
+            "check_same_thread": False
+        }
         self.engine = create_async_engine(
             self._conninfo,
             pool_size=1,
             max_overflow=0,
             pool_pre_ping=True,
             pool_recycle=3600,
-            connect_args={
-                "timeout": 30,
-                "check_same_thread": False
-            }
+            connect_args=connect_args
         )
         
         self.async_session = sessionmaker(
@@ -39,6 +109,97 @@ class SQLiteFriendlyDataLayer(SQLAlchemyDataLayer):
             expire_on_commit=False,
             class_=AsyncSession
         )  # type: ignore
+        
+        self.read_engine: Optional[AsyncEngine] = None
+        self.read_session = None
+        if not high_concurrency:
+            return
+        
+        tuning = [
+            f"synchronous={SQLITE_SYNCHRONOUS}",
+            f"cache_size=-{SQLITE_CACHE_SIZE_KB}",
+            f"mmap_size={SQLITE_MMAP_SIZE}",
+            "temp_store=MEMORY",
+        ]
+        _set_pragmas(self.engine, ["journal_mode=WAL", *tuning])
+        
+        self.read_engine = create_async_engine(
+            self._conninfo,
+            pool_size=max(1, read_pool_size),
+            max_overflow=0,
+            pool_pre_ping=True,
+            pool_recycle=3600,
+            connect_args=connect_args
+        )
+        _set_pragmas(self.read_engine, ["query_only=ON", *tuning])
+        self.read_session = sessionmaker(
+            self.read_engine,
+            expire_on_commit=False,
+            class_=AsyncSession
+        )  # type: ignore
+    
+    async def execute_sql(self, query: str, parameters: dict):  # type: ignore
+        """Route SELECTs to the read pool; everything else goes to the writer."""
+        if self.read_session is None or not query.lstrip().upper().startswith(("SELECT", "WITH")):
+            return await super().execute_sql(query, parameters)
+        
+        async with self.read_session() as session:
+            try:
+                result = await session.execute(text(query), parameters)
+                return self.clean_result([dict(row._mapping) for row in result.fetchall()])
+            except Exception as e:
+                logger.warning("Read query failed: %s", e)
+                return None
+    
+    async def stream_rows(
+        self,
+        query: str,
+        parameters: Optional[Dict[str, Any]] = None,
+        batch_size: int = 500
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield the rows of a SELECT one at a time from a server-side cursor.
+        
+        Rows are fetched ``batch_size`` at a time on a read connection, so
+        scanning a large table never holds it in memory.
+        """
+        engine = self.read_engine or self.engine
+        async with engine.connect() as conn:
+            result = await conn.stream(
+                text(query), parameters or {}, execution_options={"yield_per": batch_size}
+            )
+            async for row in result:
+                yield dict(row._mapping)
+    
+    async def insert_rows(self, table: str, rows: List[Dict[str, Any]], replace: bool = False) -> int:
+        """
+        Insert raw rows into ``table`` in one transaction on the writer.
+        
+        Rows whose primary key already exists are kept, or overwritten when
+        ``replace`` is set. All rows must have the same keys.
+        
+        Returns:
+            Number of rows written
+        """
+        if not rows:
+            return 0
+        await self.flush()
+        columns = list(rows[0])
+        names = ", ".join(f'"{c}"' for c in columns)
+        values = ", ".join(f":{c}" for c in columns)
+        query = f"INSERT OR {'REPLACE' if replace else 'IGNORE'} INTO {table} ({names}) VALUES ({values})"
+        async with self.engine.begin() as conn:
+            result = await conn.execute(text(query), rows)
+        return result.rowcount
+    
+    async def close(self) -> None:
+        if self._flusher_task is not None:
+            self._flusher_task.cancel()
+            self._flusher_task = None
+        await self.flush()
+        if self.read_engine is not None:
+            await self.read_engine.dispose()
+        await super().close()
     
     async def create_step(self, step_dict):  # type: ignore
         """Override to serialize tags list to JSON string before database insert."""
@@ -46,7 +207,11 @@ class SQLiteFriendlyDataLayer(SQLAlchemyDataLayer):
         if step_dict_copy.get("tags") and isinstance(step_dict_copy["tags"], list):
             step_dict_copy["tags"] = json.dumps(step_dict_copy["tags"])
         
-        await super().create_step(step_dict_copy)  # type: ignore
+        if self.write_behind:
+            await self._buffer_step(step_dict_copy)
+            return
+        with span("db.write", op="create_step"):
+            await super().create_step(step_dict_copy)  # type: ignore
     
     async def update_step(self, step_dict):  # type: ignore
         """Override to serialize tags list to JSON string before database update."""
@@ -54,8 +219,125 @@ class SQLiteFriendlyDataLayer(SQLAlchemyDataLayer):
         if step_dict_copy.get("tags") and isinstance(step_dict_copy["tags"], list):
             step_dict_copy["tags"] = json.dumps(step_dict_copy["tags"])
         
+        if self.write_behind:
+            await self._buffer_step(step_dict_copy)
+            return
+        # The base update_step writes through create_step, which is traced.
         await super().update_step(step_dict_copy)  # type: ignore
     
+    @queue_until_user_message()
+    async def _buffer_step(self, step_dict: Dict[str, Any]):
+        """Merge a step write into the pending batch, as successive upserts would."""
+        pending = self._pending_steps.get(step_dict["id"])
+        if pending is None:
+            self._pending_steps[step_dict["id"]] = step_dict
+        else:
+            # An upsert leaves columns it has no value for untouched, except
+            # metadata and generation, which are always rewritten.
+            for key in ("metadata", "generation"):
+                pending.pop(key, None)
+            pending.update((key, value) for key, value in step_dict.items() if value is not None)
+        if step_dict.get("threadId") and step_dict["threadId"] not in self._pending_owners:
+            self._pending_owners[step_dict["threadId"]] = self._session_owner()
+        
+        if self._flusher_task is None or self._flusher_task.done():
+            self._flusher_task = asyncio.create_task(self._flush_periodically())
+        if len(self._pending_steps) >= self.flush_batch_size and (
+            self._flush_task is None or self._flush_task.done()
+        ):
+            self._flush_task = asyncio.create_task(self.flush())
+    
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning("Step flush failed: %s", e)
+    
+    @staticmethod
+    def _session_owner() -> Tuple[Optional[str], Optional[str]]:
+        """(userId, userIdentifier) of the persisted user of the current session."""
+        try:
+            user = context.session.user
+        except Exception:
+            return None, None
+        return getattr(user, "id", None), getattr(user, "identifier", None)
+    
+    @staticmethod
+    def _step_upsert(step_dict: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        """Build the same upsert SQLAlchemyDataLayer.create_step runs for one step."""
+        step_dict = dict(step_dict)
+        step_dict["showInput"] = (
+            str(step_dict.get("showInput", "")).lower()
+            if "showInput" in step_dict
+            else None
+        )
+        parameters = {
+            key: value
+            for key, value in step_dict.items()
+            if value is not None and not (isinstance(value, dict) and not value)
+        }
+        parameters["metadata"] = json.dumps(step_dict.get("metadata", {}))
+        parameters["generation"] = json.dumps(step_dict.get("generation", {}))
+        columns = ", ".join(f'"{key}"' for key in parameters)
+        values = ", ".join(f":{key}" for key in parameters)
+        updates = ", ".join(f'"{key}" = :{key}' for key in parameters if key != "id")
+        query = f"""
+            INSERT INTO steps ({columns})
+            VALUES ({values})
+            ON CONFLICT (id) DO UPDATE
+            SET {updates};
+        """
+        return query, parameters
+    
+    async def flush(self):
+        """Write all buffered steps in one transaction."""
+        async with self._flush_lock:
+            if not self._pending_steps:
+                return
+            steps, self._pending_steps = list(self._pending_steps.values()), {}
+            owners, self._pending_owners = self._pending_owners, {}
+            
+            # Same-shaped upserts are sent together as one executemany.
+            batches: Dict[str, List[Dict[str, Any]]] = {}
+            for step in steps:
+                query, parameters = self._step_upsert(step)
+                batches.setdefault(query, []).append(parameters)
+            created_at = datetime.now().isoformat() + "Z"
+            threads = {
+                thread_id: {
+                    "id": thread_id,
+                    "createdAt": created_at,
+                    "metadata": "{}",
+                    "userId": owners.get(thread_id, (None, None))[0],
+                    "userIdentifier": owners.get(thread_id, (None, None))[1],
+                }
+                for thread_id in {step["threadId"] for step in steps}
+            }
+            
+            try:
+                with span("db.write", {"steps": len(steps)}, op="flush"):
+                    async with self.async_session() as session:
+                        async with session.begin():
+                            await session.execute(THREAD_PLACEHOLDER_SQL, list(threads.values()))
+                            for query, rows in batches.items():
+                                await session.execute(text(query), rows)
+            except Exception as e:
+                # Fall back to one transaction per step so a bad row only
+                # loses itself.
+                logger.warning("Batched write of %d steps failed, retrying one by one: %s", len(steps), e)
+                for step in steps:
+                    query, parameters = self._step_upsert(step)
+                    try:
+                        async with self.async_session() as session:
+                            async with session.begin():
+                                await session.execute(THREAD_PLACEHOLDER_SQL, threads[step["threadId"]])
+                                await session.execute(text(query), parameters)
+                    except Exception as step_error:
+                        self.failed_steps += 1
+                        logger.error("Dropped step %s of thread %s: %s", step.get("id"), step.get("threadId"), step_error)
+    
     async def update_thread(  # type: ignore
         self,
         thread_id: str,
@@ -71,19 +353,134 @@ class SQLiteFriendlyDataLayer(SQLAlchemyDataLayer):
         
         await super().update_thread(thread_id, name, user_id, metadata, serialized_tags)  # type: ignore
     
+    async def get_step(self, step_id: str):  # type: ignore
+        await self.flush()
+        return await super().get_step(step_id)
+    
+    async def delete_step(self, step_id: str):  # type: ignore
+        await self.flush()
+        await super().delete_step(step_id)
+    
+    async def delete_thread(self, thread_id: str):
+        await self.flush()
+        await super().delete_thread(thread_id)
+    
     async def get_thread(self, thread_id: str) -> Optional[ThreadDict]:
-        """Override to deserialize JSON tags back to list when reading from database."""
-        thread = await super().get_thread(thread_id)
+        """
+        Load a thread with its user and assistant messages only.
+        
+        Chainlit's own ``get_thread`` reads every step of the thread, run and
+        tool steps included, with their inputs and outputs. Resuming a chat
+        only needs the conversation, so run and tool steps (and the elements
+        attached to them) are not loaded and are not shown again when a
+        thread is reopened. The steps query is served by the
+        ``idx_steps_thread_messages`` partial index.
+        """
+        await self.flush()
+        threads = await self.execute_sql(
+            query="""
+                SELECT "id", "createdAt", "name", "userId", "userIdentifier", "tags", "metadata"
+                FROM threads WHERE "id" = :thread_id
+            """,
+            parameters={"thread_id": thread_id}
+        )
+        if not isinstance(threads, list) or not threads:
+            return None
         
-        if thread:
-            thread = self._deserialize_thread_tags(thread)
+        steps = await self.execute_sql(
+            query="""
+                SELECT s.*, f."id" AS feedback_id, f."value" AS feedback_value, f."comment" AS feedback_comment
+                FROM steps s LEFT JOIN feedbacks f ON s."id" = f."forId"
+                WHERE s."threadId" = :thread_id
+                AND s."type" IN ('user_message', 'assistant_message')
+                ORDER BY s."createdAt", s."id"
+            """,
+            parameters={"thread_id": thread_id}
+        )
+        elements = await self.execute_sql(
+            query="""
+                SELECT e.* FROM elements e
+                JOIN steps s ON s."id" = e."forId"
+                WHERE e."threadId" = :thread_id
+                AND s."type" IN ('user_message', 'assistant_message')
+            """,
+            parameters={"thread_id": thread_id}
+        )
         
-        return thread
+        row = threads[0]
+        thread = ThreadDict(
+            id=row["id"],
+            createdAt=row["createdAt"],
+            name=row["name"],
+            userId=row["userId"],
+            userIdentifier=row["userIdentifier"],
+            tags=row["tags"],
+            metadata=row["metadata"],
+            steps=[self._message_step(step) for step in steps or []],
+            elements=[self._message_element(element) for element in elements or []],
+        )
+        return self._deserialize_thread_tags(thread)
+    
+    @staticmethod
+    def _message_step(row: Dict[str, Any]) -> Dict[str, Any]:
+        """A row of the ``get_thread`` steps query as a Chainlit StepDict."""
+        feedback = None
+        if row["feedback_value"] is not None:
+            feedback = {
+                "forId": row["id"],
+                "id": row["feedback_id"],
+                "value": row["feedback_value"],
+                "comment": row["feedback_comment"],
+            }
+        return {
+            "id": row["id"],
+            "name": row["name"],
+            "type": row["type"],
+            "threadId": row["threadId"],
+            "parentId": row["parentId"],
+            "streaming": row["streaming"] or False,
+            "waitForAnswer": row["waitForAnswer"],
+            "isError": row["isError"],
+            "metadata": row["metadata"] if row["metadata"] is not None else {},
+            "tags": row["tags"],
+            "input": row["input"] if row["showInput"] not in (None, "false") else "",
+            "output": row["output"] or "",
+            "createdAt": row["createdAt"],
+            "start": row["start"],
+            "end": row["end"],
+            "generation": row["generation"],
+            "showInput": row["showInput"],
+            "language": row["language"],
+            "feedback": feedback,
+        }
+    
+    @staticmethod
+    def _message_element(row: Dict[str, Any]) -> Dict[str, Any]:
+        """A row of the ``get_thread`` elements query as a Chainlit ElementDict."""
+        return {
+            "id": row["id"],
+            "threadId": row["threadId"],
+            "type": row["type"],
+            "chainlitKey": row["chainlitKey"],
+            "url": row["url"],
+            "objectKey": row["objectKey"],
+            "name": row["name"],
+            "display": row["display"],
+            "size": row["size"],
+            "language": row["language"],
+            "autoPlay": row["autoPlay"],
+            "playerConfig": row["playerConfig"],
+            "page": row["page"],
+            "props": row["props"] or "{}",
+            "forId": row["forId"],
+            "mime": row["mime"],
+        }
     
     async def list_threads(
         self, pagination: Pagination, filters: ThreadFilter
     ) -> Any:
         """Override to deserialize JSON tags in thread lists."""
+        await self.flush()
         result = await super().list_threads(pagination, filters)
         
         if result and hasattr(result, 'data') and result.data:
@@ -0,0 +1,26 @@
+import math
+from typing import Any
+
+CHARS_PER_TOKEN = 4.0
+MESSAGE_OVERHEAD_TOKENS = 4
+
+def estimate_tokens(text: Any) -> int:
+    """Cheap, offline token estimate (~4 characters per token for English).
+    
+    A real tokenizer would need to download its vocabulary, which the
+    air-gapped deployments cannot do, and budgets only need to be approximate.
+    """
+    if not text:
+        return 0
+    if not isinstance(text, str):
+        text = str(text)
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def message_tokens(message: Any) -> int:
+    content = getattr(message, "content", message)
+    if isinstance(content, list):
+        content = "".join(
+            part if isinstance(part, str) else str(part.get("text", ""))
+            for part in content
+        )
+    return estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS